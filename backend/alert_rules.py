@@ -0,0 +1,221 @@
+"""
+Weather Alert Rules Engine
+Table-driven alert thresholds, compiled once and checked for a whole sweep
+"""
+
+import operator
+import os
+import string
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import db
+from ttl_cache import TTLCache
+
+# Edited rules are picked up within this many seconds
+RULES_TTL = float(os.getenv("KISAAN_ALERT_RULES_TTL", "300"))
+
+OPERATORS: Dict[str, Callable] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+}
+CONTAINS = "contains"
+
+# metric name -> how to read it from a WeatherObservation (None when missing,
+# which fails every comparison)
+METRICS: Dict[str, Callable] = {
+    "temperature_c": lambda o: o.temperature_c,
+    "feels_like_c": lambda o: o.feels_like_c,
+    "humidity": lambda o: o.humidity,
+    "wind_kph": lambda o: o.wind_kph,
+    "precip_mm": lambda o: o.precip_mm,
+    "uv_index": lambda o: o.uv_index,
+    "us_epa_index": lambda o: o.us_epa_index,
+    "pm2_5": lambda o: o.pm2_5,
+    "today_max_temp_c": lambda o: o.today.max_temp_c if o.today else None,
+    "today_min_temp_c": lambda o: o.today.min_temp_c if o.today else None,
+    "tomorrow_max_temp_c": lambda o: o.tomorrow.max_temp_c if o.tomorrow else None,
+    "tomorrow_min_temp_c": lambda o: o.tomorrow.min_temp_c if o.tomorrow else None,
+    "tomorrow_maxwind_kph": lambda o: o.tomorrow.maxwind_kph if o.tomorrow else None,
+    "tomorrow_totalprecip_mm": lambda o: o.tomorrow.totalprecip_mm if o.tomorrow else None,
+    # Text metrics, matched with the "contains" operator
+    "condition": lambda o: o.condition,
+    "tomorrow_condition": lambda o: o.tomorrow.condition if o.tomorrow else "",
+}
+
+_RULE_COLUMNS = ("name, metric, operator, threshold, match_text, alert_type, severity, crops, "
+                 "message_en, message_ur, valid_hours")
+
+
+class Template:
+    """
+    Message template checked once when the rules are loaded; rendering is
+    a bound str.format_map call.
+
+    Fields: {city}, {value} (the metric as reported by WeatherAPI) and
+    {condition} (title-cased condition text).
+    """
+
+    FIELDS = frozenset({"city", "value", "condition"})
+
+    __slots__ = ("source", "render")
+
+    def __init__(self, source: str):
+        unknown = {field for _, field, _, _ in string.Formatter().parse(source) if field is not None} - self.FIELDS
+        if unknown:
+            raise ValueError(f"unknown template fields {sorted(unknown)}")
+        self.source = source
+        self.render: Callable[[Dict], str] = source.format_map
+
+
+@dataclass(frozen=True, slots=True)
+class AlertRule:
+    """One row of weather_alert_rules, with its templates compiled."""
+    name: str
+    metric: str
+    operator: str
+    threshold: Optional[float]
+    keywords: Tuple[str, ...]
+    alert_type: str
+    severity: str
+    crops: Tuple[str, ...]
+    message_en: Template
+    message_ur: Template
+    valid_hours: int
+
+    @classmethod
+    def from_row(cls, row) -> "AlertRule":
+        if row["metric"] not in METRICS:
+            raise ValueError(f"unknown metric {row['metric']!r}")
+        if row["operator"] not in OPERATORS and row["operator"] != CONTAINS:
+            raise ValueError(f"unknown operator {row['operator']!r}")
+        if row["operator"] in OPERATORS and row["threshold"] is None:
+            raise ValueError(f"operator {row['operator']!r} needs a threshold")
+        return cls(
+            name=row["name"],
+            metric=row["metric"],
+            operator=row["operator"],
+            threshold=row["threshold"],
+            keywords=tuple(k.strip().lower() for k in (row["match_text"] or "").split(",") if k.strip()),
+            alert_type=row["alert_type"],
+            severity=row["severity"],
+            crops=tuple(c.strip() for c in (row["crops"] or "").split(",") if c.strip()),
+            message_en=Template(row["message_en"]),
+            message_ur=Template(row["message_ur"]),
+            valid_hours=row["valid_hours"],
+        )
+
+
+class RuleSet:
+    """
+    Compiled alert rules, evaluated for a whole batch of observations.
+
+    Rules are checked one observation at a time in priority order; a batch
+    shares the loaded rules and the valid_until timestamps.
+    """
+
+    def __init__(self, rules: Sequence[AlertRule]):
+        self.rules = list(rules)
+
+    def matches(self, observation) -> List[AlertRule]:
+        """
+        Rules that fire for one observation, in rule order.
+
+        Args:
+            observation: WeatherObservation record
+        """
+        fired = []
+        for rule in self.rules:
+            value = METRICS[rule.metric](observation)
+            if rule.operator == CONTAINS:
+                text = (value or "").lower()
+                if any(keyword in text for keyword in rule.keywords):
+                    fired.append(rule)
+            elif value is not None and OPERATORS[rule.operator](value, rule.threshold):
+                fired.append(rule)
+        return fired
+
+    def evaluate(self, batch: Sequence[Tuple[str, object]]) -> List[Dict]:
+        """
+        Alerts for a batch of (region, observation) pairs, in batch order
+        and then rule order, followed by each observation's met-office alerts.
+
+        Returns:
+            Alert dictionaries for update_weather_alerts_in_db
+        """
+        now = datetime.now()
+        valid_until = {hours: (now + timedelta(hours=hours)).isoformat()
+                       for hours in {r.valid_hours for r in self.rules} | {24}}
+
+        alerts = []
+        for region, observation in batch:
+            for rule in self.matches(observation):
+                fields = {
+                    "city": observation.city,
+                    "value": METRICS[rule.metric](observation),
+                    "condition": observation.condition.title(),
+                }
+                alerts.append({
+                    'region': region,
+                    'alert_type': rule.alert_type,
+                    'severity': rule.severity,
+                    'crops': list(rule.crops),
+                    'message_en': rule.message_en.render(fields),
+                    'message_ur': rule.message_ur.render(fields),
+                    'valid_until': valid_until[rule.valid_hours],
+                })
+            # Alerts issued by the met office pass through as they are
+            for alert in observation.alerts:
+                alerts.append({
+                    'region': region,
+                    'alert_type': alert.event or "weather_alert",
+                    'severity': 'high' if alert.severity == "Extreme" else 'medium',
+                    'crops': [],
+                    'message_en': alert.headline or alert.desc or "Weather alert",
+                    'message_ur': alert.desc or "موسم کی الرٹ",
+                    'valid_until': alert.expires or valid_until[24]
+                })
+        return alerts
+
+
+def load_rules(conn) -> RuleSet:
+    """
+    Compile the enabled rows of weather_alert_rules (priority order).
+    Invalid rows are skipped with a warning rather than failing the sweep.
+    """
+    rules = []
+    for row in conn.execute(
+        f"SELECT {_RULE_COLUMNS} FROM weather_alert_rules WHERE enabled = 1 ORDER BY priority, id"
+    ):
+        try:
+            rules.append(AlertRule.from_row(row))
+        except (ValueError, KeyError) as e:
+            print(f"⚠ Skipping weather alert rule {row['name']}: {e}")
+    return RuleSet(rules)
+
+
+_rules_cache = TTLCache("alert_rules", RULES_TTL, max_entries=1)
+
+
+def _load_current() -> RuleSet:
+    with db.reader() as conn:
+        return load_rules(conn)
+
+
+def rules() -> RuleSet:
+    """The current rule set, reloaded from the database every RULES_TTL seconds."""
+    return _rules_cache.get("rules", _load_current)
+
+
+def reload():
+    """Drop the compiled rules so the next sweep reads the table again."""
+    _rules_cache.invalidate("rules")
+
+
+def evaluate(batch: Sequence[Tuple[str, object]]) -> List[Dict]:
+    """Evaluate the current rules over (region, observation) pairs."""
+    return rules().evaluate(batch)
@@ -0,0 +1,206 @@
+"""
+Chat Answer Cache
+Gemini answers keyed on the normalized question, language and injected live context
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+import db
+from write_behind import WriteBehindBuffer
+
+# Answers are reused for this long (0 disables the cache) ...
+ANSWER_CACHE_TTL = float(os.getenv("KISAAN_ANSWER_CACHE_TTL", "3600"))
+# ... up to this many in memory, least recently used evicted first
+ANSWER_CACHE_SIZE = int(os.getenv("KISAAN_ANSWER_CACHE_SIZE", "2048"))
+# KISAAN_ANSWER_CACHE_PERSIST=1 also keeps answers in the answer_cache table,
+# so a restarted (or another) worker starts warm
+ANSWER_CACHE_PERSIST = os.getenv("KISAAN_ANSWER_CACHE_PERSIST", "0") == "1"
+
+# Arabic-script letters typed for their Urdu counterparts (Arabic keyboards,
+# copy-paste from Arabic text), plus Arabic-Indic and Persian digits
+_LETTER_VARIANTS = str.maketrans({
+    "\u064a": "\u06cc",  # Arabic yeh -> Farsi yeh
+    "\u0649": "\u06cc",  # alef maksura -> Farsi yeh
+    "\u0643": "\u06a9",  # Arabic kaf -> keheh
+    "\u0647": "\u06c1",  # Arabic heh -> heh goal
+    "\u0629": "\u06c1",  # teh marbuta -> heh goal
+    "\u06c3": "\u06c1",  # teh marbuta goal -> heh goal
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0671": "\u0627",  # alef wasla -> alef
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06f0 + d): str(d) for d in range(10)},
+})
+# Harakat, superscript alef, Quranic marks and tatweel carry no meaning for matching
+_MARKS = re.compile("[\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Fold a question to the text that decides its answer.
+
+    NFKC (presentation forms and full-width letters), Arabic letter and
+    digit variants to Urdu/ASCII, diacritics and tatweel dropped, case
+    folded, and punctuation or symbols (including ؟ ، ۔) turned into single
+    spaces. "گندم کی قیمت؟" and "گندم  كي قيمت" fold to the same text.
+    """
+    text = unicodedata.normalize("NFKC", question).translate(_LETTER_VARIANTS)
+    text = _MARKS.sub("", text).casefold()
+    folded = []
+    for ch in text:
+        category = unicodedata.category(ch)
+        # Format characters (ZWNJ inside Urdu words) vanish; punctuation,
+        # symbols, separators and controls split words
+        if category != "Cf":
+            folded.append(" " if category[0] in "PSZC" else ch)
+    return _SPACES.sub(" ", "".join(folded)).strip()
+
+
+def cache_key(question: str, language: str, context: Sequence[str]) -> str:
+    """
+    Key for an answer: normalized question, language and a hash of the
+    weather, price and pest context the prompt carries, so a cached answer
+    is only reused while the data it was written from is unchanged.
+    """
+    context_hash = hashlib.sha256("\x1f".join(context).encode("utf-8")).hexdigest()
+    return hashlib.sha256(
+        f"{language}\x1f{normalize_question(question)}\x1f{context_hash}".encode("utf-8")
+    ).hexdigest()
+
+
+class AnswerCache:
+    """
+    In-memory TTL/LRU map of cache_key -> answer, optionally backed by the
+    answer_cache table.
+
+    With persistence on, a memory miss is looked up in SQLite (unexpired
+    rows only) and new answers are written behind the response in batches.
+    Only real Gemini answers are stored; fallback answers never are.
+    """
+
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_SIZE,
+                 persist: bool = ANSWER_CACHE_PERSIST):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persist = persist and ttl > 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (answer, stored_at)
+        self._lock = threading.Lock()
+        self._writer = WriteBehindBuffer(
+            "answer_cache",
+            '''INSERT INTO answer_cache (cache_key, language, question, answer, created_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (cache_key) DO UPDATE SET answer = excluded.answer, created_at = excluded.created_at''',
+        ) if self.persist else None
+        self._stats = {
+            "hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "expired": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached answer for key, or None (checking SQLite on a memory miss when persisting)."""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+                self._stats["expired"] += 1
+        answer = self._load_persisted(key, now) if self.persist else None
+        with self._lock:
+            self._stats["persistent_hits" if answer is not None else "misses"] += 1
+        return answer
+
+    def _load_persisted(self, key: str, now: float) -> Optional[str]:
+        try:
+            with db.reader() as conn:
+                row = conn.execute(
+                    "SELECT answer, (julianday('now') - julianday(created_at)) * 86400 AS age_s "
+                    "FROM answer_cache WHERE cache_key = ?",
+                    (key,),
+                ).fetchone()
+        except Exception as e:
+            print(f"⚠ answer_cache lookup failed: {e}")
+            return None
+        if row is None or row["age_s"] >= self.ttl:
+            return None
+        with self._lock:
+            # Keeps the row's remaining lifetime rather than starting a new one
+            self._put(key, row["answer"], now - max(row["age_s"], 0.0))
+        return row["answer"]
+
+    def _put(self, key: str, answer: str, stored_at: float):
+        # Caller holds self._lock
+        self._entries[key] = (answer, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def put(self, key: str, question: str, language: str, answer: str):
+        """Store a Gemini answer (in memory, and in SQLite when persisting)."""
+        if not self.enabled or not answer:
+            return
+        with self._lock:
+            self._put(key, answer, time.monotonic())
+            self._stats["stores"] += 1
+        if self._writer is not None:
+            self._writer.add((key, language, normalize_question(question), answer, db.utc_timestamp()))
+
+    def prune(self) -> int:
+        """Delete expired answer_cache rows; returns how many were removed."""
+        if not self.persist:
+            return 0
+        with db.writer() as conn:
+            return conn.execute(
+                "DELETE FROM answer_cache WHERE created_at < datetime('now', ?)", (f"-{int(self.ttl)} seconds",)
+            ).rowcount
+
+    def clear(self):
+        """Drop every in-memory answer (counters and stored rows are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        """Write out answers still queued for SQLite."""
+        if self._writer is not None:
+            self._writer.close()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and size for /api/stats."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["persistent_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = (
+            round((snapshot["hits"] + snapshot["persistent_hits"]) / lookups, 4) if lookups else 0.0
+        )
+        snapshot["max_entries"] = self.max_entries
+        snapshot["ttl_s"] = self.ttl
+        snapshot["persist"] = self.persist
+        if self._writer is not None:
+            snapshot["writer"] = self._writer.stats()
+        return snapshot
+
+
+answers = AnswerCache()
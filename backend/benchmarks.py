@@ -0,0 +1,1983 @@
+"""
+Performance Benchmarks for Kisaan Academy Backend
+Each benchmark runs against a throwaway SQLite database.
+
+Usage:
+    python benchmarks.py concurrency [--clients 200]
+    python benchmarks.py price-queries [--rows 500000]
+    python benchmarks.py search [--docs 100000]
+    python benchmarks.py startup [--workers 8]
+    python benchmarks.py ingest [--rows 50000]
+    python benchmarks.py price-history [--years 3]
+    python benchmarks.py chat-history [--messages 5000]
+    python benchmarks.py market-fetch [--latency-ms 150]
+    python benchmarks.py weather-sweep [--locations 120]
+    python benchmarks.py weather-cache [--users 1000]
+    python benchmarks.py refresh-jobs [--workers 3]
+    python benchmarks.py upstream-outage [--lookups 30]
+    python benchmarks.py replay [--requests 600]
+    python benchmarks.py alert-rules [--locations 500]
+    python benchmarks.py weather-batch [--locations 300]
+    python benchmarks.py gazetteer [--points 100000]
+    python benchmarks.py chat-stream [--requests 60]
+    python benchmarks.py gemini-async [--chats 200]
+    python benchmarks.py answer-cache [--chats 600]
+    python benchmarks.py intents [--messages 20000]
+    python benchmarks.py context-deadline [--deadline-ms 1500]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+# Benchmarks never touch the real database
+_TMP_DIR = tempfile.mkdtemp(prefix="kisaan-bench-")
+os.environ["KISAAN_DB_PATH"] = os.path.join(_TMP_DIR, "bench.db")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _print_latencies(label: str, latencies: Dict[str, List[float]]):
+    print(f"  {label}")
+    for name, values in latencies.items():
+        if not values:
+            continue
+        print(f"    {name:<28} n={len(values):<5} p50={_percentile(values, 50):8.2f} ms  "
+              f"p99={_percentile(values, 99):8.2f} ms  max={max(values):8.2f} ms")
+
+
+# ---------------------------------------------------------------------------
+# concurrency: blocking sqlite3 on the event loop vs. thread-pool offload
+# ---------------------------------------------------------------------------
+
+def _seed_price_history(rows: int):
+    import db
+    from crops import crop_key
+    crops = ["گندم", "چاول", "کپاس", "چینی", "مکئی"]
+    regions = ["Punjab", "Sindh", "KPK", "Balochistan"]
+    batch = []
+    for i in range(rows):
+        crop = random.choice(crops)
+        recorded_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - i * 60))
+        batch.append((crop, crop_key(crop), random.choice(regions), random.uniform(3000, 9000), f"Bench Mandi {i}", recorded_at))
+    with db.writer() as conn:
+        conn.executemany(
+            "INSERT INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name, recorded_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+
+
+def _hold_write_lock(database: str, stop: threading.Event, hold_ms: float, every_ms: float):
+    """Simulate another worker's ingestion job that periodically owns the write lock."""
+    import sqlite3
+    conn = sqlite3.connect(database, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    while not stop.is_set():
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(hold_ms / 1000)
+        conn.execute("COMMIT")
+        time.sleep(every_ms / 1000)
+    conn.close()
+
+
+def _start_server(port: int, env: Dict[str, str]):
+    import subprocess
+    import urllib.request
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--timeout-keep-alive", "300"],
+        cwd=backend_dir, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("uvicorn did not start")
+
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _run_clients(base_url: str, clients: int, requests_per_client: int, with_scan: bool) -> Dict:
+    import httpx
+
+    latencies: Dict[str, List[float]] = {
+        "GET /api/wiki": [],
+        "GET /api/market-prices (scan)": [],
+        "POST /api/users": [],
+    }
+
+    async def client(client_id: int, http: "httpx.AsyncClient"):
+        for i in range(requests_per_client):
+            kind = (client_id + i) % 3
+            if kind == 1 and not with_scan:
+                kind = 0
+            started = time.perf_counter()
+            if kind == 0:
+                response = await http.get("/api/wiki?language=en")
+                name = "GET /api/wiki"
+            elif kind == 1:
+                response = await http.get("/api/market-prices", params={"crop_name": "ندم"})
+                name = "GET /api/market-prices (scan)"
+            else:
+                response = await http.post("/api/users", json={"name": f"bench-{client_id}-{i}"})
+                name = "POST /api/users"
+            response.raise_for_status()
+            latencies[name].append((time.perf_counter() - started) * 1000)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(c, http) for c in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    total = clients * requests_per_client
+    return {"elapsed_s": elapsed, "throughput_rps": total / elapsed, "latencies": latencies}
+
+
+def bench_concurrency(args):
+    """
+    Compare parallel clients against a uvicorn server running DB work inline
+    on the event loop (the old behaviour) and one using the async layer.
+    """
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        print("This benchmark needs httpx: pip install httpx")
+        sys.exit(1)
+
+    import db
+    import main
+
+    main.init_db()
+    _seed_price_history(args.rows)
+    db.shutdown()
+    print(f"Seeded {args.rows} market_prices rows; {args.clients} clients x {args.requests} requests; "
+          f"another writer holds the lock {args.write_hold_ms:.0f} ms every {args.write_every_ms:.0f} ms\n")
+
+    results = {}
+    for label, offload in (("before: inline sqlite3 on event loop", "0"), ("after: async data-access layer", "1")):
+        port = _free_port()
+        server = _start_server(port, {"KISAAN_DB_PATH": db.DATABASE, "KISAAN_DB_OFFLOAD": offload})
+        stop = threading.Event()
+        lock_holder = threading.Thread(
+            target=_hold_write_lock, args=(db.DATABASE, stop, args.write_hold_ms, args.write_every_ms), daemon=True
+        )
+        lock_holder.start()
+        try:
+            results[label] = asyncio.run(
+                _run_clients(f"http://127.0.0.1:{port}", args.clients, args.requests, args.with_scan)
+            )
+        finally:
+            stop.set()
+            lock_holder.join()
+            server.terminate()
+            server.wait()
+
+    for label, result in results.items():
+        print(f"{label}: {result['throughput_rps']:.1f} req/s ({result['elapsed_s']:.2f} s)")
+        _print_latencies("latency per endpoint:", result["latencies"])
+        print()
+
+    before, after = list(results.values())
+    wiki_before = _percentile(before["latencies"]["GET /api/wiki"], 99)
+    wiki_after = _percentile(after["latencies"]["GET /api/wiki"], 99)
+    print(f"Throughput: {after['throughput_rps'] / before['throughput_rps']:.2f}x, "
+          f"/api/wiki p99: {wiki_before:.1f} ms -> {wiki_after:.1f} ms")
+
+
+# ---------------------------------------------------------------------------
+# price-queries: every market_prices lookup must be served by an index
+# ---------------------------------------------------------------------------
+
+def _price_queries():
+    """(label, sql, params) for each market price lookup the app issues."""
+    import rollups
+    from main import market_prices_query
+    queries = [
+        ("/api/market-prices", *market_prices_query(None, None)),
+        ("/api/market-prices?region=", *market_prices_query(None, "Punjab")),
+        ("/api/market-prices?crop_name=", *market_prices_query("گندم", None)),
+        ("/api/market-prices?crop_name=&region=", *market_prices_query("wheat", "Punjab")),
+        ("/api/market-prices/forecast", *rollups.history_query("wheat", None, "day", 30)),
+        ("/api/market-prices/forecast?region=", *rollups.history_query("wheat", "Sindh", "day", 30)),
+        ("chat: latest price for crop",
+         "SELECT crop_name, price_per_kg, region, recorded_at FROM market_prices "
+         "WHERE crop_key = ? ORDER BY recorded_at DESC LIMIT 1", ["wheat"]),
+        ("chat: latest prices",
+         "SELECT crop_name, price_per_kg, region, recorded_at FROM market_prices "
+         "ORDER BY recorded_at DESC LIMIT 5", []),
+    ]
+    return queries
+
+
+def bench_price_queries(args):
+    """
+    Seed a large price history, check that EXPLAIN QUERY PLAN shows an index
+    for every price lookup (no full table scan, no sort step), and time each
+    query. tests/test_price_queries.py asserts the exact index per query.
+    """
+    import db
+    import main
+    import rollups
+
+    main.init_db()
+    _seed_price_history(args.rows)
+    print(f"Seeded {args.rows} market_prices rows\n")
+
+    failures = []
+    with db.reader() as conn:
+        for label, sql, params in _price_queries():
+            plan = [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            uses_index = any(" USING " in step and ("INDEX" in step or "PRIMARY KEY" in step)
+                             for step in plan if "market_price" in step)
+            full_scan = any(step.startswith("SCAN market_price") and " USING " not in step for step in plan)
+            # Crop-wide history combines its (at most 30) buckets across regions in temp b-trees
+            combines = any(table in sql for table, *_ in rollups.INTERVALS.values())
+            sorts = not combines and any("TEMP B-TREE" in step for step in plan)
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                conn.execute(sql, params).fetchall()
+            per_query_ms = (time.perf_counter() - started) * 1000 / args.repeat
+
+            status = "ok" if uses_index and not full_scan and not sorts else ("SORT" if sorts else "FULL SCAN")
+            if status != "ok":
+                failures.append(label)
+            print(f"  [{status}] {label:<42} {per_query_ms:8.3f} ms   {' | '.join(plan)}")
+
+    db.shutdown()
+    assert not failures, f"Queries not fully served by an index: {failures}"
+    print("\nAll price queries are index-backed")
+
+
+# ---------------------------------------------------------------------------
+# search: FTS5 query latency on a large bilingual corpus
+# ---------------------------------------------------------------------------
+
+_WORDS_EN = ("wheat rice cotton maize sugarcane irrigation drip canal tubewell soil compost manure "
+             "fertilizer urea nitrogen phosphorus potash seed variety sowing harvest yield pest aphid "
+             "whitefly bollworm fungus rust blight weed herbicide spray rotation mulching tillage "
+             "groundwater rainfall heat frost organic biochar residue livestock fodder market mandi").split()
+_WORDS_UR = ("گندم چاول کپاس مکئی گنا آبپاشی ڈرپ نہر ٹیوب ویل مٹی کمپوسٹ گوبر کھاد یوریا نائٹروجن "
+             "فاسفورس بیج قسم کاشت کٹائی پیداوار کیڑا سفید مکھی سنڈی پھپھوندی جڑی بوٹی سپرے "
+             "زیر زمین پانی بارش گرمی کورا نامیاتی فضلہ مویشی چارہ منڈی").split()
+
+
+def bench_search(args):
+    """
+    Index a synthetic bilingual corpus through the wiki_articles triggers and
+    time BM25-ranked /api/search queries against it.
+    """
+    import db
+    import main
+    import search
+
+    main.init_db()
+    rng = random.Random(42)
+    # Zipf-distributed filler vocabulary with domain terms mixed in, so term
+    # frequencies look like real text instead of every word in every document
+    filler = [f"w{i}" for i in range(50_000)]
+    filler_weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(filler))))
+
+    def text(domain_words, n, domain_share=0.1):
+        n_domain = max(1, int(n * domain_share))
+        words = rng.choices(filler, cum_weights=filler_weights, k=n - n_domain)
+        words += rng.choices(domain_words, k=n_domain)
+        rng.shuffle(words)
+        return " ".join(words)
+
+    started = time.perf_counter()
+    batch = [
+        (f"{text(_WORDS_UR, 4, 0.25)} {i}", f"{text(_WORDS_EN, 4, 0.25)} {i}",
+         text(_WORDS_UR, 80), text(_WORDS_EN, 80), "sustainable_practices", text(_WORDS_UR, 3, 1.0), None)
+        for i in range(args.docs)
+    ]
+    with db.writer() as conn:
+        conn.executemany(
+            "INSERT INTO wiki_articles (title_ur, title_en, content_ur, content_en, category, tags, wiki_url) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+        conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    print(f"Indexed {args.docs} documents via triggers in {time.perf_counter() - started:.1f} s\n")
+
+    queries = [
+        ("common English term", "wheat", "en"),
+        ("two English terms", "drip irrigation", "en"),
+        ("rare English pair", "biochar frost", "en"),
+        ("prefix (typing)", "ferti", "en"),
+        ("Urdu term", "کھاد", "ur"),
+        ("two Urdu terms", "سفید مکھی", "ur"),
+        ("no match", "tractorless", "en"),
+    ]
+    with db.reader() as conn:
+        for label, q, language in queries:
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                results = search.search(conn, q, language, limit=20)
+                timings.append((time.perf_counter() - t0) * 1000)
+            print(f"  {label:<22} q={q!r:<20} hits={len(results):<3} "
+                  f"p50={_percentile(timings, 50):7.2f} ms  p99={_percentile(timings, 99):7.2f} ms")
+    db.shutdown()
+
+
+_WORKER_STARTUP = """
+import time
+import migrations
+started = time.perf_counter()
+applied = migrations.migrate()
+print(applied, (time.perf_counter() - started) * 1000)
+"""
+
+
+def _start_workers(workers: int, database: str) -> List[tuple]:
+    env = dict(os.environ, KISAAN_DB_PATH=database)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    procs = [
+        subprocess.Popen([sys.executable, "-c", _WORKER_STARTUP], cwd=backend_dir, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    results = []
+    for proc in procs:
+        out, _ = proc.communicate()
+        applied, ms = out.strip().splitlines()[-1].split()
+        results.append((int(applied), float(ms)))
+    return results
+
+
+def bench_startup(args):
+    """
+    Worker cold start: first-boot migration, the already-migrated version
+    check, and N workers racing to start against the same database.
+    """
+    import db
+    import migrations
+
+    started = time.perf_counter()
+    applied = migrations.migrate()
+    print(f"First boot: applied {applied} migrations in {(time.perf_counter() - started) * 1000:.1f} ms\n")
+
+    timings = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        migrations.migrate()
+        timings.append((time.perf_counter() - t0) * 1_000_000)
+    print(f"  Version check, pooled connection   p50={_percentile(timings, 50):8.1f} us  "
+          f"p99={_percentile(timings, 99):8.1f} us")
+
+    timings = []
+    for _ in range(min(args.repeat, 200)):
+        db.pool.close()  # force a fresh connection, as in a newly started worker
+        t0 = time.perf_counter()
+        migrations.migrate()
+        timings.append((time.perf_counter() - t0) * 1_000_000)
+    print(f"  Version check, new connection      p50={_percentile(timings, 50):8.1f} us  "
+          f"p99={_percentile(timings, 99):8.1f} us\n")
+    db.shutdown()
+
+    for label, database in (("fresh database", os.path.join(_TMP_DIR, "race.db")),
+                            ("migrated database", db.DATABASE)):
+        results = _start_workers(args.workers, database)
+        migrators = sum(1 for applied, _ in results if applied)
+        times = [ms for _, ms in results]
+        print(f"  {args.workers} workers, {label:<18} migrators={migrators}  "
+              f"migrate() p50={_percentile(times, 50):7.1f} ms  max={max(times):7.1f} ms")
+
+
+
+# ---------------------------------------------------------------------------
+# ingest: set-based market price upserts
+# ---------------------------------------------------------------------------
+
+def _mandi_rows(rows: int, price_offset: float = 0.0) -> List[Dict]:
+    crops = ["گندم", "چاول", "کپاس", "چینی", "مکئی", "Soybeans", "Palm Oil", "Sunflower Oil"]
+    regions = ["Punjab", "Sindh", "KPK", "Balochistan", "Gilgit-Baltistan"]
+    return [
+        {
+            "crop_name": crops[i % len(crops)],
+            "region": regions[(i // len(crops)) % len(regions)],
+            "mandi_name": f"Mandi {i // (len(crops) * len(regions))}",
+            "price_per_kg": 100 + (i % 97) + price_offset,
+        }
+        for i in range(rows)
+    ]
+
+
+def _ingest_per_row(rows: List[Dict]):
+    """The previous approach: a 24h dedup probe and a single INSERT per record."""
+    import db
+    from crops import crop_key
+    with db.writer() as conn:
+        for row in rows:
+            key = crop_key(row["crop_name"])
+            found = conn.execute('''
+                SELECT id FROM market_prices
+                WHERE crop_key = ? AND region = ? AND mandi_name = ?
+                AND recorded_at > datetime('now', '-1 day') LIMIT 1
+            ''', (key, row["region"], row["mandi_name"])).fetchone()
+            if not found:
+                conn.execute(
+                    "INSERT INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name, recorded_at) "
+                    "VALUES (?, ?, ?, ?, ?, datetime('now', '-2 days'))",
+                    (row["crop_name"], key, row["region"], row["price_per_kg"], row["mandi_name"]),
+                )
+
+
+def bench_ingest(args):
+    """
+    Ingest mandi price batches through update_market_prices_in_db: a fresh
+    day (all inserts), a re-run with new prices (all updates) and an
+    identical re-run (all skipped).
+    """
+    import db
+    import main
+    from market_integration import update_market_prices_in_db
+
+    main.init_db()
+
+    started = time.perf_counter()
+    _ingest_per_row(_mandi_rows(args.rows))
+    elapsed = time.perf_counter() - started
+    print(f"  {'before: per-row probe + INSERT':<34} {args.rows / elapsed:10,.0f} rows/s")
+
+    for label, offset in (("upsert, new day (inserts)", 0.0),
+                          ("upsert, changed prices", 1.5),
+                          ("upsert, unchanged prices", 1.5)):
+        batch = _mandi_rows(args.rows, offset)
+        started = time.perf_counter()
+        counts = update_market_prices_in_db(batch)
+        elapsed = time.perf_counter() - started
+        print(f"  {label:<34} {args.rows / elapsed:10,.0f} rows/s   {counts}")
+    db.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# price-history: raw GROUP BY vs. rollup tables
+# ---------------------------------------------------------------------------
+
+def bench_price_history(args):
+    """
+    Seed years of hourly mandi prices (rollups maintained by the triggers)
+    and compare a year of daily history computed from raw rows with the
+    same history read from market_price_daily.
+    """
+    import db
+    import main
+    import rollups
+    from crops import crop_key
+
+    main.init_db()
+    crops = ["گندم", "چاول", "کپاس", "چینی", "مکئی"]
+    regions = ["Punjab", "Sindh", "KPK", "Balochistan"]
+    hours = args.years * 365 * 24
+    started = time.perf_counter()
+    with db.writer() as conn:
+        for crop in crops:
+            # One report per mandi per day: mandi N reports at hour N
+            conn.executemany(
+                "INSERT INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, datetime('now', ?))",
+                ((crop, crop_key(crop), region, 100 + (h % 500) / 10, f"Mandi {h % 24}", f"-{h} hours")
+                 for region in regions for h in range(hours)),
+            )
+    rows = hours * len(crops) * len(regions)
+    print(f"Seeded {rows:,} raw rows through the rollup triggers in {time.perf_counter() - started:.1f} s\n")
+
+    raw_region = '''
+        SELECT date(recorded_at) AS day, min(price_per_kg), max(price_per_kg), avg(price_per_kg), count(*)
+        FROM market_prices WHERE crop_key = ? AND region = ?
+        GROUP BY day ORDER BY day DESC LIMIT 365
+    '''
+    raw_crop = '''
+        SELECT date(recorded_at) AS day, min(price_per_kg), max(price_per_kg), avg(price_per_kg), count(*)
+        FROM market_prices WHERE crop_key = ?
+        GROUP BY day ORDER BY day DESC LIMIT 365
+    '''
+    cases = [
+        ("1y daily, crop+region", lambda c: c.execute(raw_region, ("wheat", "Punjab")).fetchall(),
+         lambda c: rollups.history(c, "wheat", "Punjab", "day", 365)),
+        ("1y daily, crop (all regions)", lambda c: c.execute(raw_crop, ("wheat",)).fetchall(),
+         lambda c: rollups.history(c, "wheat", None, "day", 365)),
+        ("forecast input (30 days)", lambda c: c.execute(raw_region.replace("365", "30"), ("wheat", "Punjab")).fetchall(),
+         lambda c: rollups.history(c, "wheat", "Punjab", "day", 30)),
+    ]
+    with db.reader() as conn:
+        for label, raw, rolled in cases:
+            results = {}
+            for name, fn in (("raw", raw), ("rollup", rolled)):
+                timings = []
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    fn(conn)
+                    timings.append((time.perf_counter() - t0) * 1000)
+                results[name] = _percentile(timings, 50)
+            print(f"  {label:<30} raw p50={results['raw']:8.2f} ms   rollup p50={results['rollup']:7.2f} ms")
+    db.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# chat-history: synchronous insert vs. write-behind buffer
+# ---------------------------------------------------------------------------
+
+def bench_chat_history(args):
+    """
+    Time what persisting one chat_history row adds to a /api/chat response:
+    an awaited INSERT + commit per message versus queueing it on the
+    write-behind buffer.
+    """
+    import db
+    import main
+
+    main.init_db()
+    sql = "INSERT INTO chat_history (user_id, question, answer, language, created_at) VALUES (?, ?, ?, ?, ?)"
+    row = (1, "گندم کی قیمت کیا ہے؟", "گندم کی موجودہ قیمت 4500 روپے فی من ہے۔" * 5, "ur")
+
+    async def synchronous():
+        timings = []
+        for _ in range(args.messages):
+            t0 = time.perf_counter()
+            await db.execute(sql, row + (db.utc_timestamp(),))
+            timings.append((time.perf_counter() - t0) * 1000)
+        return timings
+
+    def write_behind():
+        timings = []
+        for _ in range(args.messages):
+            t0 = time.perf_counter()
+            main.chat_writer.add(row + (db.utc_timestamp(),))
+            timings.append((time.perf_counter() - t0) * 1000)
+        return timings
+
+    _print_latencies(f"{args.messages} messages", {
+        "before: INSERT per response": asyncio.run(synchronous()),
+        "after: write-behind add()": write_behind(),
+    })
+    started = time.perf_counter()
+    main.chat_writer.close()
+    print(f"\n  Drained on shutdown in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(f"  {main.chat_writer.stats()}")
+    db.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# market-fetch: sequential fresh connections vs. pooled concurrent fetch
+# ---------------------------------------------------------------------------
+
+def _start_stub_server(respond: Callable, handshake_ms: float = 0.0):
+    """
+    Local HTTP/1.1 keep-alive server standing in for an external API.
+
+    respond(path) returns (delay_s, status, payload); the handler sleeps
+    delay_s and answers with payload as JSON. POSTs call respond(path,
+    body) with the decoded JSON body. Each new connection sleeps
+    handshake_ms first to model a TLS handshake.
+
+    Returns:
+        (server, counters) where counters tracks connections and requests
+    """
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    counters = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counters["connections"] += 1
+            time.sleep(handshake_ms / 1000)
+
+        def do_GET(self):
+            with lock:
+                counters["requests"] += 1
+            self._answer(*respond(self.path))
+
+        def do_POST(self):
+            with lock:
+                counters["requests"] += 1
+            length = int(self.headers.get("Content-Length") or 0)
+            self._answer(*respond(self.path, json.loads(self.rfile.read(length) or b"null")))
+
+        def _answer(self, delay, status, payload):
+            time.sleep(delay)
+            body = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # client gave up (deadline) before the response
+
+        def log_message(self, *args):
+            pass
+
+    # The default listen backlog (5) drops SYNs under a concurrent fan-out
+    ThreadingHTTPServer.request_queue_size = 256
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counters
+
+
+def _start_commodity_stub(latency_ms: float, slow_ms: float, handshake_ms: float, flaky: set):
+    """
+    Stub RapidAPI commodity endpoint: each request sleeps latency_ms ("wheat"
+    sleeps slow_ms), and every other request for a commodity in `flaky`
+    answers 503 (so a client that retries once always recovers).
+    """
+    seen = {}
+    lock = threading.Lock()
+
+    def respond(path):
+        name = path.rsplit("/", 1)[-1]
+        with lock:
+            seen[name] = seen.get(name, 0) + 1
+            fail = name in flaky and seen[name] % 2 == 1
+        delay = (slow_ms if name == "wheat" else latency_ms) / 1000
+        return delay, 503 if fail else 200, {"name": name, "price": round(random.uniform(50, 500), 2), "unit": "kg"}
+
+    return _start_stub_server(respond, handshake_ms)
+
+
+def _fetch_sequential_fresh(base_url: str, names: List[str]) -> List[Dict]:
+    # The previous implementation: one new connection per commodity, in turn
+    import http.client
+    import json
+    from urllib.parse import urlsplit
+
+    host = urlsplit(base_url).netloc
+    results = []
+    for name in names:
+        conn = http.client.HTTPConnection(host, timeout=10)
+        conn.request("GET", f"/api/Commodity/{name}")
+        res = conn.getresponse()
+        data = res.read()
+        if res.status == 200:
+            results.append(json.loads(data.decode("utf-8")))
+    return results
+
+
+def bench_market_fetch(args):
+    """
+    Time a full commodity refresh against a local stub server: the old
+    sequential fetch with a fresh connection per commodity versus the
+    pooled, concurrent fetch_all_commodities().
+    """
+    server, counters = _start_commodity_stub(args.latency_ms, args.slow_ms, args.handshake_ms,
+                                             set(args.flaky.split(",")) if args.flaky else set())
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["RAPIDAPI_BASE_URL"] = base_url
+    os.environ.setdefault("KISAAN_HTTP_BACKOFF_MS", "20")
+    os.environ["KISAAN_MARKET_TIMEOUT"] = str(args.timeout)
+    import http_client
+    import market_integration
+
+    names = market_integration.COMMODITY_NAMES
+    print(f"{len(names)} commodities, {args.latency_ms:.0f} ms per request (wheat {args.slow_ms:.0f} ms), "
+          f"{args.handshake_ms:.0f} ms per new connection, {args.timeout:.1f} s deadline\n")
+
+    def run(label, fetch):
+        for refresh in range(1, args.refreshes + 1):
+            before = dict(counters)
+            started = time.perf_counter()
+            results = fetch()
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"  {label:<28} refresh {refresh}: {elapsed:8.1f} ms  ok={len(results)}  "
+                  f"requests={counters['requests'] - before['requests']}  "
+                  f"new connections={counters['connections'] - before['connections']}")
+
+    # The old client never retried, so a flaky commodity just drops out
+    run("before: sequential, fresh", lambda: _fetch_sequential_fresh(base_url, names))
+    run("after: pooled, concurrent", market_integration.fetch_all_commodities)
+
+    floor = args.handshake_ms + max(args.latency_ms, args.slow_ms)
+    print(f"\n  Slowest single request (new connection): ~{floor:.0f} ms")
+    print(f"  {http_client.stats()}")
+    http_client.close()
+    server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# weather-sweep: one city at a time vs. concurrent sweep under a deadline
+# ---------------------------------------------------------------------------
+
+def _forecast_payload(city: str) -> Dict:
+    day = {"maxtemp_c": 41.0, "mintemp_c": 27.0, "condition": {"text": "Sunny"}, "maxwind_kph": 22.0}
+    return {
+        "location": {"name": city, "region": "Punjab", "country": "Pakistan"},
+        "current": {"temp_c": 42.0, "condition": {"text": "Sunny"}, "humidity": 40, "wind_kph": 12.0,
+                    "air_quality": {"us-epa-index": 2}},
+        "forecast": {"forecastday": [{"day": day}, {"day": day}]},
+    }
+
+
+def bench_weather_sweep(args):
+    """
+    Time multi-city weather sweeps against a local stub WeatherAPI: fetching
+    cities one after another versus fetch_observations() with bounded
+    concurrency and a global deadline, including stalled locations.
+    """
+    from urllib.parse import parse_qs, urlsplit
+
+    stalled = {f"District {i}" for i in range(args.stalled)}
+
+    def respond(path):
+        city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+        if city in stalled:
+            return args.stall_s, 200, _forecast_payload(city)
+        jitter = random.uniform(-0.3, 0.3) * args.latency_ms
+        return (args.latency_ms + jitter) / 1000, 200, _forecast_payload(city)
+
+    server, counters = _start_stub_server(respond, args.handshake_ms)
+    os.environ["WEATHER_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["KISAAN_HTTP_RETRIES"] = "0"
+    import http_client
+    import weather_integration
+
+    print(f"{args.latency_ms:.0f} ms ±30% per request, {args.handshake_ms:.0f} ms per new connection, "
+          f"concurrency {weather_integration.WEATHER_SWEEP_CONCURRENCY}\n")
+
+    healthy = [f"District {i}" for i in range(args.stalled, args.stalled + args.locations)]
+    for count in (6, 30, args.locations):
+        cities = healthy[:count]
+        if count <= 30:
+            started = time.perf_counter()
+            sequential = [weather_integration.fetch_observation(city) for city in cities]
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"  {count:>4} cities  one at a time        {elapsed:8.1f} ms  ok={sum(1 for o in sequential if o)}")
+        started = time.perf_counter()
+        swept = weather_integration.fetch_observations(cities, deadline=args.deadline)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"  {count:>4} cities  concurrent sweep     {elapsed:8.1f} ms  ok={len(swept)}")
+
+    if args.stalled:
+        cities = sorted(stalled) + healthy
+        print(f"\n  {args.stalled} of {len(cities)} locations stall for {args.stall_s:.0f} s, "
+              f"sweep deadline {args.deadline:.1f} s:")
+        started = time.perf_counter()
+        alerts = weather_integration.fetch_weather_alerts_from_api(cities=cities, deadline=args.deadline)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"  {len(cities):>4} cities  alert sweep          {elapsed:8.1f} ms  alerts={len(alerts)}")
+
+    print(f"\n  {counters['connections']} connections for {counters['requests']} requests")
+    print(f"  {http_client.stats()}")
+    http_client.close()
+    server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# weather-cache: upstream calls for many users asking about one city
+# ---------------------------------------------------------------------------
+
+def bench_weather_cache(args):
+    """
+    Count upstream WeatherAPI requests when many concurrent users ask about
+    the same city: cold (single-flight), warm (TTL hits), after expiry
+    (stale-while-revalidate), and the alert sweep sharing the chat's cache.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def respond(path):
+        from urllib.parse import parse_qs, urlsplit
+        city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+        return args.latency_ms / 1000, 200, _forecast_payload(city)
+
+    server, counters = _start_stub_server(respond)
+    os.environ["WEATHER_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["KISAAN_WEATHER_TTL"] = str(args.ttl)
+    import http_client
+    import weather_integration
+
+    questions = ["Lahore", "lahore", "لاہور", " LAHORE "]
+
+    def ask(i):
+        t0 = time.perf_counter()
+        weather_integration.get_current_weather(questions[i % len(questions)])
+        return (time.perf_counter() - t0) * 1000
+
+    def burst(label):
+        before = counters["requests"]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            timings = list(executor.map(ask, range(args.users)))
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"  {label:<34} {args.users} lookups in {elapsed:8.1f} ms  upstream={counters['requests'] - before}  "
+              f"p50={_percentile(timings, 50):7.2f} ms  p99={_percentile(timings, 99):7.2f} ms")
+
+    print(f"{args.users} users on {args.threads} threads, upstream {args.latency_ms:.0f} ms, TTL {args.ttl:.0f} s\n")
+    burst("cold (single-flight)")
+    burst("warm (fresh hits)")
+    time.sleep(args.ttl + 0.2)
+    burst("expired (stale-while-revalidate)")
+    time.sleep(args.latency_ms / 1000 + 0.2)
+
+    before = counters["requests"]
+    weather_integration.fetch_weather_alerts_from_api()
+    swept = counters["requests"] - before
+    before = counters["requests"]
+    for city in weather_integration.ALERT_CITIES:
+        weather_integration.get_current_weather(city)
+    print(f"\n  Alert sweep of {len(weather_integration.ALERT_CITIES)} cities: upstream={swept}; "
+          f"chat lookups for the same cities afterwards: upstream={counters['requests'] - before}")
+    print(f"  {weather_integration.observation_cache.stats()}")
+    http_client.close()
+    server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# refresh-jobs: background refresh across workers vs. GET latency
+# ---------------------------------------------------------------------------
+
+def bench_refresh_jobs(args):
+    """
+    Run several uvicorn workers on one database with slow upstream stubs.
+    Count how often each refresh job hit upstream (it should not scale with
+    the worker count) and time the GET endpoints while the jobs run.
+    """
+    import json
+    import urllib.request
+    from urllib.parse import parse_qs, urlsplit
+
+    def commodity(path):
+        name = path.rsplit("/", 1)[-1]
+        return args.upstream_ms / 1000, 200, {"name": name, "price": round(random.uniform(50, 500), 2)}
+
+    def forecast(path):
+        city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+        return args.upstream_ms / 1000, 200, _forecast_payload(city)
+
+    market_stub, market_counts = _start_stub_server(commodity)
+    weather_stub, weather_counts = _start_stub_server(forecast)
+    env = {
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_SCHEDULER_POLL_S": "0.5",
+        "KISAAN_MARKET_REFRESH_S": str(args.interval),
+        "KISAAN_WEATHER_REFRESH_S": str(args.interval),
+    }
+    ports = [_free_port() for _ in range(args.workers)]
+    servers = [_start_server(port, env) for port in ports]
+    print(f"{args.workers} workers, jobs every {args.interval} s, upstream {args.upstream_ms:.0f} ms per request, "
+          f"{args.seconds} s run\n")
+
+    latencies: Dict[str, List[float]] = {"GET /api/market-prices": [], "GET /api/weather-alerts": []}
+    try:
+        ends_at = time.time() + args.seconds
+        i = 0
+        while time.time() < ends_at:
+            port = ports[i % len(ports)]
+            for name, path in (("GET /api/market-prices", "/api/market-prices"),
+                               ("GET /api/weather-alerts", "/api/weather-alerts?language=en")):
+                started = time.perf_counter()
+                urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=60).read()
+                latencies[name].append((time.perf_counter() - started) * 1000)
+            i += 1
+            time.sleep(0.02)
+        stats = [json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())["scheduler"]
+                 for port in ports]
+        # Snapshot alongside the stats; workers keep refreshing until terminated
+        upstream = {"market": market_counts["requests"], "weather": weather_counts["requests"]}
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    for name, values in latencies.items():
+        print(f"  {name:<26} n={len(values):<5} p50={_percentile(values, 50):7.2f} ms  "
+              f"p99={_percentile(values, 99):7.2f} ms  max={max(values):8.2f} ms")
+    runs = {name: sum(snapshot["jobs"][name]["runs"] for snapshot in stats) for name in ("market_prices", "weather_alerts")}
+    print(f"\n  Job runs across all workers: {runs} "
+          f"(~{args.seconds / (args.interval + args.upstream_ms / 1000) + 1:.0f} per job expected; "
+          f"intervals count from the end of a run)")
+    print(f"  Upstream requests: market={upstream['market']} (9 per refresh), "
+          f"weather={upstream['weather']} (6 per sweep; cached observations skip upstream)")
+    for port, snapshot in zip(ports, stats):
+        per_job = {name: (job["runs"], job["last_duration_ms"]) for name, job in snapshot["jobs"].items()}
+        print(f"  worker :{port}  (runs, last ms): {per_job}")
+    market_stub.shutdown()
+    weather_stub.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# upstream-outage: circuit breakers and negative caching during an outage
+# ---------------------------------------------------------------------------
+
+def bench_upstream_outage(args):
+    """
+    Take a local stub WeatherAPI/RapidAPI down (requests hang) and time the
+    chat-path lookups: calls pay the full timeout until the breaker opens,
+    then fail in microseconds; repeated keys are answered from the negative
+    cache; once the stub heals, a half-open probe closes the breaker.
+    """
+    from urllib.parse import parse_qs, urlsplit
+
+    state = {"down": False}
+
+    def respond(path):
+        if state["down"]:
+            return args.stall_s, 503, {"error": "upstream down"}
+        if path.startswith("/v1/"):
+            city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+            return args.latency_ms / 1000, 200, _forecast_payload(city)
+        return args.latency_ms / 1000, 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    server, counters = _start_stub_server(respond)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["WEATHER_API_BASE"] = f"{base}/v1"
+    os.environ["RAPIDAPI_BASE_URL"] = base
+    os.environ["KISAAN_WEATHER_TIMEOUT"] = str(args.timeout)
+    os.environ["KISAAN_MARKET_TIMEOUT"] = str(args.timeout)
+    os.environ["KISAAN_BREAKER_OPEN_S"] = str(args.open_s)
+    os.environ["KISAAN_NEGATIVE_TTL"] = str(args.negative_ttl)
+    import http_client
+    import market_integration
+    import weather_integration
+    from crops import CROPS
+
+    breaker = weather_integration.weatherapi_breaker
+
+    def timed(func, *call_args):
+        started = time.perf_counter()
+        result = func(*call_args)
+        return (time.perf_counter() - started) * 1000, result
+
+    def report(label, timings):
+        print(f"  {label:<42} n={len(timings):<4} p50={_percentile(timings, 50):9.2f} ms  "
+              f"max={max(timings):9.2f} ms")
+
+    print(f"Stub {args.latency_ms:.0f} ms when healthy; during the outage requests hang {args.stall_s:.0f} s. "
+          f"Timeout {args.timeout:.1f} s, breaker opens for {args.open_s:.0f} s, negative TTL {args.negative_ttl:.0f} s\n")
+
+    report("healthy: weather, distinct cities",
+           [timed(weather_integration.fetch_observation, f"Healthy {i}")[0] for i in range(10)])
+
+    state["down"] = True
+    before_trip, after_trip = [], []
+    for i in range(args.lookups):
+        was_closed = breaker.state == "closed"
+        elapsed, _ = timed(weather_integration.fetch_observation, f"District {i}")
+        (before_trip if was_closed else after_trip).append(elapsed)
+    print()
+    report("outage: weather, until the breaker opened", before_trip)
+    report("outage: weather, breaker open", after_trip)
+    report("outage: weather, repeated city",
+           [timed(weather_integration.fetch_observation, "District 0")[0] for _ in range(args.lookups)])
+
+    commodities = [crop["api"] for crop in CROPS.values()]
+    market = [timed(market_integration.get_current_market_price, name)[0] for name in commodities * 3]
+    report("outage: chat price lookups (DB fallback)", market)
+
+    upstream_during = counters["requests"]
+    state["down"] = False
+    time.sleep(args.open_s + 0.1)
+    elapsed, observation = timed(weather_integration.fetch_observation, "Recovered")
+    print(f"\n  After {args.open_s:.0f} s the stub is healthy again: half-open probe took {elapsed:.1f} ms, "
+          f"ok={observation is not None}, breaker {breaker.state}")
+    report("recovered: weather, distinct cities",
+           [timed(weather_integration.fetch_observation, f"Recovered {i}")[0] for i in range(10)])
+
+    print(f"\n  Upstream requests during the outage phase: {upstream_during}")
+    print(f"  weatherapi breaker: {breaker.stats()}")
+    print(f"  rapidapi breaker:   {market_integration.rapidapi_breaker.stats()}")
+    print(f"  weather cache:      {weather_integration.observation_cache.stats()}")
+    print(f"  http:               {http_client.stats()}")
+    http_client.close()
+    server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# replay: record integrations against stubs, load-test a worker offline
+# ---------------------------------------------------------------------------
+
+_CHAT_QUESTIONS = [
+    ("What is the weather in Lahore today?", "en"),
+    ("لاہور میں موسم کیسا ہے؟", "ur"),
+    ("What is the wheat price today?", "en"),
+    ("گندم کی قیمت کیا ہے؟", "ur"),
+    ("Will it rain in Multan tomorrow?", "en"),
+    ("How do I control aphids on cotton?", "en"),
+]
+
+
+class _StubGeminiModel:
+    """Stands in for a GenerativeModel while recording (the real one needs a key)."""
+
+    model_name = "models/stub"
+
+    def __init__(self, latency_ms: float, first_chunk_ms: float = None, pieces: int = 1):
+        self.latency_ms = latency_ms
+        self.first_chunk_ms = latency_ms if first_chunk_ms is None else first_chunk_ms
+        self.pieces = pieces
+
+    def generate_content(self, prompt, stream=False):
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        text = f"Recorded answer to: {question}"
+        if stream:
+            return self._stream(f"{text} " + " ".join(f"Step {i}: keep the field well drained."
+                                                       for i in range(1, self.pieces)))
+        time.sleep(self.latency_ms / 1000)
+        return _ReplayText(text)
+
+    def _stream(self, text: str):
+        # Like Gemini: a pause before the first chunk, then the rest at a steady pace
+        words = text.split(" ")
+        size = max(1, len(words) // self.pieces)
+        chunks = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+        time.sleep(self.first_chunk_ms / 1000)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep((self.latency_ms - self.first_chunk_ms) / 1000 / max(len(chunks) - 1, 1))
+            yield _ReplayText(chunk)
+
+
+class _ReplayText:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def bench_replay(args):
+    """
+    Record every integration against local stubs (KISAAN_TRANSPORT=record),
+    shut the stubs down, then load-test /api/chat on a uvicorn worker that
+    replays the fixtures (KISAAN_TRANSPORT=replay) with injected latency,
+    once clean and once with an injected error rate.
+    """
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import parse_qs, urlsplit
+
+    fixtures_dir = os.path.join(_TMP_DIR, "fixtures")
+
+    def commodity(path):
+        return args.upstream_ms / 1000, 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    def forecast(path):
+        city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+        return args.upstream_ms / 1000, 200, _forecast_payload(city)
+
+    market_stub, _ = _start_stub_server(commodity)
+    weather_stub, _ = _start_stub_server(forecast)
+    env = {
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_FIXTURES_DIR": fixtures_dir,
+    }
+    os.environ.update(env, KISAAN_TRANSPORT="record")
+    import gemini_integration
+    import http_client
+    import market_integration
+    import transport
+    import weather_integration
+
+    started = time.perf_counter()
+    market_integration.fetch_all_commodities()
+    weather_integration.fetch_weather_alerts_from_api()
+    gemini_integration.model = transport.RecordingModel(_StubGeminiModel(args.gemini_ms))
+    for question, language in _CHAT_QUESTIONS:
+        gemini_integration.get_agri_response(question, language)
+    print(f"Recorded {transport.stats()['recorded']} fixtures in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"-> {fixtures_dir}")
+    http_client.close()
+    market_stub.shutdown()
+    weather_stub.shutdown()
+    print("Stubs stopped; the replay workers below have no upstream to reach\n")
+
+    def load(port):
+        def ask(i):
+            question, language = _CHAT_QUESTIONS[i % len(_CHAT_QUESTIONS)]
+            body = json.dumps({"question": question, "language": language}).encode()
+            request = urllib.request.Request(f"http://127.0.0.1:{port}/api/chat", data=body,
+                                             headers={"Content-Type": "application/json"})
+            t0 = time.perf_counter()
+            answer = json.loads(urllib.request.urlopen(request, timeout=60).read())["answer"]
+            return (time.perf_counter() - t0) * 1000, answer.startswith("Recorded answer")
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            results = list(executor.map(ask, range(args.requests)))
+        return (time.perf_counter() - t0), results
+
+    for error_rate in (0.0, args.error_rate):
+        port = _free_port()
+        server = _start_server(port, {
+            **env,
+            "KISAAN_TRANSPORT": "replay",
+            "KISAAN_REPLAY_LATENCY_MS": str(args.upstream_ms),
+            "KISAAN_REPLAY_GEMINI_LATENCY_MS": str(args.gemini_ms),
+            "KISAAN_REPLAY_JITTER": "0.3",
+            "KISAAN_REPLAY_ERROR_RATE": str(error_rate),
+            "KISAAN_SCHEDULER": "0",
+            "GEMINI_API_KEY": "",
+        })
+        try:
+            elapsed, results = load(port)
+            stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())
+        finally:
+            server.terminate()
+            server.wait()
+        timings = [ms for ms, _ in results]
+        replayed = sum(1 for _, ok in results if ok)
+        print(f"  error rate {error_rate:4.0%}: {len(results)} chats on {args.clients} clients in {elapsed:5.2f} s "
+              f"({len(results) / elapsed:6.1f}/s)  p50={_percentile(timings, 50):7.1f} ms  "
+              f"p99={_percentile(timings, 99):7.1f} ms  replayed answers={replayed}, fallback answers="
+              f"{len(results) - replayed}")
+        print(f"    transport: {stats['transport']}")
+        print(f"    breakers:  { {name: b['state'] for name, b in stats['breakers'].items()} }")
+
+
+# ---------------------------------------------------------------------------
+# alert-rules: the rules table over every district, per city vs. one batch
+# ---------------------------------------------------------------------------
+
+def _random_forecast_payload(city: str, rng: random.Random) -> Dict:
+    def day():
+        return {"maxtemp_c": round(rng.uniform(15, 48), 1), "mintemp_c": round(rng.uniform(-2, 30), 1),
+                "condition": {"text": rng.choice(["Sunny", "Partly cloudy", "Light rain", "Thundery outbreaks"])},
+                "maxwind_kph": round(rng.uniform(5, 60), 1), "totalprecip_mm": round(rng.uniform(0, 40), 1)}
+    return {
+        "location": {"name": city, "region": "Punjab", "country": "Pakistan"},
+        "current": {"temp_c": round(rng.uniform(-3, 48), 1), "humidity": rng.randint(10, 100),
+                    "wind_kph": round(rng.uniform(0, 50), 1),
+                    "condition": {"text": rng.choice(["Sunny", "Mist", "Moderate rain", "Thunderstorm", "Clear"])},
+                    "air_quality": {"us-epa-index": rng.randint(1, 6), "pm2_5": rng.uniform(5, 300)}},
+        "forecast": {"forecastday": [{"day": day()}, {"day": day()}]},
+    }
+
+
+def bench_alert_rules(args):
+    """
+    Evaluate the weather_alert_rules table over synthetic observations, one
+    per district HQ by default: per city (batches of one) and as one batch.
+    """
+    import alert_rules
+    import migrations
+    from weather_integration import WeatherObservation
+
+    migrations.migrate()
+    ruleset = alert_rules.rules()
+    rng = random.Random(7)
+    batch = [(f"District {i}", WeatherObservation.parse(_random_forecast_payload(f"District {i}", rng),
+                                                         f"District {i}"))
+             for i in range(args.locations)]
+    print(f"{len(ruleset.rules)} rules from weather_alert_rules, {args.locations} observations, "
+          f"best of {args.repeat}\n")
+
+    def best(func):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), result
+
+    per_city_ms, _ = best(lambda: [ruleset.evaluate([pair]) for pair in batch])
+    batch_ms, alerts = best(lambda: ruleset.evaluate(batch))
+    match_ms, _ = best(lambda: [ruleset.matches(observation) for _, observation in batch])
+
+    print(f"  {'per city (batch of one each)':<36} {per_city_ms:8.2f} ms")
+    print(f"  {'one batch':<36} {batch_ms:8.2f} ms   (rule matching alone {match_ms:.2f} ms)")
+    print(f"\n  {len(alerts)} alerts")
+
+
+# ---------------------------------------------------------------------------
+# weather-batch: a province dashboard in one call vs. one city per call
+# ---------------------------------------------------------------------------
+
+def bench_weather_batch(args):
+    """
+    Load weather for a few hundred locations through a uvicorn worker:
+    one GET /api/weather per city (as a client looping over cities would)
+    versus one batch call, cold and warm, against a stub WeatherAPI that
+    supports bulk queries (POST q=bulk).
+    """
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import parse_qs, quote, urlsplit
+
+    def respond(path, body=None):
+        if body is None:
+            city = parse_qs(urlsplit(path).query).get("q", [""])[0]
+            return args.latency_ms / 1000, 200, _forecast_payload(city)
+        locations = body["locations"]
+        bulk = [{"query": {"custom_id": loc["custom_id"], "q": loc["q"], **_forecast_payload(loc["q"])}}
+                for loc in locations]
+        return (args.latency_ms + args.per_location_ms * len(locations)) / 1000, 200, {"bulk": bulk}
+
+    stub, counters = _start_stub_server(respond)
+    port = _free_port()
+    server = _start_server(port, {
+        "WEATHER_API_BASE": f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        "KISAAN_SCHEDULER": "0",
+    })
+    base = f"http://127.0.0.1:{port}/api/weather"
+    print(f"{args.locations} locations, upstream {args.latency_ms:.0f} ms per request "
+          f"(+{args.per_location_ms:.0f} ms per bulk location), {args.clients} client threads for per-city calls\n")
+
+    def timed(label, func):
+        before = counters["requests"]
+        started = time.perf_counter()
+        size = func()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"  {label:<40} {elapsed:9.1f} ms  upstream={counters['requests'] - before:<4} "
+              f"response bytes={size}")
+
+    def per_city(cities):
+        def one(city):
+            return len(urllib.request.urlopen(f"{base}?cities={quote(city)}", timeout=60).read())
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            return sum(executor.map(one, cities))
+
+    def batch_get(cities):
+        return len(urllib.request.urlopen(f"{base}?cities={quote(','.join(cities))}", timeout=60).read())
+
+    row_bytes = []
+
+    def batch_post(cities):
+        request = urllib.request.Request(base, data=json.dumps({"cities": cities}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        body = urllib.request.urlopen(request, timeout=60).read()
+        columns = json.loads(body)["columns"]
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        row_bytes.append(len(json.dumps(rows).encode()))
+        return len(body)
+
+    try:
+        timed("one call per city, cold", lambda: per_city([f"Tehsil {i}" for i in range(args.locations)]))
+        timed("one call per city, warm", lambda: per_city([f"Tehsil {i}" for i in range(args.locations)]))
+        districts = [f"District {i}" for i in range(args.locations)]
+        timed("GET batch, cold (bulk fill)", lambda: batch_get(districts))
+        timed("GET batch, warm", lambda: batch_get(districts))
+        timed("POST batch, half cached", lambda: batch_post(districts[args.locations // 2:]
+                                                            + [f"Village {i}" for i in range(args.locations // 2)]))
+        print(f"  {'':<40} (as one JSON object per city instead: {row_bytes[0]} bytes)")
+        stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())
+    finally:
+        server.terminate()
+        server.wait()
+        stub.shutdown()
+    print(f"\n  weather cache: {stats['caches']['weather']}")
+
+
+# ---------------------------------------------------------------------------
+# gazetteer: district/tehsil names snapped to shared weather stations
+# ---------------------------------------------------------------------------
+
+def _spelling_variants(place, rng: random.Random) -> List[str]:
+    # How users and the alerts table actually write a place
+    variants = [place.name, place.name.lower(), place.name.upper(), f"  {place.name} "]
+    if place.name_ur:
+        variants.append(place.name_ur)
+    return [rng.choice(variants) for _ in range(4)]
+
+
+def bench_gazetteer(args):
+    """
+    Resolve every gazetteer place (in assorted spellings) to a cache key,
+    as the old title-case mapping did and as the station snap does, and
+    time nearest-station queries: KD-tree vs. a scan of every station.
+    """
+    import gazetteer
+    from weather_integration import normalize_city
+
+    places = gazetteer.get()
+    rng = random.Random(11)
+    regions = [name for place in places.places for name in _spelling_variants(place, rng)]
+    before = {" ".join(region.split()).title() for region in regions}
+    started = time.perf_counter()
+    after = [normalize_city(region) for region in regions]
+    snap_us = (time.perf_counter() - started) * 1e6 / len(regions)
+    print(f"{len(places.places)} places, {len(places.stations)} stations, {len(regions)} region strings\n")
+    print(f"  {'cache keys, name as written':<36} {len(before):6}")
+    print(f"  {'cache keys, snapped to stations':<36} {len(set(after)):6}   ({snap_us:.2f} µs per name)")
+
+    points = [(rng.uniform(23.6, 37.0), rng.uniform(60.9, 77.8)) for _ in range(args.points)]
+    stations = places.stations
+
+    def scan(lat, lon):
+        return min(stations, key=lambda s: ((s.lon - lon) * gazetteer._COS_LAT) ** 2 + (s.lat - lat) ** 2)
+
+    started = time.perf_counter()
+    expected = [scan(lat, lon) for lat, lon in points]
+    scan_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    got = [places.nearest_station(lat, lon) for lat, lon in points]
+    tree_ms = (time.perf_counter() - started) * 1000
+    assert got == expected, "KD-tree disagrees with the linear scan"
+    print(f"\n  nearest station for {args.points} random points in Pakistan's bounding box")
+    print(f"  {'linear scan':<36} {scan_ms:9.1f} ms   ({scan_ms * 1000 / args.points:.2f} µs per point)")
+    print(f"  {'KD-tree':<36} {tree_ms:9.1f} ms   ({tree_ms * 1000 / args.points:.2f} µs per point)")
+    print("\n  results identical")
+
+
+# ---------------------------------------------------------------------------
+# chat-stream: time to first byte, buffered vs. Server-Sent Events
+# ---------------------------------------------------------------------------
+
+def bench_chat_stream(args):
+    """
+    Record streamed Gemini answers from a stub that pauses before its first
+    chunk and then generates steadily, then replay them on a uvicorn worker
+    and compare POST /api/chat (whole answer at once) with POST
+    /api/chat/stream (SSE) on time to first byte and total time.
+    """
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import parse_qs, urlsplit
+
+    fixtures_dir = os.path.join(_TMP_DIR, "stream-fixtures")
+
+    def forecast(path):
+        return 0.02, 200, _forecast_payload(parse_qs(urlsplit(path).query).get("q", [""])[0])
+
+    def commodity(path):
+        return 0.02, 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    weather_stub, _ = _start_stub_server(forecast)
+    market_stub, _ = _start_stub_server(commodity)
+    env = {
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_FIXTURES_DIR": fixtures_dir,
+    }
+    os.environ.update(env, KISAAN_TRANSPORT="record")
+    import gemini_integration
+    import http_client
+    import transport
+
+    gemini_integration.model = transport.RecordingModel(
+        _StubGeminiModel(args.gemini_ms, first_chunk_ms=args.first_chunk_ms, pieces=args.pieces))
+    for question, language in _CHAT_QUESTIONS:
+        "".join(gemini_integration.stream_agri_response(question, language))
+    http_client.close()
+    weather_stub.shutdown()
+    market_stub.shutdown()
+    print(f"Recorded {len(_CHAT_QUESTIONS)} streamed answers: first chunk after {args.first_chunk_ms:.0f} ms, "
+          f"{args.pieces} chunks over {args.gemini_ms:.0f} ms\n")
+
+    port = _free_port()
+    # Answer cache off: every chat is generated
+    server = _start_server(port, {**env, "KISAAN_TRANSPORT": "replay", "KISAAN_SCHEDULER": "0",
+                                  "KISAAN_ANSWER_CACHE_TTL": "0", "GEMINI_API_KEY": ""})
+
+    def ask(path, i):
+        question, language = _CHAT_QUESTIONS[i % len(_CHAT_QUESTIONS)]
+        body = json.dumps({"question": question, "language": language, "user_id": 1}).encode()
+        request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=body,
+                                         headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        first = None
+        with urllib.request.urlopen(request, timeout=60) as response:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                if first is None and line.strip():
+                    first = (time.perf_counter() - t0) * 1000
+        return first, (time.perf_counter() - t0) * 1000
+
+    try:
+        for label, path in (("POST /api/chat (buffered)", "/api/chat"), ("POST /api/chat/stream (SSE)", "/api/chat/stream")):
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                results = list(executor.map(lambda i: ask(path, i), range(args.requests)))
+            ttfb = [first for first, _ in results]
+            total = [ms for _, ms in results]
+            print(f"  {label:<30} TTFB p50={_percentile(ttfb, 50):7.1f} ms p95={_percentile(ttfb, 95):7.1f} ms   "
+                  f"total p50={_percentile(total, 50):7.1f} ms p95={_percentile(total, 95):7.1f} ms")
+        stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"\n  server-side latency: {stats['latency']}")
+    print(f"  chat_writer: {stats['chat_writer']}")
+
+
+# ---------------------------------------------------------------------------
+# gemini-async: chats on the threadpool vs. async Gemini calls
+# ---------------------------------------------------------------------------
+
+def bench_gemini_async(args):
+    """
+    Fire a burst of concurrent chats at a uvicorn worker replaying slow
+    Gemini answers, with the sync path on the threadpool
+    (KISAAN_GEMINI_ASYNC=0) and with the async client, while a probe times
+    GET / to check the worker stays responsive.
+    """
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import parse_qs, urlsplit
+
+    fixtures_dir = os.path.join(_TMP_DIR, "async-fixtures")
+
+    def forecast(path):
+        return 0.02, 200, _forecast_payload(parse_qs(urlsplit(path).query).get("q", [""])[0])
+
+    def commodity(path):
+        return 0.02, 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    weather_stub, _ = _start_stub_server(forecast)
+    market_stub, _ = _start_stub_server(commodity)
+    env = {
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_FIXTURES_DIR": fixtures_dir,
+    }
+    os.environ.update(env, KISAAN_TRANSPORT="record")
+    import gemini_integration
+    import http_client
+    import transport
+
+    gemini_integration.model = transport.RecordingModel(_StubGeminiModel(0))
+    for question, language in _CHAT_QUESTIONS:
+        gemini_integration.get_agri_response(question, language)
+    http_client.close()
+    weather_stub.shutdown()
+    market_stub.shutdown()
+    print(f"{args.chats} concurrent chats, Gemini replayed at {args.gemini_ms:.0f} ms each, "
+          f"KISAAN_GEMINI_CONCURRENCY={args.limit}\n")
+
+    def run(async_mode):
+        port = _free_port()
+        server = _start_server(port, {
+            **env,
+            "KISAAN_TRANSPORT": "replay",
+            "KISAAN_REPLAY_GEMINI_LATENCY_MS": str(args.gemini_ms),
+            "KISAAN_REPLAY_LATENCY_MS": "20",
+            "KISAAN_GEMINI_ASYNC": "1" if async_mode else "0",
+            "KISAAN_GEMINI_CONCURRENCY": str(args.limit),
+            "KISAAN_ANSWER_CACHE_TTL": "0",
+            "KISAAN_SCHEDULER": "0",
+            "GEMINI_API_KEY": "",
+        })
+        probes = []
+        done = threading.Event()
+
+        def probe():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=60).read()
+                probes.append((time.perf_counter() - t0) * 1000)
+                time.sleep(0.02)
+
+        def ask(i):
+            question, language = _CHAT_QUESTIONS[i % len(_CHAT_QUESTIONS)]
+            body = json.dumps({"question": question, "language": language}).encode()
+            request = urllib.request.Request(f"http://127.0.0.1:{port}/api/chat", data=body,
+                                             headers={"Content-Type": "application/json"})
+            t0 = time.perf_counter()
+            urllib.request.urlopen(request, timeout=120).read()
+            return (time.perf_counter() - t0) * 1000
+
+        try:
+            prober = threading.Thread(target=probe, daemon=True)
+            prober.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.chats) as executor:
+                timings = list(executor.map(ask, range(args.chats)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            prober.join()
+            stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())
+        finally:
+            server.terminate()
+            server.wait()
+        label = "async client, semaphore" if async_mode else "sync client on threadpool"
+        print(f"  {label:<26} {elapsed:6.2f} s ({args.chats / elapsed:6.1f} chats/s)  "
+              f"chat p50={_percentile(timings, 50):7.0f} ms p99={_percentile(timings, 99):7.0f} ms  "
+              f"GET / p99={_percentile(probes, 99):6.1f} ms")
+        if async_mode:
+            print(f"\n  gemini: {stats['gemini']}")
+
+    run(False)
+    run(True)
+
+
+# ---------------------------------------------------------------------------
+# answer-cache: repeated chat questions with and without the answer cache
+# ---------------------------------------------------------------------------
+
+_ARABIC_LETTERS = str.maketrans({"ی": "ي", "ک": "ك", "ہ": "ه"})
+
+
+def _question_variants(question: str, rng: random.Random) -> str:
+    # How the same question arrives from different phones and keyboards
+    variant = question
+    if rng.random() < 0.5:
+        variant = variant.translate(_ARABIC_LETTERS)
+    if rng.random() < 0.5:
+        variant = variant.rstrip("?؟") + rng.choice(["", "?", " ؟", "!!", "۔"])
+    if rng.random() < 0.3:
+        variant = variant.upper() if rng.random() < 0.5 else variant.lower()
+    if rng.random() < 0.3:
+        variant = "  " + variant.replace(" ", "  ")
+    return variant
+
+
+def bench_answer_cache(args):
+    """
+    Send a day's worth of repeated questions (Zipf-distributed, in assorted
+    spellings) to a uvicorn worker replaying Gemini at a fixed latency,
+    with the answer cache off and on, then restart with persistence to
+    show a cold worker answering from SQLite.
+    """
+    import json
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.parse import parse_qs, urlsplit
+
+    import answer_cache
+
+    rng = random.Random(5)
+    weights = [1 / (rank + 1) for rank in range(len(_CHAT_QUESTIONS))]
+    asked = [rng.choices(_CHAT_QUESTIONS, weights)[0] for _ in range(args.chats)]
+    asked = [(_question_variants(question, rng), language) for question, language in asked]
+    started = time.perf_counter()
+    normalized = {(answer_cache.normalize_question(q), language) for q, language in asked}
+    normalize_us = (time.perf_counter() - started) * 1e6 / len(asked)
+    print(f"{args.chats} chats over {len(_CHAT_QUESTIONS)} questions: {len({q for q, _ in asked})} distinct "
+          f"spellings, {len(normalized)} after normalize_question ({normalize_us:.1f} µs each)\n")
+
+    fixtures_dir = os.path.join(_TMP_DIR, "answer-fixtures")
+
+    def forecast(path):
+        return 0.02, 200, _forecast_payload(parse_qs(urlsplit(path).query).get("q", [""])[0])
+
+    def commodity(path):
+        return 0.02, 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    weather_stub, _ = _start_stub_server(forecast)
+    market_stub, _ = _start_stub_server(commodity)
+    env = {
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_FIXTURES_DIR": fixtures_dir,
+    }
+    os.environ.update(env, KISAAN_TRANSPORT="record", KISAAN_ANSWER_CACHE_TTL="0")
+    import gemini_integration
+    import http_client
+    import transport
+
+    gemini_integration.model = transport.RecordingModel(_StubGeminiModel(0))
+    for question, language in _CHAT_QUESTIONS:
+        gemini_integration.get_agri_response(question, language)
+    http_client.close()
+    weather_stub.shutdown()
+    market_stub.shutdown()
+
+    def run(label, extra_env):
+        port = _free_port()
+        server = _start_server(port, {
+            **env,
+            "KISAAN_TRANSPORT": "replay",
+            "KISAAN_REPLAY_GEMINI_LATENCY_MS": str(args.gemini_ms),
+            "KISAAN_REPLAY_LATENCY_MS": "20",
+            "KISAAN_SCHEDULER": "0",
+            "GEMINI_API_KEY": "",
+            **extra_env,
+        })
+
+        def ask(item):
+            question, language = item
+            body = json.dumps({"question": question, "language": language}).encode()
+            request = urllib.request.Request(f"http://127.0.0.1:{port}/api/chat", data=body,
+                                             headers={"Content-Type": "application/json"})
+            t0 = time.perf_counter()
+            urllib.request.urlopen(request, timeout=120).read()
+            return (time.perf_counter() - t0) * 1000
+
+        try:
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as executor:
+                timings = list(executor.map(ask, asked))
+            elapsed = time.perf_counter() - t0
+            stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/api/stats").read())
+        finally:
+            server.terminate()
+            server.wait()
+        cache = stats["answer_cache"]
+        print(f"  {label:<30} {elapsed:6.2f} s  p50={_percentile(timings, 50):7.1f} ms "
+              f"p95={_percentile(timings, 95):7.1f} ms  Gemini calls={stats['gemini']['calls']:<4} "
+              f"hit rate={cache['hit_rate']:.1%} (from SQLite: {cache['persistent_hits']})")
+
+    run("cache off", {"KISAAN_ANSWER_CACHE_TTL": "0"})
+    run("cache on", {"KISAAN_ANSWER_CACHE_TTL": "3600"})
+    persisted = {"KISAAN_ANSWER_CACHE_TTL": "3600", "KISAAN_ANSWER_CACHE_PERSIST": "1"}
+    run("cache on, persisted", persisted)
+    run("  ... restarted worker", persisted)
+
+
+# ---------------------------------------------------------------------------
+# intents: keyword-list scans vs. the Aho-Corasick extractor
+# ---------------------------------------------------------------------------
+
+_FILLER_EN = ["what", "is", "the", "today", "my", "field", "in", "for", "please", "tell", "me", "about",
+              "how", "should", "i", "this", "week", "farm", "acre", "tomorrow", "near", "crop", "help"]
+_FILLER_UR = ["کیا", "ہے", "میں", "میرے", "کی", "کا", "کے", "آج", "کل", "کھیت", "فصل", "بتائیں", "کیسے",
+              "کریں", "اس", "ہفتے", "پر", "ایکڑ", "مدد"]
+
+
+_OLD_CITIES = [
+    "multan", "ملتان", "lahore", "لاہور", "karachi", "کراچی", "islamabad", "اسلام آباد",
+    "peshawar", "پشاور", "quetta", "کوئٹہ", "faisalabad", "فیصل آباد", "rawalpindi", "راولپنڈی",
+    "gujranwala", "گوجرانوالہ", "sialkot", "سیالکوٹ", "punjab", "پنجاب", "sindh", "سندھ",
+    "kpk", "خیبر پختونخوا", "balochistan", "بلوچستان",
+]
+
+
+def _keyword_scan(question: str, cities: List[str] = _OLD_CITIES):
+    # The three detect_*_query functions as they were: lower-case, then scan
+    # every keyword list with any(), rebuilding the entity dicts per call
+    import intents
+
+    question_lower = question.lower()
+    is_price = any(keyword in question_lower for keyword in intents.PRICE_KEYWORDS)
+    crop = None
+    if is_price:
+        crops = {
+            "wheat": ["wheat", "گندم"],
+            "rice": ["rice", "چاول"],
+            "cotton": ["cotton", "کپاس"],
+            "sugar": ["sugar", "چینی", "sweet"],
+            "corn": ["corn", "مکئی", "maize"],
+        }
+        crop = next((c for c, keywords in crops.items() if any(k in question_lower for k in keywords)), None)
+    is_pest = any(keyword in question_lower for keyword in intents.PEST_KEYWORDS)
+    pest = None
+    if is_pest:
+        pests = {pest: list(spellings) for pest, spellings in intents.PESTS.items()}
+        pest = next((p for p, keywords in pests.items() if any(k in question_lower for k in keywords)), None)
+    is_weather = any(keyword in question_lower for keyword in intents.WEATHER_KEYWORDS)
+    city = None
+    for c in cities:
+        if c in question_lower:
+            words = question_lower.split()
+            for word in words:
+                if c in word:
+                    city = c
+                    break
+            if city:
+                break
+    return (is_price, crop), (is_pest, pest), (is_weather, city)
+
+
+def bench_intents(args):
+    """
+    Time intent and entity extraction per chat message: the old three
+    keyword-list scans against one pass of the compiled Aho-Corasick
+    automaton, on generated English and Urdu messages, and count how often
+    the two agree on the price/pest/weather intents.
+    """
+    import gazetteer
+    import intents
+
+    rng = random.Random(24)
+    keywords = intents.PRICE_KEYWORDS + intents.PEST_KEYWORDS + intents.WEATHER_KEYWORDS
+    crops = ["wheat", "گندم", "rice", "چاول", "cotton", "کپاس", "maize", "مکئی", "sugar", "چینی"]
+    places = [place for place in gazetteer.get().places if place.kind != "province"]
+    messages = [question for question, _ in _CHAT_QUESTIONS]
+    while len(messages) < args.messages:
+        urdu = rng.random() < 0.5
+        words = rng.choices(_FILLER_UR if urdu else _FILLER_EN, k=rng.randint(4, 20))
+        for extra in rng.sample(keywords, rng.randint(0, 2)) + rng.sample(crops, rng.randint(0, 1)):
+            words.insert(rng.randint(0, len(words)), extra)
+        if rng.random() < 0.5:
+            place = rng.choice(places)
+            words.insert(rng.randint(0, len(words)), place.name_ur if urdu else place.name)
+        messages.append(" ".join(words) + rng.choice(["", "?", "؟", "۔"]))
+
+    def timed(extract):
+        best = None
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            results = [extract(message) for message in messages]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1e6 / len(messages), results
+
+    every_name = list(gazetteer.get().names())
+    scan_us, scanned = timed(_keyword_scan)
+    scan_all_us, _ = timed(lambda message: _keyword_scan(message, every_name))
+    automaton_us, extracted = timed(intents.extract)
+    agree = sum(
+        (old[0][0], old[1][0], old[2][0]) == (new.price, new.pest, new.weather)
+        for old, new in zip(scanned, extracted)
+    )
+    old_places = sum(1 for old in scanned if old[2][1])
+    new_places = sum(1 for new in extracted if new.place)
+    chars = sum(len(message) for message in messages) / len(messages)
+    print(f"{len(messages)} messages, {chars:.0f} characters on average, best of {args.rounds} rounds\n")
+    print(f"  {'keyword-list scans, 28 city names':<40} {scan_us:8.2f} µs per message")
+    print(f"  {f'keyword-list scans, {len(every_name)} place names':<40} {scan_all_us:8.2f} µs per message")
+    print(f"  {f'Aho-Corasick, one pass, {len(every_name)} place names':<40} {automaton_us:8.2f} µs per message")
+    print(f"\n  intents identical for {agree}/{len(messages)} messages")
+    print(f"  a place found in {old_places} messages by the old city list, {new_places} by the gazetteer")
+
+
+# ---------------------------------------------------------------------------
+# context-deadline: context lookups one after another vs. concurrently
+# ---------------------------------------------------------------------------
+
+_CONTEXT_QUESTIONS = [
+    ("What is the wheat price in Lahore, and will it rain there tomorrow?", "en"),
+    ("ملتان میں کپاس کی قیمت اور موسم کیسا ہے؟ سفید مکھی کا علاج بھی بتائیں", "ur"),
+    ("Is it too hot in Faisalabad to spray for aphids on my rice? What does rice cost now?", "en"),
+    ("How do I control whitefly on cotton?", "en"),
+]
+
+
+def bench_context_deadline(args):
+    """
+    Gather prompt context for questions needing several providers, with the
+    weather and market upstreams stubbed at fixed latencies and caches
+    cleared before each question: the providers one after another (as
+    get_agri_response used to), concurrently, and concurrently with the
+    weather upstream slower than the shared deadline.
+    """
+    from urllib.parse import parse_qs, urlsplit
+
+    delays = {"weather": args.weather_ms / 1000, "market": args.market_ms / 1000}
+
+    def forecast(path):
+        return delays["weather"], 200, _forecast_payload(parse_qs(urlsplit(path).query).get("q", [""])[0])
+
+    def commodity(path):
+        return delays["market"], 200, {"name": path.rsplit("/", 1)[-1], "price": 120.0}
+
+    weather_stub, _ = _start_stub_server(forecast)
+    market_stub, _ = _start_stub_server(commodity)
+    os.environ.update({
+        "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{market_stub.server_address[1]}",
+        "WEATHER_API_BASE": f"http://127.0.0.1:{weather_stub.server_address[1]}/v1",
+        "KISAAN_CONTEXT_DEADLINE_MS": str(args.deadline_ms),
+    })
+    import gemini_integration
+    import intents
+    import latency
+    import migrations
+    import ttl_cache
+
+    migrations.migrate()
+
+    def sequential(question, language):
+        found = intents.extract(question)
+        return tuple(provider(found, language) if getattr(found, name) else ""
+                     for name, provider in gemini_integration._CONTEXT_PROVIDERS)
+
+    def run(label, gather):
+        timings = []
+        sections = []
+        for _ in range(args.rounds):
+            for question, language in _CONTEXT_QUESTIONS:
+                for cache in list(ttl_cache._registry.values()):
+                    cache.clear()
+                started = time.perf_counter()
+                sections.append(gather(question, language))
+                timings.append((time.perf_counter() - started) * 1000)
+        filled = sum(1 for section in itertools.chain.from_iterable(sections) if section)
+        print(f"  {label:<44} p50={_percentile(timings, 50):7.1f} ms  max={max(timings):7.1f} ms  "
+              f"sections filled={filled}")
+        return sections
+
+    print(f"{len(_CONTEXT_QUESTIONS)} questions x {args.rounds} rounds; weather upstream {args.weather_ms:.0f} ms, "
+          f"market upstream {args.market_ms:.0f} ms, deadline {args.deadline_ms:.0f} ms\n")
+    before = run("one after another", sequential)
+    after = run("concurrent", gemini_integration._gather_context)
+    assert before == after, "concurrent gathering produced different sections"
+    delays["weather"] = args.slow_weather_ms / 1000
+    run(f"concurrent, weather upstream at {args.slow_weather_ms:.0f} ms", gemini_integration._gather_context)
+
+    # Let the abandoned slow lookups finish, so their timings are in too
+    gemini_integration._context_pool().shutdown(wait=True)
+    print("\n  per-provider timings (as reported under latency in /api/stats)")
+    for name, snapshot in latency.all_stats().items():
+        if name.startswith("context_"):
+            print(f"    {name:<20} n={snapshot['count']:<4} p50={snapshot.get('p50_ms', 0):7.1f} ms  "
+                  f"max={snapshot.get('max_ms', 0):7.1f} ms")
+    print(f"  late per provider: { {name: counts['late'] for name, counts in gemini_integration.stats()['context'].items()} }")
+    weather_stub.shutdown()
+    market_stub.shutdown()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Kisaan Academy backend benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("concurrency", help="Event-loop blocking vs. async DB offload")
+    p.add_argument("--clients", type=int, default=200)
+    p.add_argument("--requests", type=int, default=6, help="Requests per client")
+    p.add_argument("--rows", type=int, default=100_000, help="market_prices rows to seed")
+    p.add_argument("--write-hold-ms", type=float, default=40.0, help="How long the simulated ingest job holds the write lock")
+    p.add_argument("--write-every-ms", type=float, default=100.0)
+    p.add_argument("--with-scan", action="store_true",
+                   help="Mix in CPU-bound LIKE scans (only parallelise on multi-core hosts)")
+    p.set_defaults(func=bench_concurrency)
+
+    p = sub.add_parser("price-queries", help="Assert index usage and time market_prices lookups")
+    p.add_argument("--rows", type=int, default=500_000)
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_price_queries)
+
+    p = sub.add_parser("search", help="FTS5 search latency on a large bilingual corpus")
+    p.add_argument("--docs", type=int, default=100_000)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("startup", help="Migration/version-check cost at worker start")
+    p.add_argument("--workers", type=int, default=8, help="Worker processes started at once")
+    p.add_argument("--repeat", type=int, default=1000)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("ingest", help="Bulk market price upsert throughput")
+    p.add_argument("--rows", type=int, default=50_000)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("price-history", help="Daily history from raw rows vs. rollup tables")
+    p.add_argument("--years", type=int, default=3)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_price_history)
+
+    p = sub.add_parser("chat-history", help="Chat persistence cost on the response path")
+    p.add_argument("--messages", type=int, default=5000)
+    p.set_defaults(func=bench_chat_history)
+
+    p = sub.add_parser("market-fetch", help="Commodity refresh: sequential vs. pooled concurrent fetch")
+    p.add_argument("--latency-ms", type=float, default=150.0, help="Stub response time per request")
+    p.add_argument("--slow-ms", type=float, default=400.0, help="Response time of the slowest commodity")
+    p.add_argument("--handshake-ms", type=float, default=100.0, help="Simulated TLS setup per new connection")
+    p.add_argument("--flaky", default="cotton", help="Comma-separated commodities whose first request fails (503)")
+    p.add_argument("--timeout", type=float, default=8.0, help="Per-commodity deadline (KISAAN_MARKET_TIMEOUT)")
+    p.add_argument("--refreshes", type=int, default=3)
+    p.set_defaults(func=bench_market_fetch)
+
+    p = sub.add_parser("weather-sweep", help="Multi-city weather sweep: sequential vs. concurrent with a deadline")
+    p.add_argument("--locations", type=int, default=120, help="Healthy locations in the largest sweep")
+    p.add_argument("--latency-ms", type=float, default=250.0, help="Stub response time per request")
+    p.add_argument("--handshake-ms", type=float, default=50.0, help="Simulated TLS setup per new connection")
+    p.add_argument("--stalled", type=int, default=5, help="Locations that never answer within the deadline")
+    p.add_argument("--stall-s", type=float, default=30.0)
+    p.add_argument("--deadline", type=float, default=3.0, help="Global sweep deadline in seconds")
+    p.set_defaults(func=bench_weather_sweep)
+
+    p = sub.add_parser("weather-cache", help="Upstream weather calls with the shared observation cache")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--threads", type=int, default=100)
+    p.add_argument("--latency-ms", type=float, default=300.0, help="Stub response time per request")
+    p.add_argument("--ttl", type=float, default=2.0, help="KISAAN_WEATHER_TTL for the run")
+    p.set_defaults(func=bench_weather_cache)
+
+    p = sub.add_parser("refresh-jobs", help="Background refresh jobs across workers vs. GET latency")
+    p.add_argument("--workers", type=int, default=3)
+    p.add_argument("--interval", type=int, default=5, help="Refresh interval for both jobs (seconds)")
+    p.add_argument("--upstream-ms", type=float, default=2000.0, help="Stub response time per request")
+    p.add_argument("--seconds", type=int, default=20)
+    p.set_defaults(func=bench_refresh_jobs)
+
+    p = sub.add_parser("upstream-outage", help="Chat-path upstream lookups during an outage with circuit breakers")
+    p.add_argument("--lookups", type=int, default=30, help="Distinct cities looked up during the outage")
+    p.add_argument("--latency-ms", type=float, default=100.0, help="Stub response time while healthy")
+    p.add_argument("--stall-s", type=float, default=30.0, help="How long requests hang during the outage")
+    p.add_argument("--timeout", type=float, default=1.0, help="KISAAN_WEATHER_TIMEOUT / KISAAN_MARKET_TIMEOUT")
+    p.add_argument("--open-s", type=float, default=3.0, help="KISAAN_BREAKER_OPEN_S for the run")
+    p.add_argument("--negative-ttl", type=float, default=30.0, help="KISAAN_NEGATIVE_TTL for the run")
+    p.set_defaults(func=bench_upstream_outage)
+
+    p = sub.add_parser("replay", help="Record integrations, then load-test /api/chat offline from fixtures")
+    p.add_argument("--requests", type=int, default=600)
+    p.add_argument("--clients", type=int, default=32)
+    p.add_argument("--upstream-ms", type=float, default=150.0, help="Weather/market latency (recorded and replayed)")
+    p.add_argument("--gemini-ms", type=float, default=800.0, help="Gemini latency (recorded and replayed)")
+    p.add_argument("--error-rate", type=float, default=0.2, help="KISAAN_REPLAY_ERROR_RATE for the second run")
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("alert-rules", help="Weather alert rules: per-city vs. one batch")
+    p.add_argument("--locations", type=int, default=150)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_alert_rules)
+
+    p = sub.add_parser("weather-batch", help="Many-city weather: one call per city vs. one batch call")
+    p.add_argument("--locations", type=int, default=300)
+    p.add_argument("--clients", type=int, default=8, help="Client threads for the per-city calls")
+    p.add_argument("--latency-ms", type=float, default=150.0, help="Stub response time per request")
+    p.add_argument("--per-location-ms", type=float, default=2.0, help="Extra stub time per bulk location")
+    p.set_defaults(func=bench_weather_batch)
+
+    p = sub.add_parser("gazetteer", help="Place names snapped to weather stations; KD-tree vs. linear scan")
+    p.add_argument("--points", type=int, default=100000)
+    p.set_defaults(func=bench_gazetteer)
+
+    p = sub.add_parser("chat-stream", help="Chat time to first byte: buffered answer vs. SSE streaming")
+    p.add_argument("--requests", type=int, default=60)
+    p.add_argument("--clients", type=int, default=6)
+    p.add_argument("--gemini-ms", type=float, default=3000.0, help="Recorded generation time per answer")
+    p.add_argument("--first-chunk-ms", type=float, default=400.0, help="Recorded time to Gemini's first chunk")
+    p.add_argument("--pieces", type=int, default=12, help="Chunks per recorded answer")
+    p.set_defaults(func=bench_chat_stream)
+
+    p = sub.add_parser("gemini-async", help="Concurrent chats: sync Gemini on the threadpool vs. async client")
+    p.add_argument("--chats", type=int, default=200)
+    p.add_argument("--gemini-ms", type=float, default=2000.0, help="Replayed Gemini latency per answer")
+    p.add_argument("--limit", type=int, default=64, help="KISAAN_GEMINI_CONCURRENCY for the async run")
+    p.set_defaults(func=bench_gemini_async)
+
+    p = sub.add_parser("answer-cache", help="Repeated chat questions with and without the answer cache")
+    p.add_argument("--chats", type=int, default=600)
+    p.add_argument("--clients", type=int, default=20)
+    p.add_argument("--gemini-ms", type=float, default=1500.0, help="Replayed Gemini latency per answer")
+    p.set_defaults(func=bench_answer_cache)
+
+    p = sub.add_parser("intents", help="Intent/entity extraction: keyword-list scans vs. Aho-Corasick")
+    p.add_argument("--messages", type=int, default=20000)
+    p.add_argument("--rounds", type=int, default=5)
+    p.set_defaults(func=bench_intents)
+
+    p = sub.add_parser("context-deadline", help="Chat context lookups: sequential vs. concurrent under a deadline")
+    p.add_argument("--rounds", type=int, default=10)
+    p.add_argument("--weather-ms", type=float, default=400.0, help="Weather upstream latency")
+    p.add_argument("--market-ms", type=float, default=300.0, help="Market upstream latency")
+    p.add_argument("--slow-weather-ms", type=float, default=5000.0, help="Weather latency for the deadline run")
+    p.add_argument("--deadline-ms", type=float, default=1500.0, help="KISAAN_CONTEXT_DEADLINE_MS")
+    p.set_defaults(func=bench_context_deadline)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    cli()
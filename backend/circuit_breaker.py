@@ -0,0 +1,143 @@
+"""
+Circuit Breaker for Upstream APIs
+Fails fast while an upstream is erroring or slow, then probes for recovery
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# Defaults for every breaker (per-upstream overrides go to the constructor)
+FAILURE_RATE = float(os.getenv("KISAAN_BREAKER_FAILURE_RATE", "0.5"))
+SLOW_CALL_MS = float(os.getenv("KISAAN_BREAKER_SLOW_MS", "5000"))
+SLOW_CALL_RATE = float(os.getenv("KISAAN_BREAKER_SLOW_RATE", "0.5"))
+WINDOW_SIZE = int(os.getenv("KISAAN_BREAKER_WINDOW", "20"))
+MIN_CALLS = int(os.getenv("KISAAN_BREAKER_MIN_CALLS", "5"))
+OPEN_SECONDS = float(os.getenv("KISAAN_BREAKER_OPEN_S", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_registry: Dict[str, "CircuitBreaker"] = {}
+_registry_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker over a sliding window of recent calls.
+
+    - Closed: calls go through. Once the window holds at least `min_calls`
+      outcomes and the failure rate or the slow-call rate (calls taking
+      `slow_call_ms` or longer) reaches its threshold, the breaker opens.
+    - Open: allow() refuses every call for `open_seconds`.
+    - Half-open: one probe call is let through. Success (and not slow)
+      closes the breaker with an empty window; anything else reopens it.
+
+    Callers ask allow() before a call and report it with record().
+    """
+
+    def __init__(self, name: str, failure_rate: float = FAILURE_RATE, slow_call_ms: float = SLOW_CALL_MS,
+                 slow_call_rate: float = SLOW_CALL_RATE, window_size: int = WINDOW_SIZE,
+                 min_calls: int = MIN_CALLS, open_seconds: float = OPEN_SECONDS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._window = deque(maxlen=window_size)  # (failed, slow) per call
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None  # monotonic start of the half-open probe
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+        with _registry_lock:
+            _registry[name] = self
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may go upstream now (claims the probe when half-open)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probe_started = None
+            if self._state == CLOSED:
+                return True
+            # A probe that never reported back does not block recovery forever
+            if self._state == HALF_OPEN and (self._probe_started is None
+                                             or now - self._probe_started >= self.open_seconds):
+                self._probe_started = now
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record(self, success: bool, elapsed_ms: float):
+        """
+        Report the outcome of a call that allow() let through.
+
+        Args:
+            success: False for connection errors, timeouts and 5xx/429
+            elapsed_ms: Wall-clock duration of the call
+        """
+        slow = elapsed_ms >= self.slow_call_ms
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["failures"] += not success
+            self._stats["slow_calls"] += slow
+            if self._state == HALF_OPEN:
+                self._probe_started = None
+                if success and not slow:
+                    self._state = CLOSED
+                    self._window.clear()
+                    print(f"✓ {self.name} circuit closed (probe succeeded)")
+                else:
+                    self._trip()
+                return
+            if self._state != CLOSED:
+                return  # a call that started before the breaker opened
+            self._window.append((not success, slow))
+            if len(self._window) < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._window if failed)
+            slows = sum(1 for _, was_slow in self._window if was_slow)
+            if failures / len(self._window) >= self.failure_rate or slows / len(self._window) >= self.slow_call_rate:
+                self._trip()
+
+    def _trip(self):
+        # Caller holds self._lock
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._stats["opened"] += 1
+        print(f"⚠ {self.name} circuit open for {self.open_seconds:.0f}s")
+
+    def retry_after(self) -> Optional[float]:
+        """Seconds until an open breaker lets a probe through (None unless open)."""
+        with self._lock:
+            if self._state != OPEN:
+                return None
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def stats(self) -> Dict:
+        """State and counters for /api/stats."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["state"] = self._state
+            snapshot["window_calls"] = len(self._window)
+            snapshot["window_failures"] = sum(1 for failed, _ in self._window if failed)
+        snapshot["retry_after_s"] = self.retry_after()
+        return snapshot
+
+
+def all_stats() -> Dict[str, Dict]:
+    """Stats for every breaker created in this process, keyed by name."""
+    with _registry_lock:
+        breakers = list(_registry.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
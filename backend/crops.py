@@ -0,0 +1,76 @@
+"""
+Crop Name Normalization
+Canonical crop keys shared by market prices, ingestion and the chatbot
+"""
+
+from typing import Dict, Optional
+
+# Canonical key -> display names, RapidAPI commodity name and known aliases
+CROPS: Dict[str, Dict] = {
+    "wheat": {"ur": "گندم", "en": "Wheat", "api": "wheat", "aliases": ["wheat", "گندم"]},
+    "rice": {"ur": "چاول", "en": "Rice", "api": "rice", "aliases": ["rice", "چاول", "paddy", "دھان"]},
+    "cotton": {"ur": "کپاس", "en": "Cotton", "api": "cotton", "aliases": ["cotton", "کپاس", "پھٹی"]},
+    "sugar": {"ur": "چینی", "en": "Sugar", "api": "sugar", "aliases": ["sugar", "چینی"]},
+    "corn": {"ur": "مکئی", "en": "Corn", "api": "corn", "aliases": ["corn", "maize", "مکئی"]},
+    "soybeans": {"ur": "سویا بین", "en": "Soybeans", "api": "soybeans", "aliases": ["soybeans", "soybean", "سویا بین"]},
+    "palm-oil": {"ur": "پام آئل", "en": "Palm Oil", "api": "palm-oil", "aliases": ["palm-oil", "palm oil", "پام آئل"]},
+    "sunflower-oil": {"ur": "سورج مکھی کا تیل", "en": "Sunflower Oil", "api": "sunflower-oil",
+                      "aliases": ["sunflower-oil", "sunflower oil", "سورج مکھی کا تیل"]},
+    "rapeseed-oil": {"ur": "سرسوں کا تیل", "en": "Rapeseed Oil", "api": "rapeseed-oil",
+                     "aliases": ["rapeseed-oil", "rapeseed oil", "سرسوں کا تیل"]},
+}
+
+# Alias -> canonical key, built once at import
+_ALIAS_TO_KEY: Dict[str, str] = {
+    alias.lower(): key for key, info in CROPS.items() for alias in info["aliases"] + [info["en"]]
+}
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.strip().lower().split())
+
+
+def crop_key(name: Optional[str]) -> Optional[str]:
+    """
+    Map an Urdu/English crop name to its canonical key.
+
+    Unknown crops fall back to their normalized name so every row still
+    gets a stable, indexable key.
+
+    Args:
+        name: Crop name in Urdu or English (e.g., "گندم", "Wheat", "maize")
+
+    Returns:
+        Canonical key (e.g., "wheat") or None for empty input
+    """
+    if not name:
+        return None
+    normalized = _normalize(name)
+    return _ALIAS_TO_KEY.get(normalized, normalized)
+
+
+def find_crop_key(text: str) -> Optional[str]:
+    """
+    Loose lookup: return the first known crop whose alias appears in text.
+
+    Args:
+        text: Free text or partial crop name
+
+    Returns:
+        Canonical key or None if no known crop matches
+    """
+    normalized = _normalize(text)
+    if normalized in _ALIAS_TO_KEY:
+        return _ALIAS_TO_KEY[normalized]
+    for alias, key in _ALIAS_TO_KEY.items():
+        if normalized in alias or alias in normalized:
+            return key
+    return None
+
+
+def display_name(key: str, language: str = "ur") -> str:
+    """Return the display name for a canonical key (falls back to the key)."""
+    info = CROPS.get(key)
+    if not info:
+        return key
+    return info["ur"] if language == "ur" else info["en"]
@@ -0,0 +1,306 @@
+"""
+Shared SQLite Connection Manager
+One pool for main.py and all integration modules
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Database configuration
+DATABASE = os.getenv("KISAAN_DB_PATH", "kisaan_academy.db")
+DB_MMAP_SIZE = int(os.getenv("KISAAN_DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # 256 MB
+DB_CACHE_SIZE_KB = int(os.getenv("KISAAN_DB_CACHE_SIZE_KB", "32768"))  # 32 MB page cache per connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv("KISAAN_DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Async access: reads are offloaded to a bounded thread pool and writes to a
+# single writer thread, so DB work never runs on the event loop and queued
+# writes can never occupy the read workers. Set KISAAN_DB_OFFLOAD=0 to run
+# queries inline (only useful for benchmarking the difference).
+DB_MAX_WORKERS = int(os.getenv("KISAAN_DB_MAX_WORKERS", "8"))
+OFFLOAD = os.getenv("KISAAN_DB_OFFLOAD", "1") != "0"
+
+
+def _configure(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply the performance pragmas every pooled connection shares."""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    # Negative cache_size is interpreted by SQLite as KiB instead of pages
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class ConnectionPool:
+    """
+    Per-thread reader connections plus a single serialized writer.
+
+    WAL mode lets readers run concurrently with the writer, so each thread
+    keeps its own long-lived reader connection. All writes go through one
+    connection guarded by a lock, which avoids SQLITE_BUSY contention between
+    writers inside the process.
+    """
+
+    def __init__(self, database: str = DATABASE):
+        self.database = database
+        self._local = threading.local()
+        self._readers: Dict[int, sqlite3.Connection] = {}
+        self._readers_lock = threading.Lock()
+        self._writer: sqlite3.Connection = None
+        self._writer_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "reader_connections_opened": 0,
+            "reader_checkouts": 0,
+            "writer_connections_opened": 0,
+            "writer_transactions": 0,
+            "writer_rollbacks": 0,
+            "writer_wait_ms_total": 0.0,
+            "writer_wait_ms_max": 0.0,
+        }
+
+    def _bump(self, key: str, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _open(self) -> sqlite3.Connection:
+        # Each connection is only used by one thread at a time; disabling the
+        # check lets close() run from whichever thread shuts the pool down
+        conn = sqlite3.connect(self.database, check_same_thread=False)
+        return _configure(conn)
+
+    @contextmanager
+    def reader(self):
+        """
+        Borrow this thread's reader connection.
+
+        Yields:
+            sqlite3.Connection with row_factory set to sqlite3.Row
+        """
+        conn = getattr(self._local, "reader", None)
+        if conn is None:
+            conn = self._open()
+            self._local.reader = conn
+            with self._readers_lock:
+                self._readers[threading.get_ident()] = conn
+            self._bump("reader_connections_opened")
+        self._bump("reader_checkouts")
+        yield conn
+
+    @contextmanager
+    def writer(self):
+        """
+        Hold the single writer connection for one transaction.
+
+        Commits when the block exits normally and rolls back otherwise,
+        including on KeyboardInterrupt or GeneratorExit, so the shared
+        writer never stays inside a transaction.
+
+        Yields:
+            sqlite3.Connection with row_factory set to sqlite3.Row
+        """
+        started = time.perf_counter()
+        with self._writer_lock:
+            waited_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                self._stats["writer_wait_ms_total"] += waited_ms
+                self._stats["writer_wait_ms_max"] = max(self._stats["writer_wait_ms_max"], waited_ms)
+
+            if self._writer is None:
+                self._writer = self._open()
+                self._bump("writer_connections_opened")
+
+            # Nested writer() blocks on the same thread join the outer transaction
+            if self._writer.in_transaction:
+                yield self._writer
+                return
+
+            try:
+                yield self._writer
+                self._writer.commit()
+                self._bump("writer_transactions")
+            except BaseException:
+                self._writer.rollback()
+                self._bump("writer_rollbacks")
+                raise
+
+    def stats(self) -> Dict:
+        """Return a snapshot of pool counters."""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        with self._readers_lock:
+            snapshot["reader_connections_open"] = len(self._readers)
+        snapshot["writer_connection_open"] = self._writer is not None
+        snapshot["database"] = self.database
+        snapshot["writer_wait_ms_total"] = round(snapshot["writer_wait_ms_total"], 3)
+        snapshot["writer_wait_ms_max"] = round(snapshot["writer_wait_ms_max"], 3)
+        return snapshot
+
+    def close(self):
+        """Close every connection owned by the pool."""
+        with self._readers_lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+        for conn in readers:
+            conn.close()
+        self._local = threading.local()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+# Process-wide pool shared by every module
+pool = ConnectionPool()
+
+
+def reader():
+    """Shortcut for pool.reader()."""
+    return pool.reader()
+
+
+def writer():
+    """Shortcut for pool.writer()."""
+    return pool.writer()
+
+
+def utc_timestamp(value=None) -> Optional[str]:
+    """
+    Format a timestamp the way SQLite's CURRENT_TIMESTAMP does: UTC
+    'YYYY-MM-DD HH:MM:SS'. Every stored timestamp uses this so text range
+    comparisons against datetime('now', ...) hold.
+
+    Args:
+        value: datetime or ISO-8601 string (naive values are local time);
+            None means now
+
+    Returns:
+        Formatted timestamp, or the original value if it cannot be parsed
+    """
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip())
+        except ValueError:
+            return value
+    if value.tzinfo is None:
+        value = value.astimezone()  # interpret naive values as local time
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def pool_stats() -> Dict:
+    """Shortcut for pool.stats() plus async executor counters."""
+    snapshot = pool.stats()
+    snapshot["async_read_workers"] = DB_MAX_WORKERS
+    snapshot["async_in_flight"] = _in_flight
+    snapshot["async_offload"] = OFFLOAD
+    return snapshot
+
+
+# ---------------------------------------------------------------------------
+# Async data-access layer
+# ---------------------------------------------------------------------------
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executor_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def _tracked(fn: Callable, *args) -> Any:
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        return fn(*args)
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def _get_executor(kind: str) -> ThreadPoolExecutor:
+    with _executor_lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            workers = DB_MAX_WORKERS if kind == "read" else 1
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"kisaan-db-{kind}")
+            _executors[kind] = executor
+        return executor
+
+
+async def _submit(kind: str, fn: Callable, *args) -> Any:
+    if not OFFLOAD:
+        return _tracked(fn, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(kind), _tracked, fn, *args)
+
+
+def _read_call(fn: Callable, args) -> Any:
+    with pool.reader() as conn:
+        return fn(conn, *args)
+
+
+def _write_call(fn: Callable, args) -> Any:
+    with pool.writer() as conn:
+        return fn(conn, *args)
+
+
+async def run_read(fn: Callable, *args) -> Any:
+    """
+    Run fn(conn, *args) with a reader connection on the DB thread pool.
+
+    Args:
+        fn: Callable taking a sqlite3.Connection followed by args
+
+    Returns:
+        Whatever fn returns
+    """
+    return await _submit("read", _read_call, fn, args)
+
+
+async def run_write(fn: Callable, *args) -> Any:
+    """
+    Run fn(conn, *args) inside one writer transaction on the DB thread pool.
+
+    Args:
+        fn: Callable taking a sqlite3.Connection followed by args
+
+    Returns:
+        Whatever fn returns
+    """
+    return await _submit("write", _write_call, fn, args)
+
+
+async def fetch_all(query: str, params: Sequence = ()) -> List[sqlite3.Row]:
+    """Run a SELECT off the event loop and return all rows."""
+    return await run_read(lambda conn: conn.execute(query, params).fetchall())
+
+
+async def fetch_one(query: str, params: Sequence = ()) -> Optional[sqlite3.Row]:
+    """Run a SELECT off the event loop and return the first row (or None)."""
+    return await run_read(lambda conn: conn.execute(query, params).fetchone())
+
+
+async def execute(query: str, params: Sequence = ()) -> int:
+    """Run one write statement off the event loop and return lastrowid."""
+    return await run_write(lambda conn: conn.execute(query, params).lastrowid)
+
+
+def shutdown():
+    """Stop the DB thread pools and close all pooled connections."""
+    with _executor_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+    pool.close()
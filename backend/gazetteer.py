@@ -0,0 +1,189 @@
+"""
+Pakistan Gazetteer
+Districts and tehsils with coordinates, snapped to canonical weather points
+"""
+
+import csv
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+GAZETTEER_PATH = os.getenv(
+    "KISAAN_GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "pk_gazetteer.csv")
+)
+
+# Planar distances are measured on an equirectangular projection around
+# Pakistan's mid-latitude; over 24-37°N this ranks neighbours like the
+# great-circle distance to within a few percent
+_COS_LAT = math.cos(math.radians(30.0))
+
+_SEPARATORS = re.compile(r"[\s.\-_,]+")
+
+
+@dataclass(frozen=True, slots=True)
+class Place:
+    """One gazetteer row: a province, district or tehsil."""
+    name: str
+    name_ur: str
+    kind: str
+    province: str
+    district: str
+    lat: float
+    lon: float
+    station: bool
+
+    @property
+    def query(self) -> str:
+        """WeatherAPI query for this place: coordinates, so names like Hyderabad stay unambiguous."""
+        return f"{self.lat:.4f},{self.lon:.4f}"
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case and fold dots, dashes and repeated spaces ("D.G.  Khan" -> "d g khan")."""
+    return _SEPARATORS.sub(" ", name.strip().lower()).strip()
+
+
+def _xy(lat: float, lon: float) -> Tuple[float, float]:
+    return lon * _COS_LAT, lat
+
+
+class KDTree:
+    """
+    Static 2-d tree over points, for nearest-neighbour queries in O(log n).
+
+    Built once by splitting on the median x/y alternately; nodes are kept in
+    flat lists (left/right child indexes, -1 for none).
+    """
+
+    def __init__(self, points: List[Tuple[float, float]]):
+        self._points = points
+        self._index: List[int] = []
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._root = self._build(list(range(len(points))), 0)
+
+    def _build(self, ids: List[int], depth: int) -> int:
+        if not ids:
+            return -1
+        axis = depth % 2
+        ids.sort(key=lambda i: self._points[i][axis])
+        middle = len(ids) // 2
+        node = len(self._index)
+        self._index.append(ids[middle])
+        self._left.append(-1)
+        self._right.append(-1)
+        self._left[node] = self._build(ids[:middle], depth + 1)
+        self._right[node] = self._build(ids[middle + 1:], depth + 1)
+        return node
+
+    def nearest(self, x: float, y: float) -> Tuple[int, float]:
+        """
+        Index of the point closest to (x, y) and its squared distance.
+
+        Raises:
+            ValueError: if the tree is empty
+        """
+        if self._root < 0:
+            raise ValueError("empty KDTree")
+        points, index, left, right = self._points, self._index, self._left, self._right
+        best, best_d2 = -1, math.inf
+        stack = [(self._root, 0, 0.0)]  # (node, split axis, lower bound on squared distance to its subtree)
+        while stack:
+            node, axis, bound = stack.pop()
+            # A far subtree can only hold a closer point if its splitting line is nearer than the best so far
+            if node < 0 or bound >= best_d2:
+                continue
+            px, py = points[index[node]]
+            d2 = (px - x) ** 2 + (py - y) ** 2
+            if d2 < best_d2:
+                best, best_d2 = index[node], d2
+            diff = (x - px) if axis == 0 else (y - py)
+            near, far = (left[node], right[node]) if diff < 0 else (right[node], left[node])
+            stack.append((far, 1 - axis, diff * diff))
+            stack.append((near, 1 - axis, 0.0))
+        return best, best_d2
+
+
+class Gazetteer:
+    """
+    Place names (English, Urdu and aliases) -> places, and places -> the
+    nearest weather station.
+
+    Stations are the rows flagged station=1: the canonical points weather
+    is fetched and cached for. Every named place is snapped to its nearest
+    station once, at load, so resolving a name is a dictionary lookup and
+    all the districts and tehsils around a station share its cached
+    observation. Arbitrary coordinates go through the KD-tree. Province rows
+    carry their capital's coordinates, so "Punjab" means Lahore's weather.
+    """
+
+    def __init__(self, places: List[Place], aliases: Dict[str, Place]):
+        self.places = places
+        self.stations = [place for place in places if place.station]
+        self._by_name = aliases
+        self._tree = KDTree([_xy(s.lat, s.lon) for s in self.stations])
+        self._snapped: Dict[Place, Place] = {}
+        if self.stations:
+            for place in places:
+                self._snapped[place] = place if place.station else self.nearest_station(place.lat, place.lon)
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        """Read the bundled CSV (name, name_ur, aliases, kind, province, district, lat, lon, station)."""
+        places: List[Place] = []
+        aliases: Dict[str, Place] = {}
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                place = Place(
+                    name=row["name"],
+                    name_ur=row["name_ur"],
+                    kind=row["kind"],
+                    province=row["province"],
+                    district=row["district"],
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    station=row["station"] == "1",
+                )
+                places.append(place)
+                names = [place.name, place.name_ur] + row["aliases"].split("|")
+                for name in filter(None, names):
+                    # The first row to claim a spelling keeps it (districts are listed before tehsils)
+                    aliases.setdefault(normalize_name(name), place)
+        return cls(places, aliases)
+
+    def lookup(self, name: str) -> Optional[Place]:
+        """Place for an English/Urdu name or alias, or None if it is not in the gazetteer."""
+        return self._by_name.get(normalize_name(name))
+
+    def names(self) -> Dict[str, Place]:
+        """Every normalized name and alias, mapped to its place."""
+        return dict(self._by_name)
+
+    def nearest_station(self, lat: float, lon: float) -> Place:
+        """Weather station closest to a coordinate."""
+        index, _ = self._tree.nearest(*_xy(lat, lon))
+        return self.stations[index]
+
+    def station_for(self, name: str) -> Optional[Place]:
+        """Weather station serving a named place, or None for unknown names."""
+        place = self.lookup(name)
+        return self._snapped.get(place) if place else None
+
+    def station_named(self, name: str) -> Optional[Place]:
+        """The station with this canonical name, if it is one."""
+        place = self._by_name.get(normalize_name(name))
+        return place if place is not None and place.station else None
+
+
+try:
+    _gazetteer = Gazetteer.load()
+except (OSError, KeyError, ValueError) as e:
+    print(f"⚠ Could not load gazetteer from {GAZETTEER_PATH}: {e}")
+    _gazetteer = Gazetteer([], {})
+
+
+def get() -> Gazetteer:
+    """The process-wide gazetteer (loaded once at import)."""
+    return _gazetteer
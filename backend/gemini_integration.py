@@ -6,9 +6,21 @@ To use this, you'll need to:
 3. Set environment variable: export GEMINI_API_KEY=your_key_here
 """
 
+import asyncio
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from contextlib import asynccontextmanager
 import google.generativeai as genai
-from typing import Optional, Tuple
+import answer_cache
+import db
+import intents
+import latency
+from crops import crop_key
+import search
+import transport
+from typing import AsyncIterator, Dict, Iterator, Optional, Tuple
 
 # Load environment variables from .env file if available
 try:
@@ -74,6 +86,24 @@ else:
     print("   Set it with: $env:GEMINI_API_KEY='your_key_here' (Windows PowerShell)")
     print("   Or: export GEMINI_API_KEY='your_key_here' (Linux/Mac)")
 
+# KISAAN_TRANSPORT=record saves Gemini answers as fixtures; replay serves
+# them back without an API key (see transport.py)
+model = transport.wrap_model(model)
+
+# Async chat path: Gemini calls in flight per worker (further calls wait for
+# a slot), and threads for the blocking context lookups (weather HTTP, SQLite)
+GEMINI_CONCURRENCY = int(os.getenv("KISAAN_GEMINI_CONCURRENCY", "64"))
+# KISAAN_GEMINI_ASYNC=0 sends chats through the sync functions on the threadpool instead
+GEMINI_ASYNC = os.getenv("KISAAN_GEMINI_ASYNC", "1") != "0"
+CONTEXT_WORKERS = int(os.getenv("KISAAN_CONTEXT_WORKERS", "32"))
+# Longest an async Gemini call (or the gap between two streamed chunks) may
+# take before the chat gives up and answers with the fallback
+GEMINI_TIMEOUT = float(os.getenv("KISAAN_GEMINI_TIMEOUT", "20"))
+# Weather, price and pest lookups for one question run side by side and get
+# this long in total; a lookup still running then is left out of the prompt
+# (0 waits for all of them)
+CONTEXT_DEADLINE_MS = float(os.getenv("KISAAN_CONTEXT_DEADLINE_MS", "3000"))
+
 
 def detect_price_query(question: str) -> Tuple[bool, Optional[str]]:
     """
@@ -82,40 +112,8 @@ def detect_price_query(question: str) -> Tuple[bool, Optional[str]]:
     Returns:
         (is_price_query: bool, crop_name: Optional[str])
     """
-    question_lower = question.lower()
-    
-    # Price-related keywords
-    price_keywords = [
-        "price", "قیمت", "قیمتوں",
-        "market", "مارکیٹ", "بازار",
-        "rate", "ریٹ", "فیس",
-        "cost", "لاگت",
-        "expensive", "مہنگا", "cheap", "سستا",
-        "wheat price", "گندم کی قیمت",
-        "rice price", "چاول کی قیمت",
-        "cotton price", "کپاس کی قیمت",
-        "sugar price", "چینی کی قیمت",
-    ]
-    
-    is_price = any(keyword in question_lower for keyword in price_keywords)
-    
-    if not is_price:
-        return False, None
-    
-    # Try to extract crop name
-    crops = {
-        "wheat": ["wheat", "گندم"],
-        "rice": ["rice", "چاول"],
-        "cotton": ["cotton", "کپاس"],
-        "sugar": ["sugar", "چینی", "sweet"],
-        "corn": ["corn", "مکئی", "maize"],
-    }
-    
-    for crop, keywords in crops.items():
-        if any(keyword in question_lower for keyword in keywords):
-            return True, crop
-    
-    return True, None  # Price query but no specific crop
+    found = intents.extract(question)
+    return found.price, found.market_crop if found.price else None
 
 
 def detect_pest_query(question: str) -> Tuple[bool, Optional[str]]:
@@ -125,52 +123,8 @@ def detect_pest_query(question: str) -> Tuple[bool, Optional[str]]:
     Returns:
         (is_pest_query: bool, pest_name: Optional[str])
     """
-    question_lower = question.lower()
-    
-    # Pest-related keywords
-    pest_keywords = [
-        "pest", "کیڑا", "کیڑے", "کیڑوں",
-        "insect", "حشرات",
-        "disease", "بیماری",
-        "aphid", "اپھیڈ",
-        "borer", "بورر",
-        "whitefly", "سفید مکھی",
-        "thrips", "تھرپس",
-        "jassid", "جیڈ",
-        "caterpillar", "کیٹر پلر",
-        "infestation", "انفیکشن",
-        "control", "کنٹرول",
-        "prevention", "بچاؤ", "روک تھام",
-        "treatment", "علاج",
-        "symptoms", "علامات", "نشانات",
-    ]
-    
-    is_pest = any(keyword in question_lower for keyword in pest_keywords)
-    
-    if not is_pest:
-        return False, None
-    
-    # Try to extract pest name
-    pests = {
-        "aphid": ["aphid", "اپھیڈ"],
-        "whitefly": ["whitefly", "سفید مکھی", "white fly"],
-        "borer": ["borer", "بورر", "stem borer", "ڈھڈا بورر"],
-        "thrips": ["thrips", "تھرپس"],
-        "jassid": ["jassid", "جیڈ"],
-        "armyworm": ["armyworm", "فال آرمی ورم"],
-        "leafhopper": ["leafhopper", "لیف ہوپر"],
-    }
-    
-    for pest, keywords in pests.items():
-        if any(keyword in question_lower for keyword in keywords):
-            return True, pest
-    
-    # Check for crop-specific pest queries
-    crops = ["wheat", "rice", "cotton", "corn", "گندم", "چاول", "کپاس", "مکئی"]
-    if any(crop in question_lower for crop in crops) and is_pest:
-        return True, None
-    
-    return True, None  # Pest query but no specific pest name
+    found = intents.extract(question)
+    return found.pest, found.pest_name
 
 
 def detect_weather_query(question: str) -> Tuple[bool, Optional[str]]:
@@ -180,164 +134,94 @@ def detect_weather_query(question: str) -> Tuple[bool, Optional[str]]:
     Returns:
         (is_weather_query: bool, city_name: Optional[str])
     """
-    question_lower = question.lower()
-    
-    # Weather-related keywords
-    weather_keywords = [
-        "weather", "موسم", "آب و ہوا",
-        "temperature", "درجہ حرارت", "ٹمپریچر", "گرمی", "سردی",
-        "rain", "بارش", "طوفان", "storm",
-        "humidity", "نمی", "humidity",
-        "wind", "ہوا", "wind speed",
-        "forecast", "پیشن گوئی", "پیش گوئی",
-        "hot", "گرم", "cold", "سرد",
-        "sunny", "دھوپ", "cloudy", "ابر آلود",
-    ]
-    
-    is_weather = any(keyword in question_lower for keyword in weather_keywords)
-    
-    # Extract city name
-    cities = [
-        "multan", "ملتان",
-        "lahore", "لاہور",
-        "karachi", "کراچی",
-        "islamabad", "اسلام آباد",
-        "peshawar", "پشاور",
-        "quetta", "کوئٹہ",
-        "faisalabad", "فیصل آباد",
-        "rawalpindi", "راولپنڈی",
-        "gujranwala", "گوجرانوالہ",
-        "sialkot", "سیالکوٹ",
-        "punjab", "پنجاب",
-        "sindh", "سندھ",
-        "kpk", "خیبر پختونخوا",
-        "balochistan", "بلوچستان",
-    ]
-    
-    city = None
-    for c in cities:
-        if c in question_lower:
-            # Extract the word that contains the city name
-            words = question_lower.split()
-            for word in words:
-                if c in word:
-                    city = c
-                    break
-            if city:
-                break
-    
-    return is_weather, city
+    found = intents.extract(question)
+    return found.weather, found.place
 
 
-def get_agri_response(question: str, language: str = "ur") -> str:
-    """
-    Get AI response from Gemini API for farming-related questions.
-    Now includes weather data integration for weather queries.
-    
-    Args:
-        question: User's question
-        language: Language preference ('ur' or 'en')
+def _weather_context(found: intents.Intents, language: str) -> str:
+    """Live weather for the city a weather question mentions (Lahore by default), or ""."""
+    # Check if this is a weather query
+    is_weather, city = found.weather, found.place
+    weather_info = ""
     
-    Returns:
-        AI-generated response
-    """
-    if not model:
-        # Fallback response if Gemini is not configured
-        return get_fallback_response(question, language)
-    
-    try:
-        # Check if this is a weather query
-        is_weather, city = detect_weather_query(question)
-        weather_info = ""
-        
-        if is_weather:
-            try:
-                from weather_integration import get_current_weather
-                
-                # If city is mentioned, get weather for that city
-                # Otherwise, try to extract city from question or default to Lahore
-                query_city = city if city else "Lahore"
-                
-                weather_data = get_current_weather(query_city)
-                
-                if weather_data:
-                    # Format weather data for Gemini
-                    if language == "ur":
-                        weather_info = f"""
-[موجودہ موسمی معلومات - {weather_data['city']}]
-درجہ حرارت: {weather_data['temperature_c']}°C (محسوس: {weather_data['feels_like_c']}°C)
-حالت: {weather_data['condition']}
-نمی: {weather_data['humidity']}%
-ہوا: {weather_data['wind_kph']} کلومیٹر/گھنٹہ ({weather_data['wind_dir']})
-دباؤ: {weather_data['pressure_mb']} mb
-بارش: {weather_data['precip_mm']} mm
-"""
-                        if "today" in weather_data:
-                            weather_info += f"آج: {weather_data['today']['min_temp_c']}°C - {weather_data['today']['max_temp_c']}°C, {weather_data['today']['condition']}\n"
-                        if "tomorrow" in weather_data:
-                            weather_info += f"کل: {weather_data['tomorrow']['min_temp_c']}°C - {weather_data['tomorrow']['max_temp_c']}°C, {weather_data['tomorrow']['condition']}\n"
-                    else:
-                        weather_info = f"""
-[Current Weather Information - {weather_data['city']}]
-Temperature: {weather_data['temperature_c']}°C (Feels like: {weather_data['feels_like_c']}°C)
-Condition: {weather_data['condition']}
-Humidity: {weather_data['humidity']}%
-Wind: {weather_data['wind_kph']} km/h ({weather_data['wind_dir']})
-Pressure: {weather_data['pressure_mb']} mb
-Precipitation: {weather_data['precip_mm']} mm
+    if is_weather:
+        try:
+            from weather_integration import fetch_observation
+            
+            # If city is mentioned, get weather for that city
+            # Otherwise, try to extract city from question or default to Lahore
+            query_city = city if city else "Lahore"
+            
+            weather = fetch_observation(query_city)
+            
+            if weather:
+                # Format weather data for Gemini
+                if language == "ur":
+                    weather_info = f"""
+[موجودہ موسمی معلومات - {weather.city}]
+درجہ حرارت: {weather.temperature_c}°C (محسوس: {weather.feels_like_c}°C)
+حالت: {weather.condition}
+نمی: {weather.humidity}%
+ہوا: {weather.wind_kph} کلومیٹر/گھنٹہ ({weather.wind_dir})
+دباؤ: {weather.pressure_mb} mb
+بارش: {weather.precip_mm} mm
 """
-                        if "today" in weather_data:
-                            weather_info += f"Today: {weather_data['today']['min_temp_c']}°C - {weather_data['today']['max_temp_c']}°C, {weather_data['today']['condition']}\n"
-                        if "tomorrow" in weather_data:
-                            weather_info += f"Tomorrow: {weather_data['tomorrow']['min_temp_c']}°C - {weather_data['tomorrow']['max_temp_c']}°C, {weather_data['tomorrow']['condition']}\n"
-                    
-                    print(f"✓ Fetched weather data for {weather_data['city']}")
+                    if weather.today:
+                        weather_info += f"آج: {weather.today.min_temp_c}°C - {weather.today.max_temp_c}°C, {weather.today.condition}\n"
+                    if weather.tomorrow:
+                        weather_info += f"کل: {weather.tomorrow.min_temp_c}°C - {weather.tomorrow.max_temp_c}°C, {weather.tomorrow.condition}\n"
                 else:
-                    weather_info = "\n[Weather data not available at the moment.]\n" if language == "en" else "\n[موسمی معلومات فی الوقت دستیاب نہیں۔]\n"
-            except ImportError:
-                weather_info = ""
-            except Exception as e:
-                print(f"Error fetching weather: {e}")
-                weather_info = ""
-        
-        # Check if this is a pest query
-        question_lower = question.lower()
-        is_pest, pest_name = detect_pest_query(question)
-        pest_info = ""
-        
-        if is_pest:
-            try:
-                import sqlite3
-                conn = sqlite3.connect("kisaan_academy.db")
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
+                    weather_info = f"""
+[Current Weather Information - {weather.city}]
+Temperature: {weather.temperature_c}°C (Feels like: {weather.feels_like_c}°C)
+Condition: {weather.condition}
+Humidity: {weather.humidity}%
+Wind: {weather.wind_kph} km/h ({weather.wind_dir})
+Pressure: {weather.pressure_mb} mb
+Precipitation: {weather.precip_mm} mm
+"""
+                    if weather.today:
+                        weather_info += f"Today: {weather.today.min_temp_c}°C - {weather.today.max_temp_c}°C, {weather.today.condition}\n"
+                    if weather.tomorrow:
+                        weather_info += f"Tomorrow: {weather.tomorrow.min_temp_c}°C - {weather.tomorrow.max_temp_c}°C, {weather.tomorrow.condition}\n"
                 
+                print(f"✓ Fetched weather data for {weather.city}")
+            else:
+                weather_info = "\n[Weather data not available at the moment.]\n" if language == "en" else "\n[موسمی معلومات فی الوقت دستیاب نہیں۔]\n"
+        except ImportError:
+            weather_info = ""
+        except Exception as e:
+            print(f"Error fetching weather: {e}")
+            weather_info = ""
+    
+    return weather_info
+
+
+def _pest_context(found: intents.Intents, language: str) -> str:
+    """Pest alerts matching a pest question (by pest name or crop), or ""."""
+    # Check if this is a pest query
+    is_pest, pest_name = found.pest, found.pest_name
+    pest_info = ""
+    
+    if is_pest:
+        try:
+            with db.reader() as conn:
+                cursor = conn.cursor()
+            
                 if pest_name:
-                    # Search by pest name
-                    cursor.execute('''
+                    # Search by pest name (full-text index over Urdu/English names)
+                    pest_ids, pest_params = search.pest_ids_query(pest_name)
+                    cursor.execute(f'''
                         SELECT * FROM pest_alerts 
-                        WHERE pest_name_en LIKE ? OR pest_name_ur LIKE ?
+                        WHERE id IN ({pest_ids})
                         ORDER BY created_at DESC 
                         LIMIT 1
-                    ''', (f"%{pest_name}%", f"%{pest_name}%"))
+                    ''', pest_params)
                 else:
                     # Search by crop mentioned in question
-                    crop_keywords = {
-                        "wheat": ["wheat", "گندم"],
-                        "rice": ["rice", "چاول"],
-                        "cotton": ["cotton", "کپاس"],
-                        "corn": ["corn", "مکئی", "maize"],
-                        "vegetable": ["vegetable", "سبزی"],
-                    }
-                    
-                    found_crop = None
-                    for crop, keywords in crop_keywords.items():
-                        if any(keyword in question_lower for keyword in keywords):
-                            found_crop = crop
-                            break
-                    
-                    if found_crop:
-                        crop_ur = {"wheat": "گندم", "rice": "چاول", "cotton": "کپاس", "corn": "مکئی", "vegetable": "سبزی"}.get(found_crop, "")
+                    crop_ur = found.crop_ur
+                
+                    if crop_ur:
                         cursor.execute('''
                             SELECT * FROM pest_alerts 
                             WHERE crop_affected LIKE ?
@@ -351,123 +235,124 @@ Precipitation: {weather_data['precip_mm']} mm
                             ORDER BY created_at DESC 
                             LIMIT 3
                         ''')
-                
+            
                 pests = cursor.fetchall()
-                conn.close()
-                
-                if pests:
-                    if language == "ur":
-                        pest_info = "\n[کیڑوں کی تفصیلات]\n\n"
-                        for pest in pests:
-                            pest_info += f"**{pest['pest_name_ur']}** ({pest['crop_affected']})\n"
-                            pest_info += f"خطہ: {pest['region']}\n"
-                            pest_info += f"شدت: {pest['severity']}\n"
-                            if pest.get('symptoms_ur'):
-                                pest_info += f"علامات: {pest['symptoms_ur']}\n"
-                            if pest.get('prevention_ur'):
-                                pest_info += f"بچاؤ: {pest['prevention_ur']}\n"
-                            if pest.get('treatment_ur'):
-                                pest_info += f"علاج: {pest['treatment_ur']}\n"
-                            pest_info += "\n"
-                    else:
-                        pest_info = "\n[Pest Information]\n\n"
-                        for pest in pests:
-                            pest_info += f"**{pest['pest_name_en']}** ({pest['crop_affected']})\n"
-                            pest_info += f"Region: {pest['region']}\n"
-                            pest_info += f"Severity: {pest['severity']}\n"
-                            if pest.get('symptoms_en'):
-                                pest_info += f"Symptoms: {pest['symptoms_en']}\n"
-                            if pest.get('prevention_en'):
-                                pest_info += f"Prevention: {pest['prevention_en']}\n"
-                            if pest.get('treatment_en'):
-                                pest_info += f"Treatment: {pest['treatment_en']}\n"
-                            pest_info += "\n"
-            except Exception as e:
-                print(f"Error fetching pest information: {e}")
-                pest_info = ""
-        
-        # Check if this is a price/market query
-        is_price, crop_name = detect_price_query(question)
-        price_info = ""
-        
-        if is_price:
-            try:
-                from market_integration import get_current_market_price, format_price_for_chat
-                
-                if crop_name:
-                    price_data = get_current_market_price(crop_name)
-                    if price_data:
-                        price_info = format_price_for_chat(price_data, language)
-                    else:
-                        # Try to get from database as fallback
-                        try:
-                            import sqlite3
-                            conn = sqlite3.connect("kisaan_academy.db")
-                            conn.row_factory = sqlite3.Row
+            
+            if pests:
+                if language == "ur":
+                    pest_info = "\n[کیڑوں کی تفصیلات]\n\n"
+                    for pest in pests:
+                        pest_info += f"**{pest['pest_name_ur']}** ({pest['crop_affected']})\n"
+                        pest_info += f"خطہ: {pest['region']}\n"
+                        pest_info += f"شدت: {pest['severity']}\n"
+                        if pest.get('symptoms_ur'):
+                            pest_info += f"علامات: {pest['symptoms_ur']}\n"
+                        if pest.get('prevention_ur'):
+                            pest_info += f"بچاؤ: {pest['prevention_ur']}\n"
+                        if pest.get('treatment_ur'):
+                            pest_info += f"علاج: {pest['treatment_ur']}\n"
+                        pest_info += "\n"
+                else:
+                    pest_info = "\n[Pest Information]\n\n"
+                    for pest in pests:
+                        pest_info += f"**{pest['pest_name_en']}** ({pest['crop_affected']})\n"
+                        pest_info += f"Region: {pest['region']}\n"
+                        pest_info += f"Severity: {pest['severity']}\n"
+                        if pest.get('symptoms_en'):
+                            pest_info += f"Symptoms: {pest['symptoms_en']}\n"
+                        if pest.get('prevention_en'):
+                            pest_info += f"Prevention: {pest['prevention_en']}\n"
+                        if pest.get('treatment_en'):
+                            pest_info += f"Treatment: {pest['treatment_en']}\n"
+                        pest_info += "\n"
+        except Exception as e:
+            print(f"Error fetching pest information: {e}")
+            pest_info = ""
+    
+    return pest_info
+
+
+def _price_context(found: intents.Intents, language: str) -> str:
+    """Market prices for a price question (live, else the latest stored), or ""."""
+    # Check if this is a price/market query
+    is_price, crop_name = found.price, found.market_crop
+    price_info = ""
+    
+    if is_price:
+        try:
+            from market_integration import get_current_market_price, format_price_for_chat
+            
+            if crop_name:
+                price_data = get_current_market_price(crop_name)
+                if price_data:
+                    price_info = format_price_for_chat(price_data, language)
+                else:
+                    # Try to get from database as fallback
+                    try:
+                        with db.reader() as conn:
                             cursor = conn.cursor()
-                            
-                            crop_name_ur = {"wheat": "گندم", "rice": "چاول", "cotton": "کپاس", "sugar": "چینی"}.get(crop_name, crop_name)
+                        
                             cursor.execute('''
                                 SELECT crop_name, price_per_kg, region, recorded_at 
                                 FROM market_prices 
-                                WHERE crop_name LIKE ? 
+                                WHERE crop_key = ? 
                                 ORDER BY recorded_at DESC 
                                 LIMIT 1
-                            ''', (f"%{crop_name_ur}%",))
-                            
+                            ''', (crop_key(crop_name),))
+                        
                             row = cursor.fetchone()
-                            conn.close()
-                            
-                            if row:
-                                price_value = f"{row['price_per_kg']:.2f}"
-                                if language == "ur":
-                                    price_info = f"{row['crop_name']} کی موجودہ قیمت: {price_value} روپے فی کلوگرام (PKR/kg) - {row['region']}"
-                                else:
-                                    price_info = f"Current price of {row['crop_name']}: {price_value} PKR per kg - {row['region']}"
-                        except Exception as db_error:
-                            print(f"Error fetching from database: {db_error}")
-                            price_info = ""
-                else:
-                    # General price query - get latest prices from database
-                    try:
-                        import sqlite3
-                        conn = sqlite3.connect("kisaan_academy.db")
-                        conn.row_factory = sqlite3.Row
-                        cursor = conn.cursor()
                         
+                        if row:
+                            price_value = f"{row['price_per_kg']:.2f}"
+                            if language == "ur":
+                                price_info = f"{row['crop_name']} کی موجودہ قیمت: {price_value} روپے فی کلوگرام (PKR/kg) - {row['region']}"
+                            else:
+                                price_info = f"Current price of {row['crop_name']}: {price_value} PKR per kg - {row['region']}"
+                    except Exception as db_error:
+                        print(f"Error fetching from database: {db_error}")
+                        price_info = ""
+            else:
+                # General price query - get latest prices from database
+                try:
+                    with db.reader() as conn:
+                        cursor = conn.cursor()
+                    
                         cursor.execute('''
                             SELECT crop_name, price_per_kg, region, recorded_at 
                             FROM market_prices 
                             ORDER BY recorded_at DESC 
                             LIMIT 5
                         ''')
-                        
+                    
                         rows = cursor.fetchall()
-                        conn.close()
-                        
-                        if rows:
-                            if language == "ur":
-                                price_info = "\n[موجودہ مارکیٹ قیمتیں - PKR/kg]\n"
-                                for row in rows:
-                                    price_value = f"{row['price_per_kg']:.2f}"
-                                    price_info += f"{row['crop_name']}: {price_value} روپے/کلوگرام ({row['region']})\n"
-                            else:
-                                price_info = "\n[Current Market Prices - PKR/kg]\n"
-                                for row in rows:
-                                    price_value = f"{row['price_per_kg']:.2f}"
-                                    price_info += f"{row['crop_name']}: {price_value} PKR/kg ({row['region']})\n"
-                    except Exception as db_error:
-                        print(f"Error fetching prices from database: {db_error}")
-                        price_info = ""
-                        
-            except ImportError:
-                price_info = ""
-            except Exception as e:
-                print(f"Error fetching market price: {e}")
-                price_info = ""
-        
-        # Create a context-aware prompt
-        context = f"""You are an agricultural assistant (Agri-Bot) for Pakistani farmers. 
+                    
+                    if rows:
+                        if language == "ur":
+                            price_info = "\n[موجودہ مارکیٹ قیمتیں - PKR/kg]\n"
+                            for row in rows:
+                                price_value = f"{row['price_per_kg']:.2f}"
+                                price_info += f"{row['crop_name']}: {price_value} روپے/کلوگرام ({row['region']})\n"
+                        else:
+                            price_info = "\n[Current Market Prices - PKR/kg]\n"
+                            for row in rows:
+                                price_value = f"{row['price_per_kg']:.2f}"
+                                price_info += f"{row['crop_name']}: {price_value} PKR/kg ({row['region']})\n"
+                except Exception as db_error:
+                    print(f"Error fetching prices from database: {db_error}")
+                    price_info = ""
+                    
+        except ImportError:
+            price_info = ""
+        except Exception as e:
+            print(f"Error fetching market price: {e}")
+            price_info = ""
+    
+    return price_info
+
+
+def _assemble_prompt(question: str, language: str, weather_info: str, price_info: str, pest_info: str) -> str:
+    # Create a context-aware prompt
+    context = f"""You are an agricultural assistant (Agri-Bot) for Pakistani farmers. 
 Answer questions about farming, crops, prices, weather, pests, and agricultural practices.
 Language preference: {'Urdu' if language == 'ur' else 'English'}
 Keep responses concise, practical, and helpful. Always respond in the requested language.
@@ -478,23 +363,142 @@ Keep responses concise, practical, and helpful. Always respond in the requested
 
 Question: {question}
 Answer:"""
+    return context
+
+
+def build_prompt(question: str, language: str = "ur") -> str:
+    """
+    Gather live weather, pest and market context for a question and build
+    the Gemini prompt.
+    
+    Each lookup handles its own errors, so a failing integration only
+    leaves its section out of the prompt. The lookups the question needs
+    run concurrently, and one that has not finished within
+    CONTEXT_DEADLINE_MS is left out the same way.
+    
+    Args:
+        question: User's question
+        language: Language preference ('ur' or 'en')
+    
+    Returns:
+        Prompt text for model.generate_content
+    """
+    return _assemble_prompt(question, language, *_gather_context(question, language))
+
+
+# Context providers in _assemble_prompt's order; each only runs for
+# questions with its intent (intents.Intents.weather/.price/.pest)
+_CONTEXT_PROVIDERS = (
+    ("weather", _weather_context),
+    ("price", _price_context),
+    ("pest", _pest_context),
+)
+_provider_latency = {name: latency.LatencyStats(f"context_{name}") for name, _ in _CONTEXT_PROVIDERS}
+_context_stats = {name: {"runs": 0, "skipped": 0, "late": 0} for name, _ in _CONTEXT_PROVIDERS}
+_context_stats_lock = threading.Lock()
+
+
+def _run_provider(name: str, provider, found: intents.Intents, language: str) -> str:
+    # Timed on the pool thread, so a provider that misses the deadline
+    # still reports how long it really took
+    started = time.perf_counter()
+    try:
+        return provider(found, language)
+    except Exception as e:
+        print(f"✗ {name} context failed: {e}")
+        return ""
+    finally:
+        _provider_latency[name].record((time.perf_counter() - started) * 1000)
+
+
+def _providers_for(found: intents.Intents):
+    # (name, provider) pairs the question needs; the others count as skipped
+    wanted = []
+    with _context_stats_lock:
+        for name, provider in _CONTEXT_PROVIDERS:
+            if getattr(found, name):
+                _context_stats[name]["runs"] += 1
+                wanted.append((name, provider))
+            else:
+                _context_stats[name]["skipped"] += 1
+    return wanted
+
+
+def _sections(futures: Dict) -> Tuple[str, str, str]:
+    # (weather, price, pest) sections from finished providers; one still
+    # running contributes nothing
+    late = [name for name, future in futures.items() if not future.done()]
+    if late:
+        with _context_stats_lock:
+            for name in late:
+                _context_stats[name]["late"] += 1
+        print(f"⚠ Context deadline ({CONTEXT_DEADLINE_MS:.0f} ms) passed; answering without {', '.join(late)}")
+    return tuple(
+        futures[name].result() if name in futures and futures[name].done() else ""
+        for name, _ in _CONTEXT_PROVIDERS
+    )
+
+
+def _gather_context(question: str, language: str) -> Tuple[str, str, str]:
+    # The providers a question needs run concurrently on the context pool,
+    # all under one CONTEXT_DEADLINE_MS deadline
+    found = intents.extract(question)
+    futures = {
+        name: _context_pool().submit(_run_provider, name, provider, found, language)
+        for name, provider in _providers_for(found)
+    }
+    if futures:
+        wait_futures(futures.values(), timeout=CONTEXT_DEADLINE_MS / 1000 or None)
+    return _sections(futures)
+
+
+def _response_text(response) -> str:
+    # Handle different response formats
+    if hasattr(response, 'text'):
+        return response.text.strip()
+    if hasattr(response, 'candidates') and len(response.candidates) > 0:
+        if hasattr(response.candidates[0], 'content'):
+            return response.candidates[0].content.parts[0].text.strip()
+        return str(response.candidates[0]).strip()
+    return str(response).strip()
+
+
+def get_agri_response(question: str, language: str = "ur") -> str:
+    """
+    Get AI response from Gemini API for farming-related questions.
+    Now includes weather data integration for weather queries.
+    
+    Answers are cached on the normalized question, language and the live
+    context injected into the prompt (answer_cache.py), so a repeated
+    question only reaches Gemini again once its data has changed.
+    
+    Args:
+        question: User's question
+        language: Language preference ('ur' or 'en')
+    
+    Returns:
+        AI-generated response
+    """
+    if not model:
+        # Fallback response if Gemini is not configured
+        return get_fallback_response(question, language)
+    
+    try:
+        sections = _gather_context(question, language)
+        # Same question, language and live data -> same answer (see answer_cache.py)
+        key = answer_cache.cache_key(question, language, sections)
+        cached = answer_cache.answers.get(key)
+        if cached is not None:
+            return cached
+        context = _assemble_prompt(question, language, *sections)
         
         response = model.generate_content(context)
-        
-        # Handle different response formats
-        if hasattr(response, 'text'):
-            result = response.text.strip()
-        elif hasattr(response, 'candidates') and len(response.candidates) > 0:
-            if hasattr(response.candidates[0], 'content'):
-                result = response.candidates[0].content.parts[0].text.strip()
-            else:
-                result = str(response.candidates[0]).strip()
-        else:
-            result = str(response).strip()
+        result = _response_text(response)
         
         # Log successful API call (only first 50 chars to avoid spam)
         if result and len(result) > 0:
             print(f"✓ Gemini API response: {result[:50]}...")
+            answer_cache.answers.put(key, question, language, result)
             return result
         else:
             raise Exception("Empty response from Gemini API")
@@ -504,53 +508,350 @@ Answer:"""
         return get_fallback_response(question, language)
 
 
+def _chunk_text(chunk) -> str:
+    # Chunks carrying only safety ratings or the finish reason raise on .text
+    try:
+        return chunk.text
+    except (ValueError, AttributeError):
+        return ""
+
+
+def stream_agri_response(question: str, language: str = "ur") -> Iterator[str]:
+    """
+    Streaming variant of get_agri_response: yields the answer in pieces as
+    Gemini generates it (generate_content with stream=True).
+    
+    Context is gathered first, exactly as for get_agri_response. If Gemini
+    is not configured or fails before its first chunk, the fallback answer
+    is yielded as a single piece; a failure after that ends the stream with
+    what was already sent.
+    
+    Args:
+        question: User's question
+        language: Language preference ('ur' or 'en')
+    
+    Yields:
+        Consecutive pieces of the answer text
+    """
+    if not model:
+        yield get_fallback_response(question, language)
+        return
+    
+    sent = 0
+    try:
+        sections = _gather_context(question, language)
+        key = answer_cache.cache_key(question, language, sections)
+        cached = answer_cache.answers.get(key)
+        if cached is not None:
+            yield cached
+            return
+        pieces = []
+        for chunk in model.generate_content(_assemble_prompt(question, language, *sections), stream=True):
+            text = _chunk_text(chunk)
+            if text:
+                sent += len(text)
+                pieces.append(text)
+                yield text
+        if not sent:
+            raise Exception("Empty response from Gemini API")
+        print(f"✓ Gemini API streamed {sent} characters")
+        answer_cache.answers.put(key, question, language, "".join(pieces).strip())
+    except Exception as e:
+        print(f"✗ Error streaming from Gemini API: {e}")
+        print(f"   Question was: {question[:50]}...")
+        if not sent:
+            yield get_fallback_response(question, language)
+
+
+# Async API for the FastAPI chat endpoints. Everything below runs on the
+# worker's event loop; only the context lookups go to threads.
+
+_context_executor: Optional[ThreadPoolExecutor] = None
+_context_executor_lock = threading.Lock()
+_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+# Only touched from the event loop, so no lock
+_pending_answers: Dict[str, asyncio.Future] = {}  # cache key -> in-flight answer
+_gemini_stats = {
+    "calls": 0,
+    "coalesced": 0,
+    "errors": 0,
+    "timeouts": 0,
+    "in_flight": 0,
+    "max_in_flight": 0,
+    "waiting": 0,
+    "max_waiting": 0,
+}
+
+
+def _context_pool() -> ThreadPoolExecutor:
+    global _context_executor
+    with _context_executor_lock:
+        if _context_executor is None:
+            _context_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix="kisaan-context")
+        return _context_executor
+
+
+async def _offload(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_context_pool(), fn, *args)
+
+
+def _semaphore() -> asyncio.Semaphore:
+    # One semaphore per event loop (a uvicorn worker has exactly one)
+    global _slots
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots[0] is not loop:
+        _slots = (loop, asyncio.Semaphore(GEMINI_CONCURRENCY))
+    return _slots[1]
+
+
+@asynccontextmanager
+async def _gemini_slot():
+    # Holds one of the worker's GEMINI_CONCURRENCY slots for a Gemini call
+    semaphore = _semaphore()
+    _gemini_stats["waiting"] += 1
+    _gemini_stats["max_waiting"] = max(_gemini_stats["max_waiting"], _gemini_stats["waiting"])
+    try:
+        await semaphore.acquire()
+    finally:
+        _gemini_stats["waiting"] -= 1
+    _gemini_stats["calls"] += 1
+    _gemini_stats["in_flight"] += 1
+    _gemini_stats["max_in_flight"] = max(_gemini_stats["max_in_flight"], _gemini_stats["in_flight"])
+    try:
+        yield
+    finally:
+        _gemini_stats["in_flight"] -= 1
+        semaphore.release()
+
+
+async def build_prompt_async(question: str, language: str = "ur") -> str:
+    """
+    Async build_prompt: the weather, price and pest lookups run concurrently
+    on the context thread pool, so the event loop never waits on HTTP or
+    SQLite and gathering context costs the slowest lookup (at most
+    CONTEXT_DEADLINE_MS), not their sum.
+    """
+    return _assemble_prompt(question, language, *await _gather_context_async(question, language))
+
+
+async def _gather_context_async(question: str, language: str) -> Tuple[str, str, str]:
+    found = intents.extract(question)
+    loop = asyncio.get_running_loop()
+    futures = {
+        name: loop.run_in_executor(_context_pool(), _run_provider, name, provider, found, language)
+        for name, provider in _providers_for(found)
+    }
+    if futures:
+        # A late lookup keeps running on its thread (and still fills the
+        # weather/market caches); only this answer stops waiting for it
+        await asyncio.wait(futures.values(), timeout=CONTEXT_DEADLINE_MS / 1000 or None)
+    return _sections(futures)
+
+
+async def _cached_answer(key: str) -> Optional[str]:
+    # A persistent cache reads SQLite on a miss, which must stay off the loop
+    if answer_cache.answers.persist:
+        return await _offload(answer_cache.answers.get, key)
+    return answer_cache.answers.get(key)
+
+
+async def _generate(key: str, question: str, language: str, sections: Tuple[str, str, str]) -> str:
+    async with _gemini_slot():
+        response = await asyncio.wait_for(
+            model.generate_content_async(_assemble_prompt(question, language, *sections)), GEMINI_TIMEOUT
+        )
+    result = _response_text(response)
+    if not result:
+        raise Exception("Empty response from Gemini API")
+    print(f"✓ Gemini API response: {result[:50]}...")
+    answer_cache.answers.put(key, question, language, result)
+    return result
+
+
+async def _generate_once(key: str, question: str, language: str, sections: Tuple[str, str, str]) -> str:
+    # With the answer cache on, concurrent misses for the same answer share
+    # one Gemini call, like TTLCache's single-flight loads
+    if not answer_cache.answers.enabled:
+        return await _generate(key, question, language, sections)
+    pending = _pending_answers.get(key)
+    if pending is not None:
+        _gemini_stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+    future = asyncio.get_running_loop().create_future()
+    _pending_answers[key] = future
+    try:
+        result = await _generate(key, question, language, sections)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        if not future.done():
+            future.set_exception(RuntimeError("Gemini call abandoned"))  # the leading request was cancelled
+        future.exception()  # waiters, if any, get it; nobody else needs to
+        del _pending_answers[key]
+
+
+async def get_agri_response_async(question: str, language: str = "ur") -> str:
+    """
+    Async get_agri_response for the event loop.
+    
+    Context is gathered as in build_prompt_async. The answer comes from the
+    answer cache or from the SDK's async generation (generate_content_async)
+    holding one of the worker's GEMINI_CONCURRENCY slots; a worker keeps
+    that many chats waiting on Gemini without tying up a thread for any of
+    them, and identical questions asked at the same time share one call.
+    
+    Args:
+        question: User's question
+        language: Language preference ('ur' or 'en')
+    
+    Returns:
+        AI-generated response (the fallback answer if Gemini fails)
+    """
+    if not model:
+        return await _offload(get_fallback_response, question, language)
+    
+    try:
+        sections = await _gather_context_async(question, language)
+        key = answer_cache.cache_key(question, language, sections)
+        cached = await _cached_answer(key)
+        if cached is not None:
+            return cached
+        return await _generate_once(key, question, language, sections)
+    except Exception as e:
+        _gemini_stats["errors"] += 1
+        if isinstance(e, asyncio.TimeoutError):
+            _gemini_stats["timeouts"] += 1
+        print(f"✗ Error calling Gemini API: {str(e) or 'timed out'}")
+        print(f"   Question was: {question[:50]}...")
+        return await _offload(get_fallback_response, question, language)
+
+
+_STREAM_END = object()
+
+
+async def _stream_into(prompt: str, queue: asyncio.Queue):
+    # Producer for stream_agri_response_async. It holds a Gemini slot only
+    # while Gemini generates: chunks go into an unbounded queue, so a client
+    # reading slowly never keeps the slot. Ends with _STREAM_END or the error.
+    try:
+        async with _gemini_slot():
+            response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), GEMINI_TIMEOUT)
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), GEMINI_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                text = _chunk_text(chunk)
+                if text:
+                    queue.put_nowait(text)
+        queue.put_nowait(_STREAM_END)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def stream_agri_response_async(question: str, language: str = "ur") -> AsyncIterator[str]:
+    """
+    Async stream_agri_response: yields answer pieces from
+    generate_content_async(stream=True). Generation runs in its own task
+    holding a Gemini slot until Gemini is done, not until the client has
+    read everything. Fallback behaviour is the same as the sync version,
+    and a call or chunk taking longer than GEMINI_TIMEOUT counts as a failure.
+    """
+    if not model:
+        yield await _offload(get_fallback_response, question, language)
+        return
+    
+    sent = 0
+    try:
+        sections = await _gather_context_async(question, language)
+        key = answer_cache.cache_key(question, language, sections)
+        cached = await _cached_answer(key)
+        if cached is not None:
+            yield cached
+            return
+        pieces = []
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(_stream_into(_assemble_prompt(question, language, *sections), queue))
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                sent += len(item)
+                pieces.append(item)
+                yield item
+        finally:
+            # Stops generation (and frees the slot) if the client went away
+            producer.cancel()
+        if not sent:
+            raise Exception("Empty response from Gemini API")
+        print(f"✓ Gemini API streamed {sent} characters")
+        answer_cache.answers.put(key, question, language, "".join(pieces).strip())
+    except Exception as e:
+        _gemini_stats["errors"] += 1
+        if isinstance(e, asyncio.TimeoutError):
+            _gemini_stats["timeouts"] += 1
+        print(f"✗ Error streaming from Gemini API: {str(e) or 'timed out'}")
+        print(f"   Question was: {question[:50]}...")
+        if not sent:
+            yield await _offload(get_fallback_response, question, language)
+
+
+def stats() -> Dict:
+    """Async Gemini call counters and the concurrency limit, for /api/stats."""
+    snapshot = dict(_gemini_stats)
+    snapshot["async"] = GEMINI_ASYNC
+    snapshot["concurrency_limit"] = GEMINI_CONCURRENCY
+    snapshot["timeout_s"] = GEMINI_TIMEOUT
+    snapshot["context_workers"] = CONTEXT_WORKERS
+    snapshot["context_deadline_ms"] = CONTEXT_DEADLINE_MS
+    with _context_stats_lock:
+        snapshot["context"] = {name: dict(counts) for name, counts in _context_stats.items()}
+    snapshot["model"] = getattr(model, "model_name", None)
+    return snapshot
+
+
 def get_fallback_response(question: str, language: str) -> str:
     """
     Fallback keyword-based responses when Gemini API is not available.
     """
     question_lower = question.lower()
+    found = intents.extract(question)
     
     # Check for pest query and try to get pest information
-    is_pest, pest_name = detect_pest_query(question)
+    is_pest, pest_name = found.pest, found.pest_name
     if is_pest:
         try:
-            import sqlite3
-            conn = sqlite3.connect("kisaan_academy.db")
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            with db.reader() as conn:
+                cursor = conn.cursor()
             
-            if pest_name:
-                cursor.execute('''
-                    SELECT * FROM pest_alerts 
-                    WHERE pest_name_en LIKE ? OR pest_name_ur LIKE ?
-                    ORDER BY created_at DESC LIMIT 1
-                ''', (f"%{pest_name}%", f"%{pest_name}%"))
-            else:
-                # Search by crop
-                crop_keywords = {
-                    "wheat": "گندم",
-                    "rice": "چاول",
-                    "cotton": "کپاس",
-                    "corn": "مکئی",
-                }
-                
-                found_crop = None
-                for crop, crop_ur in crop_keywords.items():
-                    if crop in question_lower or crop_ur in question_lower:
-                        found_crop = crop_ur
-                        break
-                
-                if found_crop:
-                    cursor.execute('''
+                if pest_name:
+                    pest_ids, pest_params = search.pest_ids_query(pest_name)
+                    cursor.execute(f'''
                         SELECT * FROM pest_alerts 
-                        WHERE crop_affected LIKE ?
+                        WHERE id IN ({pest_ids})
                         ORDER BY created_at DESC LIMIT 1
-                    ''', (f"%{found_crop}%",))
+                    ''', pest_params)
                 else:
-                    cursor.execute('SELECT * FROM pest_alerts ORDER BY created_at DESC LIMIT 1')
+                    # Search by crop
+                    found_crop = found.crop_ur
+                
+                    if found_crop:
+                        cursor.execute('''
+                            SELECT * FROM pest_alerts 
+                            WHERE crop_affected LIKE ?
+                            ORDER BY created_at DESC LIMIT 1
+                        ''', (f"%{found_crop}%",))
+                    else:
+                        cursor.execute('SELECT * FROM pest_alerts ORDER BY created_at DESC LIMIT 1')
             
-            pest = cursor.fetchone()
-            conn.close()
+                pest = cursor.fetchone()
             
             if pest:
                 if language == "ur":
@@ -581,7 +882,7 @@ def get_fallback_response(question: str, language: str) -> str:
             print(f"Error fetching pest data in fallback: {e}")
     
     # Check for price query and try to get real market data
-    is_price, crop_name = detect_price_query(question)
+    is_price, crop_name = found.price, found.market_crop
     if is_price:
         try:
             from market_integration import get_current_market_price, format_price_for_chat
@@ -594,59 +895,55 @@ def get_fallback_response(question: str, language: str) -> str:
         
         # Try database fallback
         try:
-            import sqlite3
-            conn = sqlite3.connect("kisaan_academy.db")
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            with db.reader() as conn:
+                cursor = conn.cursor()
             
-            if crop_name:
-                crop_name_ur = {"wheat": "گندم", "rice": "چاول", "cotton": "کپاس", "sugar": "چینی"}.get(crop_name, crop_name)
-                cursor.execute('''
-                    SELECT crop_name, price_per_kg, region FROM market_prices 
-                    WHERE crop_name LIKE ? ORDER BY recorded_at DESC LIMIT 1
-                ''', (f"%{crop_name_ur}%",))
-                row = cursor.fetchone()
+                if crop_name:
+                    cursor.execute('''
+                        SELECT crop_name, price_per_kg, region FROM market_prices 
+                        WHERE crop_key = ? ORDER BY recorded_at DESC LIMIT 1
+                    ''', (crop_key(crop_name),))
+                    row = cursor.fetchone()
                 
-                if row:
-                    price_value = f"{row['price_per_kg']:.2f}"
-                    if language == "ur":
-                        return f"{row['crop_name']} کی موجودہ قیمت: {price_value} روپے فی کلوگرام (PKR/kg) - {row['region']}"
-                    else:
-                        return f"Current price of {row['crop_name']}: {price_value} PKR per kg - {row['region']}"
-            else:
-                cursor.execute('SELECT crop_name, price_per_kg, region FROM market_prices ORDER BY recorded_at DESC LIMIT 3')
-                rows = cursor.fetchall()
+                    if row:
+                        price_value = f"{row['price_per_kg']:.2f}"
+                        if language == "ur":
+                            return f"{row['crop_name']} کی موجودہ قیمت: {price_value} روپے فی کلوگرام (PKR/kg) - {row['region']}"
+                        else:
+                            return f"Current price of {row['crop_name']}: {price_value} PKR per kg - {row['region']}"
+                else:
+                    cursor.execute('SELECT crop_name, price_per_kg, region FROM market_prices ORDER BY recorded_at DESC LIMIT 3')
+                    rows = cursor.fetchall()
                 
-                if rows:
-                    if language == "ur":
-                        result = "موجودہ مارکیٹ قیمتیں (PKR/kg):\n"
-                        for row in rows:
-                            price_value = f"{row['price_per_kg']:.2f}"
-                            result += f"{row['crop_name']}: {price_value} روپے/کلوگرام ({row['region']})\n"
-                        return result
-                    else:
-                        result = "Current market prices (PKR/kg):\n"
-                        for row in rows:
-                            price_value = f"{row['price_per_kg']:.2f}"
-                            result += f"{row['crop_name']}: {price_value} PKR/kg ({row['region']})\n"
-                        return result
-            conn.close()
+                    if rows:
+                        if language == "ur":
+                            result = "موجودہ مارکیٹ قیمتیں (PKR/kg):\n"
+                            for row in rows:
+                                price_value = f"{row['price_per_kg']:.2f}"
+                                result += f"{row['crop_name']}: {price_value} روپے/کلوگرام ({row['region']})\n"
+                            return result
+                        else:
+                            result = "Current market prices (PKR/kg):\n"
+                            for row in rows:
+                                price_value = f"{row['price_per_kg']:.2f}"
+                                result += f"{row['crop_name']}: {price_value} PKR/kg ({row['region']})\n"
+                            return result
         except Exception as e:
             print(f"Database error in fallback: {e}")
     
     # Check for weather query and try to get real weather data
-    is_weather, city = detect_weather_query(question)
+    is_weather, city = found.weather, found.place
     if is_weather:
         try:
-            from weather_integration import get_current_weather
+            from weather_integration import fetch_observation
             query_city = city if city else "Lahore"
-            weather_data = get_current_weather(query_city)
+            weather = fetch_observation(query_city)
             
-            if weather_data:
+            if weather:
                 if language == "ur":
-                    return f"{weather_data['city']} میں فی الوقت موسم:\nدرجہ حرارت: {weather_data['temperature_c']}°C (محسوس: {weather_data['feels_like_c']}°C)\nحالت: {weather_data['condition']}\nنمی: {weather_data['humidity']}%\nہوا: {weather_data['wind_kph']} کلومیٹر/گھنٹہ"
+                    return f"{weather.city} میں فی الوقت موسم:\nدرجہ حرارت: {weather.temperature_c}°C (محسوس: {weather.feels_like_c}°C)\nحالت: {weather.condition}\nنمی: {weather.humidity}%\nہوا: {weather.wind_kph} کلومیٹر/گھنٹہ"
                 else:
-                    return f"Current weather in {weather_data['city']}:\nTemperature: {weather_data['temperature_c']}°C (Feels like: {weather_data['feels_like_c']}°C)\nCondition: {weather_data['condition']}\nHumidity: {weather_data['humidity']}%\nWind: {weather_data['wind_kph']} km/h"
+                    return f"Current weather in {weather.city}:\nTemperature: {weather.temperature_c}°C (Feels like: {weather.feels_like_c}°C)\nCondition: {weather.condition}\nHumidity: {weather.humidity}%\nWind: {weather.wind_kph} km/h"
         except:
             pass  # Fall through to keyword responses
     
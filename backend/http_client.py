@@ -0,0 +1,177 @@
+"""
+Shared Outbound HTTP Client
+Keep-alive connection pool, deadlines and jittered retries for external APIs
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+import transport
+from circuit_breaker import CircuitBreaker
+
+# Connections kept alive per host; must cover the widest concurrent fan-out
+# (KISAAN_WEATHER_CONCURRENCY), or surplus connections are dropped after use
+HTTP_POOL_SIZE = int(os.getenv("KISAAN_HTTP_POOL_SIZE", "128"))
+# Total budget for one logical request, retries and backoff included
+HTTP_TIMEOUT = float(os.getenv("KISAAN_HTTP_TIMEOUT", "10"))
+HTTP_RETRIES = int(os.getenv("KISAAN_HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("KISAAN_HTTP_BACKOFF_MS", "200")) / 1000
+
+# Worth another attempt: throttling and transient upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Count against the upstream's circuit breaker: the retryable statuses plus
+# rejected keys and exhausted quotas (401/403), which fail every call alike
+BREAKER_FAILURE_STATUSES = RETRY_STATUSES | {401, 403}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "attempts": 0,
+    "retries": 0,
+    "failures": 0,
+    "deadline_exceeded": 0,
+    "short_circuited": 0,
+}
+
+
+def _bump(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def session() -> requests.Session:
+    """
+    Return the process-wide requests.Session.
+
+    Connections are pooled per host and reused across calls and threads, so
+    repeated calls to the same API skip the TCP/TLS handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            # Retries are handled in get() so they share the request deadline
+            # (a record/replay adapter when KISAAN_TRANSPORT asks for one)
+            adapter = transport.http_adapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE,
+                                             max_retries=0)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _backoff(attempt: int, remaining: float) -> float:
+    # "Full jitter": uniform over [0, base * 2^attempt], never past the deadline
+    return min(random.uniform(0, HTTP_BACKOFF * (2 ** attempt)), max(remaining, 0))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+def request(method: str, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+            json: Any = None, timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES,
+            breaker: Optional[CircuitBreaker] = None) -> requests.Response:
+    """
+    Send a request on the shared session with a deadline and jittered retries.
+
+    Connection errors, timeouts and RETRY_STATUSES responses are retried up
+    to `retries` times with exponential full-jitter backoff. Every attempt
+    and backoff sleep comes out of the same `timeout` budget. Only use it
+    for idempotent calls (GETs, and read-only POSTs such as bulk queries).
+
+    With a breaker, every attempt needs breaker.allow() and reports its
+    outcome (BREAKER_FAILURE_STATUSES count as failures), so an open
+    circuit fails the call at once.
+
+    Args:
+        method: HTTP method
+        url: Absolute URL
+        params: Query string parameters
+        headers: Extra request headers
+        json: JSON request body
+        timeout: Deadline in seconds for the whole call
+        retries: Extra attempts after the first
+        breaker: Circuit breaker of the upstream being called
+
+    Returns:
+        The final requests.Response (which may still be an error status)
+
+    Raises:
+        CircuitOpenError: if the breaker refuses the call
+        requests.exceptions.RequestException: if no attempt got a response
+            before the deadline
+    """
+    _bump("requests")
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _bump("deadline_exceeded")
+            _bump("failures")
+            raise requests.exceptions.Timeout(f"Deadline of {timeout:.1f}s exceeded for {url}")
+        if breaker is not None and not breaker.allow():
+            _bump("short_circuited")
+            raise CircuitOpenError(f"{breaker.name} circuit is open; retry in {breaker.retry_after() or 0:.0f}s")
+        _bump("attempts")
+        started = time.perf_counter()
+        try:
+            response = session().request(method, url, params=params, headers=headers, json=json, timeout=remaining)
+        except requests.exceptions.RequestException:
+            if breaker is not None:
+                breaker.record(False, (time.perf_counter() - started) * 1000)
+            if attempt >= retries or deadline - time.monotonic() <= 0:
+                _bump("failures")
+                raise
+        else:
+            if breaker is not None:
+                breaker.record(response.status_code not in BREAKER_FAILURE_STATUSES, (time.perf_counter() - started) * 1000)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                if response.status_code >= 400:
+                    _bump("failures")
+                return response
+            response.close()
+        attempt += 1
+        _bump("retries")
+        time.sleep(_backoff(attempt - 1, deadline - time.monotonic()))
+
+
+def get(url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+        timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES,
+        breaker: Optional[CircuitBreaker] = None) -> requests.Response:
+    """GET a URL; see request() for deadlines, retries and the breaker."""
+    return request("GET", url, params=params, headers=headers, timeout=timeout, retries=retries, breaker=breaker)
+
+
+def post(url: str, json: Any = None, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+         timeout: float = HTTP_TIMEOUT, retries: int = HTTP_RETRIES,
+         breaker: Optional[CircuitBreaker] = None) -> requests.Response:
+    """POST a JSON body to an idempotent endpoint; see request()."""
+    return request("POST", url, params=params, headers=headers, json=json, timeout=timeout, retries=retries,
+                   breaker=breaker)
+
+
+def stats() -> Dict:
+    """Request/retry counters for /api/stats."""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["pool_size"] = HTTP_POOL_SIZE
+    snapshot["timeout_s"] = HTTP_TIMEOUT
+    snapshot["max_retries"] = HTTP_RETRIES
+    return snapshot
+
+
+def close():
+    """Close pooled connections; the next call opens a fresh session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
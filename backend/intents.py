@@ -0,0 +1,226 @@
+"""
+Chat Intent and Entity Extraction
+Price, pest and weather intents plus crop, pest and place names in one Aho-Corasick pass
+"""
+
+import string
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import gazetteer
+from crops import CROPS
+
+PRICE_KEYWORDS = [
+    "price", "قیمت", "قیمتوں",
+    "market", "مارکیٹ", "بازار",
+    "rate", "ریٹ", "فیس",
+    "cost", "لاگت",
+    "expensive", "مہنگا", "cheap", "سستا",
+    "wheat price", "گندم کی قیمت",
+    "rice price", "چاول کی قیمت",
+    "cotton price", "کپاس کی قیمت",
+    "sugar price", "چینی کی قیمت",
+]
+
+PEST_KEYWORDS = [
+    "pest", "کیڑا", "کیڑے", "کیڑوں",
+    "insect", "حشرات",
+    "disease", "بیماری",
+    "aphid", "اپھیڈ",
+    "borer", "بورر",
+    "whitefly", "سفید مکھی",
+    "thrips", "تھرپس",
+    "jassid", "جیڈ",
+    "caterpillar", "کیٹر پلر",
+    "infestation", "انفیکشن",
+    "control", "کنٹرول",
+    "prevention", "بچاؤ", "روک تھام",
+    "treatment", "علاج",
+    "symptoms", "علامات", "نشانات",
+]
+
+WEATHER_KEYWORDS = [
+    "weather", "موسم", "آب و ہوا",
+    "temperature", "درجہ حرارت", "ٹمپریچر", "گرمی", "سردی",
+    "rain", "بارش", "طوفان", "storm",
+    "humidity", "نمی",
+    "wind", "ہوا", "wind speed",
+    "forecast", "پیشن گوئی", "پیش گوئی",
+    "hot", "گرم", "cold", "سرد",
+    "sunny", "دھوپ", "cloudy", "ابر آلود",
+]
+
+# Pest -> spellings; when several are mentioned the first listed wins
+PESTS: Dict[str, List[str]] = {
+    "aphid": ["aphid", "اپھیڈ"],
+    "whitefly": ["whitefly", "سفید مکھی", "white fly"],
+    "borer": ["borer", "بورر", "stem borer", "ڈھڈا بورر"],
+    "thrips": ["thrips", "تھرپس"],
+    "jassid": ["jassid", "جیڈ"],
+    "armyworm": ["armyworm", "فال آرمی ورم"],
+    "leafhopper": ["leafhopper", "لیف ہوپر"],
+}
+
+# Crops the chat recognises besides the traded ones in crops.CROPS
+# ("vegetable" has no market price, but pest alerts are filed under it)
+_EXTRA_CROP_ALIASES: Dict[str, List[str]] = {
+    "vegetable": ["vegetable", "vegetables", "سبزی", "سبزیاں"],
+}
+_CROP_UR = {"vegetable": "سبزی"}
+
+# Gazetteer names that are also everyday words in a farming chat
+# ("باغ" orchard, "ڈگری" degree, "کرم" grace, "tank", "hub"); they are not
+# read as places, so "باغ کا موسم" still gets the default city's weather
+_COMMON_WORDS = {"باغ", "bagh", "ڈگری", "کرم", "نگر", "حب", "hub", "tank", "dir", "khar", "topi", "ٹوپی"}
+
+# Punctuation and whitespace (Latin and Urdu) all read as a single space, so
+# keywords span "wheat-price" and place names end at "Lahore?" or "ملتان۔";
+# zero-width joiners and tatweel inside Urdu words are dropped
+_FOLD = str.maketrans(
+    {ch: " " for ch in string.whitespace + string.punctuation + "\u00a0\u060c\u061b\u061f\u066a\u06d4\u00ab\u00bb\u2018\u2019\u201c\u201d"}
+    | {"\u200c": None, "\u200d": None, "\u0640": None}
+)
+
+# Label kinds
+PRICE, PEST, WEATHER, CROP, PEST_NAME, PLACE = range(6)
+
+
+class Automaton:
+    """
+    Aho-Corasick matcher over a fixed set of (pattern, label) pairs.
+
+    The trie and its failure links are compiled once into per-state
+    transition dicts, so scanning a text is one dict lookup per character
+    however many patterns there are. A state only stores the transitions
+    that differ from the root's; anything else falls back to the root map,
+    which keeps the table small for thousands of place-name patterns.
+    Runs of spaces are matched as one space.
+    """
+
+    def __init__(self, patterns: List[Tuple[str, tuple]]):
+        goto: List[Dict[str, int]] = [{}]
+        entered_by: List[str] = [""]
+        outputs: List[List[Tuple[int, tuple]]] = [[]]
+        for pattern, label in patterns:
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    entered_by.append(ch)
+                    outputs.append([])
+                state = nxt
+            if (len(pattern), label) not in outputs[state]:
+                outputs[state].append((len(pattern), label))
+
+        root = goto[0]
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        queue = deque(root.values())
+        while queue:
+            # Breadth-first, so a state's failure target is complete before it
+            state = queue.popleft()
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, root.get(ch, 0))
+                queue.append(child)
+            delta[state] = {**delta[fail[state]], **goto[state]}
+        for state, ch in enumerate(entered_by):
+            if ch == " ":
+                delta[state][" "] = state
+
+        self._root = root
+        self._delta = delta
+        # Longest match first at each state, so nested names prefer the fuller one
+        self._outputs = [tuple(label for _, label in sorted(found, key=lambda o: -o[0])) for found in outputs]
+        self.states = len(goto)
+
+    def scan(self, text: str) -> List[tuple]:
+        """Labels of every pattern occurrence in text, in order of where each match ends."""
+        delta, root_get, outputs = self._delta, self._root.get, self._outputs
+        state = 0
+        found: List[tuple] = []
+        for ch in text:
+            # No stored transition leads back to the root (0), so a miss is None
+            state = delta[state].get(ch) or root_get(ch, 0)
+            if outputs[state]:
+                found.extend(outputs[state])
+        return found
+
+
+@dataclass(frozen=True, slots=True)
+class Intents:
+    """What a chat message asks about, and the crop, pest and place it names."""
+    price: bool = False
+    pest: bool = False
+    weather: bool = False
+    crop: Optional[str] = None
+    pest_name: Optional[str] = None
+    place: Optional[str] = None
+
+    @property
+    def market_crop(self) -> Optional[str]:
+        """The crop when it has market prices (crops.CROPS), else None."""
+        return self.crop if self.crop in CROPS else None
+
+    @property
+    def crop_ur(self) -> Optional[str]:
+        """Urdu name of the crop, as pest alerts file it."""
+        if self.crop is None:
+            return None
+        return CROPS[self.crop]["ur"] if self.crop in CROPS else _CROP_UR.get(self.crop, self.crop)
+
+
+def _patterns() -> List[Tuple[str, tuple]]:
+    patterns: List[Tuple[str, tuple]] = []
+    for kind, keywords in ((PRICE, PRICE_KEYWORDS), (PEST, PEST_KEYWORDS), (WEATHER, WEATHER_KEYWORDS)):
+        patterns += [(keyword, (kind, None, 0)) for keyword in keywords]
+    crop_aliases = {key: info["aliases"] + [info["en"]] for key, info in CROPS.items()}
+    for key, aliases in _EXTRA_CROP_ALIASES.items():
+        crop_aliases[key] = crop_aliases.get(key, []) + aliases
+    for rank, (key, aliases) in enumerate(crop_aliases.items()):
+        # Whole words, so "price" is not read as rice
+        patterns += [(f" {gazetteer.normalize_name(alias)} ", (CROP, key, rank)) for alias in aliases]
+    for rank, (pest, spellings) in enumerate(PESTS.items()):
+        patterns += [(spelling, (PEST_NAME, pest, rank)) for spelling in spellings]
+    # Place names only match as whole words ("Dadu" must not match inside "dadus")
+    for name, place in gazetteer.get().names().items():
+        if name not in _COMMON_WORDS:
+            patterns.append((f" {name} ", (PLACE, place.name, 0)))
+    return patterns
+
+
+_automaton = Automaton(_patterns())
+
+
+def extract(question: str) -> Intents:
+    """
+    Intents and entities of a chat message in one scan.
+
+    Intent keywords and pest names match anywhere in the text, crops and
+    places as whole words. The crop and pest are the first of their lists
+    the message mentions; the place is the first gazetteer name in it.
+    """
+    price = pest = weather = False
+    crop = pest_name = place = None
+    crop_rank = pest_rank = len(CROPS) + len(_EXTRA_CROP_ALIASES) + len(PESTS)
+    for kind, value, rank in _automaton.scan(f" {question.lower().translate(_FOLD)} "):
+        if kind == PRICE:
+            price = True
+        elif kind == PEST:
+            pest = True
+        elif kind == WEATHER:
+            weather = True
+        elif kind == CROP:
+            if rank < crop_rank:
+                crop, crop_rank = value, rank
+        elif kind == PEST_NAME:
+            pest = True
+            if rank < pest_rank:
+                pest_name, pest_rank = value, rank
+        elif place is None:
+            place = value
+    return Intents(price, pest, weather, crop, pest_name, place)
+
@@ -0,0 +1,54 @@
+"""
+Request Latency Metrics
+Rolling percentiles for timed request phases (e.g. time to first byte vs. total)
+"""
+
+import threading
+from collections import deque
+from typing import Dict
+
+# Every recorder registers itself here so /api/stats can report them all
+_registry: Dict[str, "LatencyStats"] = {}
+_registry_lock = threading.Lock()
+
+
+class LatencyStats:
+    """
+    Millisecond timings for one phase, kept for the last `window` samples.
+
+    Percentiles are computed from that window when stats() is called, so
+    record() is just an append under a lock.
+    """
+
+    def __init__(self, name: str, window: int = 2048):
+        self.name = name
+        self._samples: deque = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry[name] = self
+
+    def record(self, ms: float):
+        """Add one timing in milliseconds."""
+        with self._lock:
+            self._samples.append(ms)
+            self._count += 1
+
+    def stats(self) -> Dict:
+        """Count and p50/p95/p99/max over the window, for /api/stats."""
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        snapshot = {"count": count, "window": len(samples)}
+        if samples:
+            for pct in (50, 95, 99):
+                snapshot[f"p{pct}_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * pct / 100))], 1)
+            snapshot["max_ms"] = round(samples[-1], 1)
+        return snapshot
+
+
+def all_stats() -> Dict[str, Dict]:
+    """Stats for every recorder created in this process, keyed by name."""
+    with _registry_lock:
+        recorders = list(_registry.values())
+    return {recorder.name: recorder.stats() for recorder in recorders}
@@ -1,12 +1,28 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from contextlib import asynccontextmanager
-import sqlite3
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from pydantic import BaseModel
+import json
 import os
+import time
+import answer_cache
+import circuit_breaker
+import db
+import http_client
+import latency
+import migrations
+from crops import crop_key
+import pagination
+import rollups
+import search
+import transport
+import ttl_cache
+from scheduler import RefreshScheduler
+from write_behind import WriteBehindBuffer
 
 # Load environment variables from .env file if available
 try:
@@ -19,292 +35,56 @@ except ImportError:
 
 # App will be created after lifespan definition
 
-# Database initialization
-DATABASE = "kisaan_academy.db"
-
-def migrate_database(cursor):
-    """Add missing columns to existing tables if they don't exist."""
-    try:
-        # Check if wiki_url column exists in wiki_articles
-        cursor.execute("PRAGMA table_info(wiki_articles)")
-        columns = [row[1] for row in cursor.fetchall()]
-        if 'wiki_url' not in columns:
-            cursor.execute('ALTER TABLE wiki_articles ADD COLUMN wiki_url TEXT')
-            print("✓ Added wiki_url column to wiki_articles table")
-    except Exception as e:
-        print(f"Migration warning: {e}")
+# Database initialization (connections come from the shared pool in db.py)
 
 def init_db():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE,
-            phone TEXT,
-            region TEXT,
-            language TEXT DEFAULT 'ur',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Courses table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title_ur TEXT NOT NULL,
-            title_en TEXT NOT NULL,
-            description_ur TEXT,
-            description_en TEXT,
-            category TEXT,
-            video_url TEXT,
-            content_ur TEXT,
-            content_en TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(title_ur, title_en)
-        )
-    ''')
-    
-    # Market prices table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS market_prices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            crop_name TEXT NOT NULL,
-            region TEXT NOT NULL,
-            price_per_kg REAL NOT NULL,
-            mandi_name TEXT,
-            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Weather alerts table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS weather_alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            region TEXT NOT NULL,
-            alert_type TEXT NOT NULL,
-            severity TEXT,
-            message_ur TEXT,
-            message_en TEXT,
-            valid_until TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Pest alerts table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pest_alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            region TEXT NOT NULL,
-            pest_name_ur TEXT,
-            pest_name_en TEXT,
-            crop_affected TEXT,
-            severity TEXT,
-            prevention_ur TEXT,
-            prevention_en TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Wiki articles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS wiki_articles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title_ur TEXT NOT NULL,
-            title_en TEXT NOT NULL,
-            content_ur TEXT,
-            content_en TEXT,
-            category TEXT,
-            tags TEXT,
-            wiki_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(title_ur, title_en)
-        )
-    ''')
-    
-    # Chat history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            language TEXT DEFAULT 'ur',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Migrate existing tables
-    migrate_database(cursor)
-    conn.commit()
-    
-    # Insert sample data
-    insert_sample_data(cursor)
-    
-    conn.commit()
-    conn.close()
-
-def insert_sample_data(cursor):
-    # Sample courses with YouTube video links
-    courses = [
-        ("ڈرپ اریگیشن کا استعمال", "Drip Irrigation Usage", 
-         "ڈرپ اریگیشن کے فوائد اور استعمال کا طریقہ", 
-         "Benefits and usage of drip irrigation",
-         "sustainable_practices", "https://youtu.be/Xej22GsLLQA?si=PHj6dl6ADtEGCCw1",
-         "ڈرپ اریگیشن پانی کے بہتر استعمال کا ایک موثر طریقہ ہے جو پانی کی بچت کرتا ہے اور فصلوں کی بہتر افزائش میں مدد کرتا ہے۔", 
-         "Drip irrigation is an effective method for better water usage that saves water and helps in better crop growth."),
-        ("کمپوسٹ بنانے کا طریقہ", "How to Make Compost",
-         "کھاد بنانے کا آسان طریقہ", 
-         "Easy method to make fertilizer",
-         "waste_management", "https://youtu.be/_K25WjjCBuw?si=ofVETNZjDqghuH80",
-         "کمپوسٹ بنانے کے لیے پودوں کی باقیات، کچرے اور نامیاتی مواد کو مناسب طریقے سے استعمال کریں۔",
-         "Use crop residues, waste, and organic materials properly to make compost."),
-        ("مٹی کی جانچ", "Soil Testing",
-         "مٹی کی صحت کیسے چیک کریں",
-         "How to check soil health",
-         "sustainable_practices", "https://youtu.be/L6EtmGMJflI?si=7V3Y5w8ItkBzdUGw",
-         "مٹی کی جانچ فصل کی بہتری کے لیے ضروری ہے تاکہ آپ صحیح کھاد اور علاج استعمال کر سکیں۔",
-         "Soil testing is essential for crop improvement so you can use the right fertilizers and treatments."),
-        ("گندم کی کاشت", "Wheat Cultivation",
-         "گندم کی کاشت کا مکمل طریقہ کار",
-         "Complete guide to wheat cultivation",
-         "crop_production", "https://youtu.be/xVO9bjuhB58?si=Cc8nqvcAuIFj5m9M",
-         "گندم پاکستان کی اہم ترین فصل ہے۔ اس کی کاشت کے لیے زمین کی تیاری، بیج کی اچھی قسم کا انتخاب، اور وقت پر کاشت بہت ضروری ہے۔",
-         "Wheat is Pakistan's most important crop. Land preparation, selecting good seed varieties, and timely sowing are essential."),
-        ("چاول کی کاشت", "Rice Cultivation",
-         "چاول کی کاشت کے بہترین طریقے",
-         "Best methods for rice cultivation",
-         "crop_production", "https://youtu.be/FW_bw9jdrlQ?si=zIlptf1nqHRvqAAW",
-         "چاول کی کاشت کے لیے پانی کا مناسب انتظام، زمین کی تیاری، اور بیج کا انتخاب بہت اہم ہے۔",
-         "Proper water management, land preparation, and seed selection are very important for rice cultivation."),
-        ("کپاس کی کاشت", "Cotton Cultivation",
-         "کپاس کی کامیاب کاشت کے رہنما اصول",
-         "Guiding principles for successful cotton cultivation",
-         "crop_production", "https://youtu.be/eN-TqqBQOAk?si=klQi7MA3dkPoEBLx",
-         "کپاس کی کاشت کے لیے موسم، زمین کی قسم، اور کیڑوں کا انتظام بہت ضروری ہے۔",
-         "Weather, soil type, and pest management are essential for cotton cultivation."),
-        ("کیمیائی کھاد کا استعمال", "Chemical Fertilizer Usage",
-         "کیمیائی کھادوں کا صحیح استعمال",
-         "Proper use of chemical fertilizers",
-         "fertilizer_management", "https://youtu.be/y9b2p69CxCk?si=FIItGgzeOtBpMhpW",
-         "کیمیائی کھادوں کا صحیح استعمال فصلوں کی پیداوار بڑھاتا ہے لیکن زیادہ استعمال نقصان دہ ہو سکتا ہے۔",
-         "Proper use of chemical fertilizers increases crop yield but excessive use can be harmful."),
-        ("نامیاتی کھاد", "Organic Fertilizer",
-         "نامیاتی کھاد بنانے اور استعمال کرنے کا طریقہ",
-         "How to make and use organic fertilizer",
-         "fertilizer_management", "https://youtu.be/lofNYAtHYu4?si=Sv78H9e6jyo8VAy1",
-         "نامیاتی کھاد ماحول دوست ہے اور مٹی کی صحت کو بہتر بناتی ہے۔",
-         "Organic fertilizer is environmentally friendly and improves soil health."),
-        ("کیڑے مار ادویات", "Pesticide Usage",
-         "کیڑے مار ادویات کا محفوظ استعمال",
-         "Safe use of pesticides",
-         "pest_management", "https://youtu.be/lJEeGMMcYCI?si=xPnsjDkChLn9GoF6",
-         "کیڑے مار ادویات کا محفوظ اور مناسب استعمال فصلوں کو کیڑوں سے بچاتا ہے۔",
-         "Safe and proper use of pesticides protects crops from pests."),
-        ("پانی کی بچت", "Water Conservation",
-         "کھیتی باڑی میں پانی کیسے بچایا جائے",
-         "How to save water in farming",
-         "resource_management", "https://youtu.be/-evivoRwUZw?si=JBMXsQWJchfMP3Al",
-         "پانی کی بچت کے مختلف طریقے جیسے بارش کے پانی کا ذخیرہ، ڈرپ اریگیشن، اور مناسب اریگیشن وقت۔",
-         "Various water conservation methods like rainwater harvesting, drip irrigation, and proper irrigation timing."),
-        ("فصل کی کٹائی", "Harvesting",
-         "فصل کی کٹائی کا صحیح وقت اور طریقہ",
-         "Right time and method for harvesting",
-         "crop_production", "https://youtu.be/kWd_QnyO3eI?si=3S0fNULnIuWI9ltL",
-         "فصل کی کٹائی کا صحیح وقت پیداوار کی کیفیت اور مقدار کو متاثر کرتا ہے۔",
-         "The right time for harvesting affects the quality and quantity of yield."),
-        ("بیج کی اچھی اقسام", "Quality Seed Varieties",
-         "بہتر پیداوار کے لیے بیج کی اقسام کا انتخاب",
-         "Selecting seed varieties for better yield",
-         "crop_production", "https://youtu.be/Oir1J_CfU9Q?si=tcbiBFgsfyF79H5Y",
-         "بیج کی اچھی اقسام کا انتخاب کامیاب فصل کی بنیاد ہے۔",
-         "Selecting quality seed varieties is the foundation of a successful crop."),
-    ]
-    cursor.executemany('''
-        INSERT OR IGNORE INTO courses (title_ur, title_en, description_ur, description_en, category, video_url, content_ur, content_en)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', courses)
-    
-    # Sample market prices
-    prices = [
-        ("گندم", "Punjab", 4500.0, "Lahore Mandi"),
-        ("چاول", "Punjab", 5500.0, "Lahore Mandi"),
-        ("کپاس", "Sindh", 8000.0, "Karachi Mandi"),
-        ("گندم", "Sindh", 4600.0, "Hyderabad Mandi"),
-        ("چاول", "KPK", 5400.0, "Peshawar Mandi"),
-    ]
-    cursor.executemany('''
-        INSERT OR IGNORE INTO market_prices (crop_name, region, price_per_kg, mandi_name)
-        VALUES (?, ?, ?, ?)
-    ''', prices)
-    
-    # Sample wiki articles with Wikipedia links
-    wiki_articles = [
-        ("کھیتی باڑی کے فضلے کا انتظام", "Agricultural Waste Management",
-         "کھیتی باڑی کے فضلے کو کیسے استعمال کیا جائے۔ فصلوں کی باقیات، جانوروں کا گوبر، اور دیگر نامیاتی مواد کو کمپوسٹ اور بائیوچار میں تبدیل کیا جا سکتا ہے۔",
-         "How to utilize agricultural waste. Crop residues, animal manure, and other organic materials can be converted into compost and biochar.",
-         "waste_management", "کمپوسٹ, بائیوچار, کھاد", "https://en.wikipedia.org/wiki/Agricultural_waste"),
-        ("پانی کی بچت", "Water Conservation",
-         "پانی کے موثر استعمال کے طریقے۔ بارش کے پانی کا ذخیرہ، ڈرپ اریگیشن، اور موسمی اریگیشن سے پانی کی بچت ہو سکتی ہے۔",
-         "Methods for efficient water usage. Rainwater harvesting, drip irrigation, and seasonal irrigation can save water.",
-         "resource_management", "پانی, بچت, اریگیشن", "https://en.wikipedia.org/wiki/Water_conservation"),
-        ("مٹی کی صحت", "Soil Health",
-         "مٹی کی صحت کو برقرار رکھنے کے طریقے۔ نامیاتی کھاد، کروپ روٹیشن، اور مناسب زمین کی تیاری مٹی کی صحت کو بہتر بناتی ہے۔",
-         "Methods to maintain soil health. Organic fertilizers, crop rotation, and proper land preparation improve soil health.",
-         "sustainable_practices", "مٹی, صحت, نامیاتی", "https://en.wikipedia.org/wiki/Soil_health"),
-        ("کھیتی باڑی میں ماحولیاتی تبدیلی", "Climate Change in Agriculture",
-         "ماحولیاتی تبدیلی کا کھیتی باڑی پر اثر اور اس سے نمٹنے کے طریقے۔",
-         "Impact of climate change on agriculture and methods to deal with it.",
-         "sustainable_practices", "موسم, تبدیلی, ماحول", "https://en.wikipedia.org/wiki/Climate_change_and_agriculture"),
-        ("آرگینک کھیتی باڑی", "Organic Farming",
-         "آرگینک کھیتی باڑی کے اصول اور طریقے۔ کیمیائی کھادوں اور کیڑے مار ادویات کے بغیر قدرتی طریقوں سے کھیتی باڑی۔",
-         "Principles and methods of organic farming. Farming using natural methods without chemical fertilizers and pesticides.",
-         "sustainable_practices", "نامیاتی, قدرتی, ماحول دوست", "https://en.wikipedia.org/wiki/Organic_farming"),
-        ("بائیو ڈائیورسٹی", "Biodiversity",
-         "کھیتی باڑی میں حیاتیاتی تنوع کی اہمیت۔ مختلف فصلوں اور جانوروں کی اقسام کا برقرار رکھنا۔",
-         "Importance of biodiversity in agriculture. Maintaining different varieties of crops and animals.",
-         "sustainable_practices", "تنوع, حیاتیات, فصل", "https://en.wikipedia.org/wiki/Agricultural_biodiversity"),
-        ("ڈرپ اریگیشن", "Drip Irrigation",
-         "ڈرپ اریگیشن نظام کی تفصیلات۔ پانی کی بچت اور موثر اریگیشن کا بہترین طریقہ۔",
-         "Details of drip irrigation system. The best method for water saving and efficient irrigation.",
-         "resource_management", "اریگیشن, پانی, بچت", "https://en.wikipedia.org/wiki/Drip_irrigation"),
-        ("کمپوسٹ", "Compost",
-         "کمپوسٹ بنانے کا طریقہ اور اس کے فوائد۔ نامیاتی کچرے کو مفید کھاد میں تبدیل کرنا۔",
-         "Method of making compost and its benefits. Converting organic waste into useful fertilizer.",
-         "waste_management", "کمپوسٹ, کھاد, نامیاتی", "https://en.wikipedia.org/wiki/Compost"),
-        ("کروپ روٹیشن", "Crop Rotation",
-         "کروپ روٹیشن کی اہمیت اور طریقہ کار۔ مختلف فصلوں کی باری باری کاشت سے مٹی کی صحت بہتر ہوتی ہے۔",
-         "Importance and methodology of crop rotation. Alternating different crops improves soil health.",
-         "sustainable_practices", "فصل, باری, صحت", "https://en.wikipedia.org/wiki/Crop_rotation"),
-    ]
-    cursor.executemany('''
-        INSERT OR IGNORE INTO wiki_articles (title_ur, title_en, content_ur, content_en, category, tags, wiki_url)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', wiki_articles)
-    
-    # Sample weather alerts
-    weather_alerts = [
-        ("Punjab", "heatwave", "high", "اگلے 3 دنوں میں گرمی کی لہر متوقع ہے", "Heatwave expected in next 3 days", None),
-        ("Sindh", "heavy_rain", "medium", "بارش کی پیش گوئی", "Rain forecast", None)
-    ]
-    cursor.executemany('''
-        INSERT OR IGNORE INTO weather_alerts (region, alert_type, severity, message_ur, message_en, valid_until)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', weather_alerts)
-    
-    # Pest alerts are populated from database migration/update scripts
-    # Comprehensive pest data is added separately to avoid duplicates
+    """Apply pending schema migrations (just a version check once up to date)."""
+    migrations.migrate()
+
+# Chat history is written behind the response in batches (see write_behind.py)
+chat_writer = WriteBehindBuffer(
+    "chat_history",
+    'INSERT INTO chat_history (user_id, question, answer, language, created_at) VALUES (?, ?, ?, ?, ?)',
+    max_batch=int(os.getenv("KISAAN_CHAT_FLUSH_ROWS", "100")),
+    flush_interval=float(os.getenv("KISAAN_CHAT_FLUSH_MS", "500")) / 1000,
+)
+
+# Chat timings for /api/stats; streamed answers also record time to first byte
+chat_latency = latency.LatencyStats("chat")
+chat_stream_ttfb = latency.LatencyStats("chat_stream_ttfb")
+chat_stream_total = latency.LatencyStats("chat_stream_total")
+
+# Upstream refreshes run in the background (see scheduler.py); GET endpoints
+# only read what these jobs have stored
+def refresh_market_prices():
+    """Scheduled job: fetch commodity prices and upsert them."""
+    from market_integration import fetch_market_prices_from_api
+    return {"commodities": len(fetch_market_prices_from_api())}
+
+def refresh_weather_alerts():
+    """Scheduled job: sweep the alert cities and store new alerts."""
+    from weather_integration import fetch_weather_alerts_from_api, update_weather_alerts_in_db
+    return update_weather_alerts_in_db(fetch_weather_alerts_from_api())
+
+refresh_scheduler = RefreshScheduler()
+refresh_scheduler.add_job("market_prices", refresh_market_prices,
+                          float(os.getenv("KISAAN_MARKET_REFRESH_S", "3600")))
+refresh_scheduler.add_job("weather_alerts", refresh_weather_alerts,
+                          float(os.getenv("KISAAN_WEATHER_REFRESH_S", "900")))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     init_db()
+    answer_cache.answers.prune()
+    refresh_scheduler.start()
     yield
-    # Shutdown (if needed)
+    # Shutdown: stop refresh jobs, then drain buffered writes before the pool closes
+    await refresh_scheduler.stop()
+    chat_writer.close()
+    answer_cache.answers.close()
+    http_client.close()
+    db.shutdown()
 
 app = FastAPI(
     title="Kisaan Academy API",
@@ -320,6 +100,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Pydantic models
@@ -335,6 +116,9 @@ class ChatMessage(BaseModel):
     question: str
     language: str = "ur"
 
+class WeatherBatchRequest(BaseModel):
+    cities: List[str]
+
 class MarketPriceFilter(BaseModel):
     crop_name: Optional[str] = None
     region: Optional[str] = None
@@ -345,68 +129,108 @@ class MarketPriceFilter(BaseModel):
 async def root():
     return {"message": "Kisaan Academy API", "status": "running"}
 
+def _gemini_stats():
+    try:
+        import gemini_integration
+    except ImportError:
+        return None
+    return gemini_integration.stats()
+
+@app.get("/api/stats")
+async def get_stats():
+    """
+    Runtime statistics for monitoring (database pool, write-behind queue,
+    refresh jobs, outbound HTTP, record/replay transport, upstream circuit
+    breakers, in-process cache counters, chat latency percentiles, async
+    Gemini calls in flight and the chat answer cache).
+    """
+    return {
+        "db": db.pool_stats(),
+        "chat_writer": chat_writer.stats(),
+        "scheduler": refresh_scheduler.stats(),
+        "http": http_client.stats(),
+        "transport": transport.stats(),
+        "breakers": circuit_breaker.all_stats(),
+        "caches": ttl_cache.all_stats(),
+        "latency": latency.all_stats(),
+        "gemini": _gemini_stats(),
+        "answer_cache": answer_cache.answers.stats(),
+    }
+
 # User endpoints
 @app.post("/api/users")
 async def create_user(user: UserCreate):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    cursor.execute('''
+    user_id = await db.execute('''
         INSERT INTO users (name, email, phone, region, language)
         VALUES (?, ?, ?, ?, ?)
     ''', (user.name, user.email, user.phone, user.region, user.language))
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
     return {"id": user_id, "message": "User created successfully"}
 
 @app.get("/api/users/{user_id}")
 async def get_user(user_id: int):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    conn.close()
+    user = await db.fetch_one('SELECT * FROM users WHERE id = ?', (user_id,))
     if user:
         return dict(user)
     raise HTTPException(status_code=404, detail="User not found")
 
+def page_query(table, columns, filters, params, cursor, limit):
+    """pagination.keyset_query() that reports a bad cursor as HTTP 400."""
+    try:
+        return pagination.keyset_query(table, columns, filters, params, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def newest_per_title(table: str, same: Sequence[str] = ()) -> str:
+    """
+    Filter keeping only the newest row (by created_at, id) for each English
+    title, so re-seeded or re-imported duplicates are listed once. Columns in
+    `same` must also match (e.g. the category being listed). Uses the
+    (title_en, created_at, id) index, one seek per row.
+    """
+    conditions = [f"newer.title_en = {table}.title_en",
+                  f"(newer.created_at, newer.id) > ({table}.created_at, {table}.id)"]
+    conditions += [f"newer.{column} = {table}.{column}" for column in same]
+    return f"NOT EXISTS (SELECT 1 FROM {table} AS newer WHERE {' AND '.join(conditions)})"
+
 # Course endpoints
 @app.get("/api/courses")
-async def get_courses(language: str = "ur"):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM courses ORDER BY created_at DESC')
-    courses = cursor.fetchall()
-    conn.close()
-    
-    # Remove duplicates by title_en to ensure unique courses
-    seen_titles = set()
+async def get_courses(response: Response, language: str = "ur", fields: str = "full",
+                      cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    List courses newest first, one per English title.
+    Without cursor or limit every course is returned. With either, one page
+    comes back; pass the X-Next-Cursor response header back as ?cursor= to
+    get the next page. fields=summary omits the course content.
+    """
+    lang = language if language in ["ur", "en"] else "ur"
+    columns = ["id", f"title_{lang}", f"description_{lang}", "category", "video_url", "created_at"]
+    if fields != "summary":
+        columns.append(f"content_{lang}")
+    
+    limit = pagination.page_size(limit) if cursor or limit else None
+    query, params = page_query("courses", columns, [newest_per_title("courses")], [], cursor, limit)
+    courses, next_cursor = pagination.split_page(await db.fetch_all(query, params), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
     result = []
     for course in courses:
-        title_key = course["title_en"]
-        if title_key not in seen_titles:
-            seen_titles.add(title_key)
-            result.append({
-                "id": course["id"],
-                "title": course[f"title_{language}"] if language in ["ur", "en"] else course["title_ur"],
-                "description": course[f"description_{language}"] if language in ["ur", "en"] else course["description_ur"],
-                "category": course["category"],
-                "video_url": course["video_url"],
-                "content": course[f"content_{language}"] if language in ["ur", "en"] else course["content_ur"],
-                "created_at": course["created_at"]
-            })
+        item = {
+            "id": course["id"],
+            "title": course[f"title_{lang}"],
+            "description": course[f"description_{lang}"],
+            "category": course["category"],
+            "video_url": course["video_url"],
+            "created_at": course["created_at"]
+        }
+        if fields != "summary":
+            item["content"] = course[f"content_{lang}"]
+        result.append(item)
     return result
 
 @app.get("/api/courses/{course_id}")
 async def get_course(course_id: int, language: str = "ur"):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM courses WHERE id = ?', (course_id,))
-    course = cursor.fetchone()
-    conn.close()
+    course = await db.fetch_one('SELECT * FROM courses WHERE id = ?', (course_id,))
     
     if course:
         return {
@@ -421,42 +245,38 @@ async def get_course(course_id: int, language: str = "ur"):
     raise HTTPException(status_code=404, detail="Course not found")
 
 # Market price endpoints
-@app.get("/api/market-prices")
-async def get_market_prices(crop_name: Optional[str] = None, region: Optional[str] = None, update: bool = False):
+def market_prices_query(crop_name: Optional[str], region: Optional[str], columns: str = "*", limit: int = 100):
     """
-    Get market prices from database.
-    If update=true, fetches latest data from RapidAPI first.
+    Build the latest-prices query so it is served by the market_prices indexes:
+    (crop_key, region, recorded_at), (crop_key, recorded_at), (region, recorded_at)
+    or (recorded_at), without a sort step.
     """
-    # Optionally fetch from RapidAPI if requested
-    if update:
-        try:
-            from market_integration import fetch_market_prices_from_api
-            prices = fetch_market_prices_from_api()
-            print(f"✓ Updated market prices from RapidAPI: {len(prices)} commodities")
-        except ImportError:
-            pass  # market_integration not available
-        except Exception as e:
-            print(f"Error updating market prices from API: {e}")
-    
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = 'SELECT * FROM market_prices WHERE 1=1'
+    query = f'SELECT {columns} FROM market_prices WHERE 1=1'
     params = []
     
     if crop_name:
-        query += ' AND crop_name LIKE ?'
-        params.append(f"%{crop_name}%")
+        query += ' AND crop_key = ?'
+        params.append(crop_key(crop_name))
     if region:
         query += ' AND region = ?'
         params.append(region)
     
-    query += ' ORDER BY recorded_at DESC LIMIT 100'
+    query += ' ORDER BY recorded_at DESC LIMIT ?'
+    params.append(limit)
+    return query, params
+
+@app.get("/api/market-prices")
+async def get_market_prices(crop_name: Optional[str] = None, region: Optional[str] = None, update: bool = False):
+    """
+    Get market prices from database.
+    If update=true, asks the background job to refresh from RapidAPI soon;
+    this response still returns the stored prices.
+    """
+    if update:
+        refresh_scheduler.trigger("market_prices")
     
-    cursor.execute(query, params)
-    prices = cursor.fetchall()
-    conn.close()
+    query, params = market_prices_query(crop_name, region)
+    prices = await db.fetch_all(query, params)
     
     return [dict(price) for price in prices]
 
@@ -467,7 +287,7 @@ async def update_market_prices():
     """
     try:
         from market_integration import fetch_market_prices_from_api
-        commodities = fetch_market_prices_from_api()
+        commodities = await run_in_threadpool(fetch_market_prices_from_api)
         return {
             "status": "success",
             "message": f"Updated {len(commodities)} commodity prices",
@@ -481,74 +301,79 @@ async def update_market_prices():
 @app.get("/api/market-prices/forecast/{crop_name}")
 async def get_price_forecast(crop_name: str, region: Optional[str] = None):
     # Simple forecasting - in production, use Prophet or ARIMA
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = 'SELECT price_per_kg, recorded_at FROM market_prices WHERE crop_name = ?'
-    params = [crop_name]
-    
-    if region:
-        query += ' AND region = ?'
-        params.append(region)
-    
-    query += ' ORDER BY recorded_at DESC LIMIT 30'
+    # Reads the last 30 daily rollups, so the cost does not grow with raw history
+    days = await db.run_read(rollups.history, crop_name, region, "day", 30)
     
-    cursor.execute(query, params)
-    prices = cursor.fetchall()
-    conn.close()
-    
-    if not prices:
+    if not days:
         return {"forecast": "Insufficient data", "trend": "neutral"}
     
-    # Simple trend calculation
-    recent_avg = sum(p["price_per_kg"] for p in prices[:10]) / min(10, len(prices))
-    older_avg = sum(p["price_per_kg"] for p in prices[10:20]) / max(1, len(prices) - 10)
+    # Simple trend calculation over daily means
+    recent_avg = sum(d["mean"] for d in days[:10]) / min(10, len(days))
+    older_avg = sum(d["mean"] for d in days[10:20]) / max(1, len(days[10:20])) if len(days) > 10 else recent_avg
     
     trend = "increasing" if recent_avg > older_avg else "decreasing" if recent_avg < older_avg else "stable"
     
     return {
         "crop_name": crop_name,
         "region": region or "All",
-        "current_price": prices[0]["price_per_kg"],
+        "current_price": days[0]["close"],
         "forecast": recent_avg * 1.05 if trend == "increasing" else recent_avg * 0.95,
         "trend": trend,
         "confidence": "medium"
     }
 
+@app.get("/api/market-prices/history/{crop_name}")
+async def get_price_history(crop_name: str, region: Optional[str] = None, interval: str = "day", limit: int = 30):
+    """
+    OHLC price history (open/high/low/close, mean, count) per day or hour,
+    newest first, read from the rollup tables.
+    """
+    if interval not in rollups.INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of: {', '.join(rollups.INTERVALS)}")
+    limit = max(1, min(limit, 1000))
+    return await db.run_read(rollups.history, crop_name, region, interval, limit)
+
+# Weather endpoints
+async def _weather_batch(cities: List[str]):
+    from weather_integration import WEATHER_BATCH_MAX, fetch_observation_batch, observations_to_columns
+    
+    # Trimmed and de-duplicated, first spelling wins
+    cities = list(dict.fromkeys(city.strip() for city in cities if city.strip()))
+    if not cities:
+        raise HTTPException(status_code=400, detail="No cities given")
+    if len(cities) > WEATHER_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {WEATHER_BATCH_MAX} cities per request")
+    observations = await run_in_threadpool(fetch_observation_batch, cities)
+    return observations_to_columns(observations)
+
+@app.get("/api/weather")
+async def get_weather_batch(cities: str):
+    """
+    Current weather for many cities in one call: ?cities=Lahore,Multan,...
+    Served from the shared observation cache; misses are fetched together.
+    Columnar response: one array per field, one slot per requested city.
+    """
+    return await _weather_batch(cities.split(","))
+
+@app.post("/api/weather")
+async def post_weather_batch(request: WeatherBatchRequest):
+    """Same as GET /api/weather, for lists too long for a URL ({"cities": [...]})."""
+    return await _weather_batch(request.cities)
+
 # Weather alerts endpoints
 @app.get("/api/weather-alerts")
-async def get_weather_alerts(region: Optional[str] = None, language: str = "ur", update: bool = False):
+async def get_weather_alerts(region: Optional[str] = None, language: str = "ur", update: bool = False,
+                             crop: Optional[str] = None):
     """
     Get weather alerts from database.
-    If update=true, fetches latest data from Weather API first.
-    Automatically fetches from API if no valid alerts exist in database.
+    Alerts are refreshed from Weather API by a background job; update=true
+    asks it to run soon (this response still returns the stored alerts).
+    crop keeps alerts relevant to that crop (and those relevant to all crops).
     """
-    # Check if we have valid alerts in database
-    conn_check = sqlite3.connect(DATABASE)
-    cursor_check = conn_check.cursor()
-    cursor_check.execute('SELECT COUNT(*) FROM weather_alerts WHERE valid_until IS NULL OR valid_until > datetime("now")')
-    count = cursor_check.fetchone()[0]
-    conn_check.close()
-    
-    # Fetch from API if update requested or no valid alerts in database
-    if update or count == 0:
-        try:
-            from weather_integration import fetch_weather_alerts_from_api, update_weather_alerts_in_db
-            alerts = fetch_weather_alerts_from_api(region)
-            if alerts:
-                update_weather_alerts_in_db(alerts)
-                print(f"✓ Updated {len(alerts)} weather alerts from API")
-        except ImportError:
-            pass  # weather_integration not available
-        except Exception as e:
-            print(f"Error updating weather alerts from API: {e}")
+    if update:
+        refresh_scheduler.trigger("weather_alerts")
     
     # Get from database
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # Return all alerts, not just valid ones, to ensure we have data to show
     query = 'SELECT * FROM weather_alerts WHERE 1=1'
     params = []
@@ -557,11 +382,13 @@ async def get_weather_alerts(region: Optional[str] = None, language: str = "ur",
         query += ' AND region = ?'
         params.append(region)
     
+    if crop:
+        query += " AND (crops IS NULL OR instr(',' || crops || ',', ',' || ? || ',') > 0)"
+        params.append(crop_key(crop))
+    
     query += ' ORDER BY created_at DESC LIMIT 20'
     
-    cursor.execute(query, params)
-    alerts = cursor.fetchall()
-    conn.close()
+    alerts = await db.fetch_all(query, params)
     
     result = []
     for alert in alerts:
@@ -575,38 +402,10 @@ async def get_weather_alerts(region: Optional[str] = None, language: str = "ur",
             "alert_type": alert["alert_type"],
             "severity": alert["severity"] if "severity" in alert.keys() else "medium",
             "message": message,
+            "crops": alert["crops"].split(",") if alert["crops"] else [],
             "created_at": alert["created_at"]
         })
     
-    # If no results and we didn't fetch from API, try one more time
-    if not result:
-        try:
-            from weather_integration import fetch_weather_alerts_from_api, update_weather_alerts_in_db
-            alerts = fetch_weather_alerts_from_api(region)
-            if alerts:
-                update_weather_alerts_in_db(alerts)
-                # Re-query after update
-                conn = sqlite3.connect(DATABASE)
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                alerts = cursor.fetchall()
-                conn.close()
-                result = []
-                for alert in alerts:
-                    message_key = f"message_{language}" if language in ["ur", "en"] else "message_ur"
-                    message = alert[message_key] if message_key in alert.keys() else (alert["message_ur"] if "message_ur" in alert.keys() else "No message available")
-                    result.append({
-                        "id": alert["id"],
-                        "region": alert["region"],
-                        "alert_type": alert["alert_type"],
-                        "severity": alert["severity"] if "severity" in alert.keys() else "medium",
-                        "message": message,
-                        "created_at": alert["created_at"]
-                    })
-        except Exception as e:
-            print(f"Error fetching weather alerts: {e}")
-    
     return result
 
 # Endpoint to manually update weather alerts from API
@@ -617,9 +416,9 @@ async def update_weather_alerts_from_api(region: Optional[str] = None):
     """
     try:
         from weather_integration import fetch_weather_alerts_from_api, update_weather_alerts_in_db
-        alerts = fetch_weather_alerts_from_api(region)
+        alerts = await run_in_threadpool(fetch_weather_alerts_from_api, region)
         if alerts:
-            update_weather_alerts_in_db(alerts)
+            await run_in_threadpool(update_weather_alerts_in_db, alerts)
             return {"status": "success", "message": f"Updated {len(alerts)} weather alerts", "count": len(alerts)}
         else:
             return {"status": "success", "message": "No new alerts found", "count": 0}
@@ -630,31 +429,54 @@ async def update_weather_alerts_from_api(region: Optional[str] = None):
 
 # Pest alerts endpoints
 @app.get("/api/pest-alerts")
-async def get_pest_alerts(region: Optional[str] = None, language: str = "ur", pest_name: Optional[str] = None):
+async def get_pest_alerts(response: Response, region: Optional[str] = None, language: str = "ur",
+                          pest_name: Optional[str] = None, fields: str = "full",
+                          cursor: Optional[str] = None, limit: Optional[int] = None):
     """
     Get pest alerts from database with comprehensive information.
     No API dependency - all data is stored locally.
+    Paged newest first via ?cursor= (X-Next-Cursor header); fields=summary
+    omits prevention/symptoms/treatment text.
     """
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = 'SELECT * FROM pest_alerts WHERE 1=1'
+    filters = []
     params = []
     
     if region:
-        query += ' AND region = ?'
+        filters.append('region = ?')
         params.append(region)
     
     if pest_name:
-        query += ' AND (pest_name_ur LIKE ? OR pest_name_en LIKE ?)'
-        params.extend([f"%{pest_name}%", f"%{pest_name}%"])
-    
-    query += ' ORDER BY created_at DESC LIMIT 20'
-    
-    cursor.execute(query, params)
-    alerts = cursor.fetchall()
-    conn.close()
+        # A name with no searchable tokens matches nothing, not everything
+        pest_ids, pest_params = search.pest_ids_query(pest_name)
+        filters.append(f'id IN ({pest_ids})')
+        params.extend(pest_params)
+    
+    if fields == "summary":
+        columns = ["id", "region", "pest_name_ur", "pest_name_en", "crop_affected", "severity", "created_at"]
+    else:
+        columns = ["*"]
+    
+    limit = pagination.page_size(limit, default=20)
+    query, params = page_query("pest_alerts", columns, filters, params, cursor, limit)
+    alerts, next_cursor = pagination.split_page(await db.fetch_all(query, params), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    if fields == "summary":
+        pest_name_key = "pest_name_en" if language == "en" else "pest_name_ur"
+        return [
+            {
+                "id": alert["id"],
+                "region": alert["region"],
+                "pest_name": alert[pest_name_key],
+                "pest_name_ur": alert["pest_name_ur"] or "",
+                "pest_name_en": alert["pest_name_en"] or "",
+                "crop_affected": alert["crop_affected"],
+                "severity": alert["severity"],
+                "created_at": alert["created_at"]
+            }
+            for alert in alerts
+        ]
     
     result = []
     for alert in alerts:
@@ -683,12 +505,7 @@ async def get_pest_detail(pest_id: int, language: str = "ur"):
     """
     Get detailed information about a specific pest
     """
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM pest_alerts WHERE id = ?', (pest_id,))
-    alert = cursor.fetchone()
-    conn.close()
+    alert = await db.fetch_one('SELECT * FROM pest_alerts WHERE id = ?', (pest_id,))
     
     if alert:
         return {
@@ -708,50 +525,50 @@ async def get_pest_detail(pest_id: int, language: str = "ur"):
 
 # Wiki endpoints
 @app.get("/api/wiki")
-async def get_wiki_articles(category: Optional[str] = None, language: str = "ur"):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+async def get_wiki_articles(response: Response, category: Optional[str] = None, language: str = "ur",
+                            fields: str = "full", cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    List wiki articles newest first, one per English title.
+    Without cursor or limit every article is returned. With either, one page
+    comes back; pass the X-Next-Cursor response header back as ?cursor= to
+    get the next page. fields=summary omits the article content.
+    """
+    lang = language if language in ["ur", "en"] else "ur"
+    columns = ["id", f"title_{lang}", "category", "tags", "wiki_url", "created_at"]
+    if fields != "summary":
+        columns.append(f"content_{lang}")
     
-    query = 'SELECT * FROM wiki_articles WHERE 1=1'
+    filters = []
     params = []
-    
     if category:
-        query += ' AND category = ?'
+        filters.append('category = ?')
         params.append(category)
+    filters.append(newest_per_title("wiki_articles", ["category"] if category else []))
     
-    query += ' ORDER BY created_at DESC'
+    limit = pagination.page_size(limit) if cursor or limit else None
+    query, params = page_query("wiki_articles", columns, filters, params, cursor, limit)
+    articles, next_cursor = pagination.split_page(await db.fetch_all(query, params), limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    cursor.execute(query, params)
-    articles = cursor.fetchall()
-    conn.close()
-    
-    # Remove duplicates by title_en to ensure unique articles
-    seen_titles = set()
     result = []
     for article in articles:
-        title_key = article["title_en"]
-        if title_key not in seen_titles:
-            seen_titles.add(title_key)
-            result.append({
-                "id": article["id"],
-                "title": article[f"title_{language}"] if language in ["ur", "en"] else article["title_ur"],
-                "content": article[f"content_{language}"] if language in ["ur", "en"] else article["content_ur"],
-                "category": article["category"],
-                "tags": article["tags"],
-                "wiki_url": article["wiki_url"] if article["wiki_url"] else "",
-                "created_at": article["created_at"]
-            })
+        item = {
+            "id": article["id"],
+            "title": article[f"title_{lang}"],
+            "category": article["category"],
+            "tags": article["tags"],
+            "wiki_url": article["wiki_url"] if article["wiki_url"] else "",
+            "created_at": article["created_at"]
+        }
+        if fields != "summary":
+            item["content"] = article[f"content_{lang}"]
+        result.append(item)
     return result
 
 @app.get("/api/wiki/{article_id}")
 async def get_wiki_article(article_id: int, language: str = "ur"):
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM wiki_articles WHERE id = ?', (article_id,))
-    article = cursor.fetchone()
-    conn.close()
+    article = await db.fetch_one('SELECT * FROM wiki_articles WHERE id = ?', (article_id,))
     
     if article:
         return {
@@ -765,51 +582,124 @@ async def get_wiki_article(article_id: int, language: str = "ur"):
         }
     raise HTTPException(status_code=404, detail="Article not found")
 
+# Search endpoint
+@app.get("/api/search")
+async def search_content(q: str, language: str = "ur", type: Optional[str] = None, limit: int = 20):
+    """
+    Full-text search over wiki articles, courses and pest alerts (Urdu and English).
+    Results are BM25-ranked with highlighted snippets in the requested language.
+    """
+    if type and type not in search.DOC_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(search.DOC_TYPES)}")
+    limit = max(1, min(limit, 100))
+    return await db.run_read(search.search, q, language, type, limit)
+
+def _keyword_answer(message: ChatMessage) -> str:
+    """Keyword-based answer used when the Gemini integration cannot be imported."""
+    question = message.question.lower()
+    response = "میں آپ کی مدد کرنے کے لیے یہاں ہوں۔ براہ کرم اپنا سوال مزید تفصیل سے پوچھیں۔"
+    
+    if message.language == "ur":
+        if "price" in question or "قیمت" in question:
+            response = "قیمتوں کے لیے، براہ کرم مارکیٹ انٹیلی جنس ہب چیک کریں۔"
+        elif "disease" in question or "بیماری" in question or "روگ" in question:
+            response = "فصلوں کی بیماریوں کے لیے، آپ کا مقامی زرعی ماہر سے مشورہ لینا بہتر ہوگا۔"
+        elif "compost" in question or "کمپوسٹ" in question:
+            response = "کمپوسٹ بنانے کے لیے، براہ کرم Sustainable Practices Wiki میں دیکھیں۔"
+        elif "water" in question or "پانی" in question:
+            response = "پانی کی بچت کے طریقوں کے لیے، ہمارے وسائل کیلکولیٹرز دیکھیں۔"
+    else:
+        if "price" in question:
+            response = "Please check the Market Intelligence Hub for prices."
+        elif "disease" in question:
+            response = "For crop diseases, it's better to consult your local agricultural expert."
+        elif "compost" in question:
+            response = "For making compost, please check the Sustainable Practices Wiki."
+        elif "water" in question:
+            response = "For water conservation methods, see our resource calculators."
+    return response
+
 # Chat endpoint (with Gemini API integration support)
 @app.post("/api/chat")
 async def chat(message: ChatMessage):
-    question = message.question.lower()
+    started = time.perf_counter()
     
     # Try to use Gemini API if available
     try:
-        from gemini_integration import get_agri_response
-        response = get_agri_response(message.question, message.language)
+        import gemini_integration
+        if gemini_integration.GEMINI_ASYNC:
+            response = await gemini_integration.get_agri_response_async(message.question, message.language)
+        else:
+            response = await run_in_threadpool(gemini_integration.get_agri_response, message.question,
+                                               message.language)
     except ImportError:
         # Fallback to keyword-based responses
-        response = "میں آپ کی مدد کرنے کے لیے یہاں ہوں۔ براہ کرم اپنا سوال مزید تفصیل سے پوچھیں۔"
-        
-        if message.language == "ur":
-            if "price" in question or "قیمت" in question:
-                response = "قیمتوں کے لیے، براہ کرم مارکیٹ انٹیلی جنس ہب چیک کریں۔"
-            elif "disease" in question or "بیماری" in question or "روگ" in question:
-                response = "فصلوں کی بیماریوں کے لیے، آپ کا مقامی زرعی ماہر سے مشورہ لینا بہتر ہوگا۔"
-            elif "compost" in question or "کمپوسٹ" in question:
-                response = "کمپوسٹ بنانے کے لیے، براہ کرم Sustainable Practices Wiki میں دیکھیں۔"
-            elif "water" in question or "پانی" in question:
-                response = "پانی کی بچت کے طریقوں کے لیے، ہمارے وسائل کیلکولیٹرز دیکھیں۔"
-        else:
-            if "price" in question:
-                response = "Please check the Market Intelligence Hub for prices."
-            elif "disease" in question:
-                response = "For crop diseases, it's better to consult your local agricultural expert."
-            elif "compost" in question:
-                response = "For making compost, please check the Sustainable Practices Wiki."
-            elif "water" in question:
-                response = "For water conservation methods, see our resource calculators."
-    
-    # Save chat history
+        response = _keyword_answer(message)
+    
+    # Save chat history (queued; written in the background)
     if message.user_id:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO chat_history (user_id, question, answer, language)
-            VALUES (?, ?, ?, ?)
-        ''', (message.user_id, message.question, response, message.language))
-        conn.commit()
-        conn.close()
+        chat_writer.add((message.user_id, message.question, response, message.language, db.utc_timestamp()))
     
+    chat_latency.record((time.perf_counter() - started) * 1000)
     return {"answer": response, "language": message.language}
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _single(text: str):
+    yield text
+
+async def _chat_events(message: ChatMessage, started: float):
+    try:
+        import gemini_integration
+        if gemini_integration.GEMINI_ASYNC:
+            pieces = gemini_integration.stream_agri_response_async(message.question, message.language)
+        else:
+            # Each next() of the sync generator runs on the threadpool
+            pieces = iterate_in_threadpool(gemini_integration.stream_agri_response(message.question,
+                                                                                   message.language))
+    except ImportError:
+        pieces = _single(_keyword_answer(message))
+    
+    answer = []
+    ttfb_ms = None
+    async for text in pieces:
+        if ttfb_ms is None:
+            ttfb_ms = (time.perf_counter() - started) * 1000
+            chat_stream_ttfb.record(ttfb_ms)
+        answer.append(text)
+        yield _sse("chunk", {"text": text})
+    total_ms = (time.perf_counter() - started) * 1000
+    chat_stream_total.record(total_ms)
+    
+    # Only a completed stream is saved; a client that disconnects closes the generator before this
+    response = "".join(answer).strip()
+    if message.user_id and response:
+        chat_writer.add((message.user_id, message.question, response, message.language, db.utc_timestamp()))
+    yield _sse("done", {
+        "language": message.language,
+        "ttfb_ms": round(ttfb_ms or total_ms, 1),
+        "total_ms": round(total_ms, 1),
+        "chars": len(response),
+    })
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage):
+    """
+    Chat answer streamed as Server-Sent Events while Gemini generates it.
+    
+    Each piece of the answer arrives as a "chunk" event (data: {"text"}),
+    followed by one "done" event with the language, time to first byte,
+    total time and answer length. The full answer is saved to chat history
+    once the stream completes.
+    """
+    return StreamingResponse(
+        _chat_events(message, time.perf_counter()),
+        media_type="text/event-stream",
+        # Proxies (nginx) must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -4,10 +4,14 @@ Using RapidAPI Commodity Prices API
 """
 
 import os
-import http.client
-import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict
-from datetime import datetime
+import db
+import http_client
+import rollups
+from circuit_breaker import CircuitBreaker
+from ttl_cache import TTLCache
+from crops import CROPS, crop_key, find_crop_key, display_name
 
 # Load environment variables from .env file if available
 try:
@@ -19,13 +23,38 @@ except ImportError:
 # RapidAPI Configuration
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY", "906eb927b3mshb92dc7f1f8ff7e9p1ec2c3jsn9ba32e99f5f1")
 RAPIDAPI_HOST = "commodity-prices2.p.rapidapi.com"
+RAPIDAPI_BASE_URL = os.getenv("RAPIDAPI_BASE_URL", f"https://{RAPIDAPI_HOST}")
 
-def fetch_commodity_price(commodity_name: str) -> Optional[Dict]:
+# Refresh fan-out: commodities fetched at once, and each one's deadline
+MARKET_FETCH_CONCURRENCY = int(os.getenv("KISAAN_MARKET_CONCURRENCY", "9"))
+MARKET_REQUEST_TIMEOUT = float(os.getenv("KISAAN_MARKET_TIMEOUT", "8"))
+
+# Live prices asked for in chat are cached per commodity; failures briefly
+PRICE_CACHE_TTL = float(os.getenv("KISAAN_PRICE_TTL", "300"))
+PRICE_NEGATIVE_TTL = float(os.getenv("KISAAN_NEGATIVE_TTL", "30"))
+price_cache = TTLCache("commodity_prices", PRICE_CACHE_TTL, max_entries=256, negative_ttl=PRICE_NEGATIVE_TTL)
+
+# Trips when RapidAPI keeps failing or is slow; calls then fail in microseconds
+rapidapi_breaker = CircuitBreaker("rapidapi")
+
+# Common agricultural commodities in Pakistan
+COMMODITY_NAMES = [
+    "wheat", "rice", "cotton", "sugar", "corn", "soybeans",
+    "palm-oil", "sunflower-oil", "rapeseed-oil"
+]
+
+def fetch_commodity_price(commodity_name: str, timeout: float = MARKET_REQUEST_TIMEOUT) -> Optional[Dict]:
     """
     Fetch price for a specific commodity from RapidAPI
     
+    Uses the shared keep-alive session (http_client.py), so repeated calls
+    reuse pooled connections. Transient failures are retried with jittered
+    backoff inside the timeout; while RapidAPI's circuit breaker is open the
+    call returns None without a request.
+    
     Args:
         commodity_name: Name of commodity (e.g., "wheat", "rice", "cotton", "sugar")
+        timeout: Deadline in seconds for this commodity, retries included
         
     Returns:
         Dictionary with commodity price data or None if error
@@ -34,51 +63,45 @@ def fetch_commodity_price(commodity_name: str) -> Optional[Dict]:
         return None
     
     try:
-        conn = http.client.HTTPSConnection(RAPIDAPI_HOST)
         headers = {
             'x-rapidapi-key': RAPIDAPI_KEY,
             'x-rapidapi-host': RAPIDAPI_HOST
         }
         
         # Replace {name} with actual commodity name
-        endpoint = f"/api/Commodity/{commodity_name}"
-        conn.request("GET", endpoint, headers=headers)
-        
-        res = conn.getresponse()
-        data = res.read()
+        res = http_client.get(f"{RAPIDAPI_BASE_URL}/api/Commodity/{commodity_name}", headers=headers,
+                              timeout=timeout, breaker=rapidapi_breaker)
         
-        if res.status == 200:
-            result = json.loads(data.decode("utf-8"))
-            return result
+        if res.status_code == 200:
+            return res.json()
         else:
-            print(f"API Error: {res.status} - {data.decode('utf-8')}")
+            print(f"API Error: {res.status_code} - {res.text}")
             return None
             
     except Exception as e:
         print(f"Error fetching commodity price for {commodity_name}: {e}")
         return None
 
-def fetch_all_commodities() -> List[Dict]:
+def fetch_all_commodities(commodity_names: Optional[List[str]] = None) -> List[Dict]:
     """
-    Fetch prices for common agricultural commodities
+    Fetch prices for common agricultural commodities concurrently
+    
+    Up to MARKET_FETCH_CONCURRENCY requests run at once over the shared
+    connection pool, each with its own deadline, so a full refresh takes
+    about as long as the slowest commodity instead of the sum of all.
     
+    Args:
+        commodity_names: API commodity names (default: COMMODITY_NAMES)
+        
     Returns:
-        List of commodity price dictionaries
+        List of commodity price dictionaries, in request order
     """
-    commodities = []
-    
-    # Common agricultural commodities in Pakistan
-    commodity_names = [
-        "wheat", "rice", "cotton", "sugar", "corn", "soybeans",
-        "palm-oil", "sunflower-oil", "rapeseed-oil"
-    ]
+    names = commodity_names or COMMODITY_NAMES
+    workers = max(1, min(MARKET_FETCH_CONCURRENCY, len(names)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kisaan-market-fetch") as executor:
+        results = list(executor.map(fetch_commodity_price, names))
     
-    for name in commodity_names:
-        price_data = fetch_commodity_price(name)
-        if price_data:
-            commodities.append(price_data)
-    
-    return commodities
+    return [price_data for price_data in results if price_data]
 
 def get_current_market_price(crop_name: str) -> Optional[Dict]:
     """
@@ -90,44 +113,15 @@ def get_current_market_price(crop_name: str) -> Optional[Dict]:
     Returns:
         Price data dictionary or None
     """
-    # Map crop names to API commodity names
-    crop_mapping = {
-        # Urdu names
-        "گندم": "wheat",
-        "چاول": "rice",
-        "کپاس": "cotton",
-        "چینی": "sugar",
-        "مکئی": "corn",
-        
-        # English names
-        "wheat": "wheat",
-        "rice": "rice",
-        "cotton": "cotton",
-        "sugar": "sugar",
-        "corn": "corn",
-        "maize": "corn",
-        
-        # Additional mappings
-        "soybeans": "soybeans",
-        "palm oil": "palm-oil",
-        "sunflower oil": "sunflower-oil",
-    }
-    
-    # Normalize input
-    crop_lower = crop_name.lower().strip()
-    
-    # Check direct mapping
-    api_name = crop_mapping.get(crop_name) or crop_mapping.get(crop_lower)
-    
-    if not api_name:
-        # Try fuzzy matching
-        for key, value in crop_mapping.items():
-            if crop_lower in key.lower() or key.lower() in crop_lower:
-                api_name = value
-                break
+    # Map Urdu/English crop names (and loose variants) to a canonical crop key
+    key = crop_key(crop_name)
+    if key not in CROPS:
+        key = find_crop_key(crop_name)
     
-    if api_name:
-        return fetch_commodity_price(api_name)
+    if key:
+        commodity = CROPS[key]["api"]
+        return price_cache.get(commodity, lambda: fetch_commodity_price(commodity),
+                               wait_timeout=MARKET_REQUEST_TIMEOUT)
     
     return None
 
@@ -175,63 +169,76 @@ def format_price_for_chat(price_data: Dict, language: str = "en") -> str:
         print(f"Error formatting price: {e}")
         return "Price information not available." if language == "en" else "قیمت کی معلومات دستیاب نہیں ہے۔"
 
-def update_market_prices_in_db(commodities: List[Dict], region: str = "Pakistan"):
+# One row per (crop, region, source, day); matches idx_market_prices_natural_key
+_UPSERT_PRICE_SQL = '''
+    INSERT INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name, recorded_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (crop_key, region, mandi_name, price_date) DO UPDATE SET
+        crop_name = excluded.crop_name,
+        price_per_kg = excluded.price_per_kg,
+        recorded_at = excluded.recorded_at
+    WHERE market_prices.price_per_kg IS NOT excluded.price_per_kg
+'''
+
+def _price_row(commodity: Dict, region: str, source: str, now: str) -> Optional[tuple]:
+    """Map an API/mandi record to an upsert row, or None if it has no usable price."""
+    name = commodity.get("name", commodity.get("crop_name", ""))
+    price = commodity.get("price", commodity.get("current_price", commodity.get("price_per_kg", 0)))
+    if not name or not isinstance(price, (int, float)) or isinstance(price, bool) or price <= 0:
+        return None
+    
+    # Canonical key for indexed lookups, Urdu name for display
+    key = crop_key(name)
+    crop_name = display_name(key, "ur") if key in CROPS else name
+    recorded_at = db.utc_timestamp(commodity["recorded_at"]) if commodity.get("recorded_at") else now
+    return (crop_name, key, commodity.get("region") or region,
+            float(price), commodity.get("mandi_name") or source, recorded_at)
+
+def update_market_prices_in_db(commodities: List[Dict], region: str = "Pakistan", source: str = "RapidAPI") -> Dict[str, int]:
     """
-    Update market prices in SQLite database
+    Upsert market prices into SQLite in one transaction
+    
+    Each (crop, region, source, day) keeps a single row: a new day inserts,
+    a changed price on the same day updates, and an unchanged price is skipped.
+    Rollups (rollups.py) are updated by triggers in the same transaction.
     
     Args:
-        commodities: List of commodity price dictionaries from API
-        region: Region name (default: Pakistan)
+        commodities: List of commodity price dictionaries from API (or mandi
+            records with crop_name, price_per_kg, region, mandi_name, recorded_at)
+        region: Default region when a record has none (default: Pakistan)
+        source: Default source/mandi name when a record has none
+        
+    Returns:
+        Dictionary with inserted, updated and skipped counts
     """
-    import sqlite3
+    now = db.utc_timestamp()
+    rows = [row for row in (_price_row(c, region, source, now) for c in commodities) if row]
+    # Days past retention live only in the rollups; re-ingesting them would double count
+    cutoff = rollups.retention_cutoff()
+    if cutoff:
+        rows = [row for row in rows if row[5] >= cutoff]
+    counts = {"inserted": 0, "updated": 0, "skipped": len(commodities) - len(rows)}
+    if not rows:
+        return counts
     
     try:
-        conn = sqlite3.connect("kisaan_academy.db")
-        cursor = conn.cursor()
-        
-        for commodity in commodities:
-            try:
-                # Extract data from API response (adjust fields based on actual API structure)
-                name = commodity.get("name", "")
-                price = commodity.get("price", commodity.get("current_price", 0))
-                
-                # Map commodity names to Urdu crop names for display
-                crop_name_mapping = {
-                    "wheat": "گندم",
-                    "rice": "چاول",
-                    "cotton": "کپاس",
-                    "sugar": "چینی",
-                    "corn": "مکئی",
-                }
-                
-                crop_name = crop_name_mapping.get(name.lower(), name)
-                
-                # Only insert if price is valid and not duplicate
-                if price and isinstance(price, (int, float)) and price > 0:
-                    # Check for duplicate entry (same crop, region within last 24 hours)
-                    cursor.execute('''
-                        SELECT id FROM market_prices 
-                        WHERE crop_name = ? AND region = ? 
-                        AND recorded_at > datetime('now', '-1 day')
-                        LIMIT 1
-                    ''', (crop_name, region))
-                    
-                    if not cursor.fetchone():
-                        cursor.execute('''
-                            INSERT INTO market_prices (crop_name, region, price_per_kg, mandi_name, recorded_at)
-                            VALUES (?, ?, ?, ?, ?)
-                        ''', (crop_name, region, float(price), "RapidAPI", datetime.now()))
-                    
-            except Exception as e:
-                print(f"Error inserting commodity {commodity.get('name', 'unknown')}: {e}")
-                continue
+        with db.writer() as conn:
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM market_prices").fetchone()[0]
+            # rowcount sums sqlite3_changes(), which leaves out the rollup trigger writes
+            changed = conn.executemany(_UPSERT_PRICE_SQL, rows).rowcount
+            # New rows are exactly those past the previous max id (AUTOINCREMENT)
+            counts["inserted"] = conn.execute(
+                "SELECT COUNT(*) FROM market_prices WHERE id > ?", (last_id,)
+            ).fetchone()[0]
+        counts["updated"] = changed - counts["inserted"]
+        counts["skipped"] += len(rows) - changed
         
-        conn.commit()
-        conn.close()
-        print(f"✓ Updated {len(commodities)} market prices in database")
+        print(f"✓ Market prices: {counts['inserted']} inserted, {counts['updated']} updated, {counts['skipped']} skipped")
         
     except Exception as e:
         print(f"Error updating market prices in database: {e}")
+    
+    return counts
 
 def fetch_market_prices_from_api() -> List[Dict]:
     """
@@ -243,5 +250,6 @@ def fetch_market_prices_from_api() -> List[Dict]:
     commodities = fetch_all_commodities()
     if commodities:
         update_market_prices_in_db(commodities)
+        rollups.compact()
     return commodities
 
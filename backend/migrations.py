@@ -0,0 +1,636 @@
+"""
+Schema Migrations
+Versioned, ordered schema changes applied once by a single migrator
+"""
+
+import os
+import sqlite3
+import time
+from typing import Callable, List, Tuple
+
+import db
+import rollups
+import search
+from crops import crop_key
+
+# Seconds a worker waits for another process that is holding the migration lock
+MIGRATION_LOCK_TIMEOUT = float(os.getenv("KISAAN_MIGRATION_LOCK_TIMEOUT", "300"))
+
+
+def _0001_initial_schema(cursor):
+    """Base tables (IF NOT EXISTS, so databases created before migrations adopt cleanly)."""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE,
+            phone TEXT,
+            region TEXT,
+            language TEXT DEFAULT 'ur',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Courses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title_ur TEXT NOT NULL,
+            title_en TEXT NOT NULL,
+            description_ur TEXT,
+            description_en TEXT,
+            category TEXT,
+            video_url TEXT,
+            content_ur TEXT,
+            content_en TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(title_ur, title_en)
+        )
+    ''')
+    
+    # Market prices table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS market_prices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            crop_name TEXT NOT NULL,
+            crop_key TEXT,
+            region TEXT NOT NULL,
+            price_per_kg REAL NOT NULL,
+            mandi_name TEXT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Weather alerts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weather_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            alert_type TEXT NOT NULL,
+            severity TEXT,
+            message_ur TEXT,
+            message_en TEXT,
+            valid_until TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Pest alerts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pest_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            region TEXT NOT NULL,
+            pest_name_ur TEXT,
+            pest_name_en TEXT,
+            crop_affected TEXT,
+            severity TEXT,
+            prevention_ur TEXT,
+            prevention_en TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Wiki articles table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wiki_articles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title_ur TEXT NOT NULL,
+            title_en TEXT NOT NULL,
+            content_ur TEXT,
+            content_en TEXT,
+            category TEXT,
+            tags TEXT,
+            wiki_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(title_ur, title_en)
+        )
+    ''')
+    
+    # Chat history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            language TEXT DEFAULT 'ur',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+
+def _0002_wiki_url(cursor):
+    """wiki_url column for databases created before it was part of the base schema."""
+    cursor.execute("PRAGMA table_info(wiki_articles)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'wiki_url' not in columns:
+        cursor.execute('ALTER TABLE wiki_articles ADD COLUMN wiki_url TEXT')
+        print("✓ Added wiki_url column to wiki_articles table")
+
+
+def _0003_market_prices_crop_key(cursor):
+    """Canonical crop key so price lookups can use an index instead of LIKE scans."""
+    cursor.execute("PRAGMA table_info(market_prices)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'crop_key' not in columns:
+        cursor.execute('ALTER TABLE market_prices ADD COLUMN crop_key TEXT')
+        print("✓ Added crop_key column to market_prices table")
+
+    # Backfill rows written before crop_key existed
+    cursor.execute('SELECT DISTINCT crop_name FROM market_prices WHERE crop_key IS NULL')
+    names = [row[0] for row in cursor.fetchall()]
+    if names:
+        cursor.executemany(
+            'UPDATE market_prices SET crop_key = ? WHERE crop_key IS NULL AND crop_name = ?',
+            [(crop_key(name), name) for name in names]
+        )
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_market_prices_crop_region_time
+        ON market_prices (crop_key, region, recorded_at DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_market_prices_crop_time
+        ON market_prices (crop_key, recorded_at DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_market_prices_region_time
+        ON market_prices (region, recorded_at DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_market_prices_time
+        ON market_prices (recorded_at DESC)
+    ''')
+
+
+def _0004_search_index(cursor):
+    """FTS5 index over wiki articles, courses and pest alerts, kept in sync by triggers."""
+    search.create_search_index(cursor)
+
+
+def _0005_title_en_created_index(cursor):
+    """
+    List endpoints hide duplicate English titles in the query (newest row
+    per title); index (title_en, created_at, id) so that check is a seek.
+    Duplicates stay in the table.
+    """
+    for table in ("wiki_articles", "courses"):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_title_en_created ON {table} (title_en, created_at, id)')
+
+
+def _0006_keyset_indexes(cursor):
+    """Keyset pagination indexes: newest-first pages on (created_at, id)."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_wiki_articles_created ON wiki_articles (created_at, id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_wiki_articles_category_created
+        ON wiki_articles (category, created_at, id)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_courses_created ON courses (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pest_alerts_created ON pest_alerts (created_at, id)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pest_alerts_region_created
+        ON pest_alerts (region, created_at, id)
+    ''')
+
+
+def _0007_seed_sample_data(cursor):
+    """One-time seed: sample content is written when this migration applies, never on later boots."""
+    # Sample courses with YouTube video links
+    courses = [
+        ("ڈرپ اریگیشن کا استعمال", "Drip Irrigation Usage", 
+         "ڈرپ اریگیشن کے فوائد اور استعمال کا طریقہ", 
+         "Benefits and usage of drip irrigation",
+         "sustainable_practices", "https://youtu.be/Xej22GsLLQA?si=PHj6dl6ADtEGCCw1",
+         "ڈرپ اریگیشن پانی کے بہتر استعمال کا ایک موثر طریقہ ہے جو پانی کی بچت کرتا ہے اور فصلوں کی بہتر افزائش میں مدد کرتا ہے۔", 
+         "Drip irrigation is an effective method for better water usage that saves water and helps in better crop growth."),
+        ("کمپوسٹ بنانے کا طریقہ", "How to Make Compost",
+         "کھاد بنانے کا آسان طریقہ", 
+         "Easy method to make fertilizer",
+         "waste_management", "https://youtu.be/_K25WjjCBuw?si=ofVETNZjDqghuH80",
+         "کمپوسٹ بنانے کے لیے پودوں کی باقیات، کچرے اور نامیاتی مواد کو مناسب طریقے سے استعمال کریں۔",
+         "Use crop residues, waste, and organic materials properly to make compost."),
+        ("مٹی کی جانچ", "Soil Testing",
+         "مٹی کی صحت کیسے چیک کریں",
+         "How to check soil health",
+         "sustainable_practices", "https://youtu.be/L6EtmGMJflI?si=7V3Y5w8ItkBzdUGw",
+         "مٹی کی جانچ فصل کی بہتری کے لیے ضروری ہے تاکہ آپ صحیح کھاد اور علاج استعمال کر سکیں۔",
+         "Soil testing is essential for crop improvement so you can use the right fertilizers and treatments."),
+        ("گندم کی کاشت", "Wheat Cultivation",
+         "گندم کی کاشت کا مکمل طریقہ کار",
+         "Complete guide to wheat cultivation",
+         "crop_production", "https://youtu.be/xVO9bjuhB58?si=Cc8nqvcAuIFj5m9M",
+         "گندم پاکستان کی اہم ترین فصل ہے۔ اس کی کاشت کے لیے زمین کی تیاری، بیج کی اچھی قسم کا انتخاب، اور وقت پر کاشت بہت ضروری ہے۔",
+         "Wheat is Pakistan's most important crop. Land preparation, selecting good seed varieties, and timely sowing are essential."),
+        ("چاول کی کاشت", "Rice Cultivation",
+         "چاول کی کاشت کے بہترین طریقے",
+         "Best methods for rice cultivation",
+         "crop_production", "https://youtu.be/FW_bw9jdrlQ?si=zIlptf1nqHRvqAAW",
+         "چاول کی کاشت کے لیے پانی کا مناسب انتظام، زمین کی تیاری، اور بیج کا انتخاب بہت اہم ہے۔",
+         "Proper water management, land preparation, and seed selection are very important for rice cultivation."),
+        ("کپاس کی کاشت", "Cotton Cultivation",
+         "کپاس کی کامیاب کاشت کے رہنما اصول",
+         "Guiding principles for successful cotton cultivation",
+         "crop_production", "https://youtu.be/eN-TqqBQOAk?si=klQi7MA3dkPoEBLx",
+         "کپاس کی کاشت کے لیے موسم، زمین کی قسم، اور کیڑوں کا انتظام بہت ضروری ہے۔",
+         "Weather, soil type, and pest management are essential for cotton cultivation."),
+        ("کیمیائی کھاد کا استعمال", "Chemical Fertilizer Usage",
+         "کیمیائی کھادوں کا صحیح استعمال",
+         "Proper use of chemical fertilizers",
+         "fertilizer_management", "https://youtu.be/y9b2p69CxCk?si=FIItGgzeOtBpMhpW",
+         "کیمیائی کھادوں کا صحیح استعمال فصلوں کی پیداوار بڑھاتا ہے لیکن زیادہ استعمال نقصان دہ ہو سکتا ہے۔",
+         "Proper use of chemical fertilizers increases crop yield but excessive use can be harmful."),
+        ("نامیاتی کھاد", "Organic Fertilizer",
+         "نامیاتی کھاد بنانے اور استعمال کرنے کا طریقہ",
+         "How to make and use organic fertilizer",
+         "fertilizer_management", "https://youtu.be/lofNYAtHYu4?si=Sv78H9e6jyo8VAy1",
+         "نامیاتی کھاد ماحول دوست ہے اور مٹی کی صحت کو بہتر بناتی ہے۔",
+         "Organic fertilizer is environmentally friendly and improves soil health."),
+        ("کیڑے مار ادویات", "Pesticide Usage",
+         "کیڑے مار ادویات کا محفوظ استعمال",
+         "Safe use of pesticides",
+         "pest_management", "https://youtu.be/lJEeGMMcYCI?si=xPnsjDkChLn9GoF6",
+         "کیڑے مار ادویات کا محفوظ اور مناسب استعمال فصلوں کو کیڑوں سے بچاتا ہے۔",
+         "Safe and proper use of pesticides protects crops from pests."),
+        ("پانی کی بچت", "Water Conservation",
+         "کھیتی باڑی میں پانی کیسے بچایا جائے",
+         "How to save water in farming",
+         "resource_management", "https://youtu.be/-evivoRwUZw?si=JBMXsQWJchfMP3Al",
+         "پانی کی بچت کے مختلف طریقے جیسے بارش کے پانی کا ذخیرہ، ڈرپ اریگیشن، اور مناسب اریگیشن وقت۔",
+         "Various water conservation methods like rainwater harvesting, drip irrigation, and proper irrigation timing."),
+        ("فصل کی کٹائی", "Harvesting",
+         "فصل کی کٹائی کا صحیح وقت اور طریقہ",
+         "Right time and method for harvesting",
+         "crop_production", "https://youtu.be/kWd_QnyO3eI?si=3S0fNULnIuWI9ltL",
+         "فصل کی کٹائی کا صحیح وقت پیداوار کی کیفیت اور مقدار کو متاثر کرتا ہے۔",
+         "The right time for harvesting affects the quality and quantity of yield."),
+        ("بیج کی اچھی اقسام", "Quality Seed Varieties",
+         "بہتر پیداوار کے لیے بیج کی اقسام کا انتخاب",
+         "Selecting seed varieties for better yield",
+         "crop_production", "https://youtu.be/Oir1J_CfU9Q?si=tcbiBFgsfyF79H5Y",
+         "بیج کی اچھی اقسام کا انتخاب کامیاب فصل کی بنیاد ہے۔",
+         "Selecting quality seed varieties is the foundation of a successful crop."),
+    ]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO courses (title_ur, title_en, description_ur, description_en, category, video_url, content_ur, content_en)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', courses)
+    
+    # Sample market prices
+    prices = [
+        ("گندم", "Punjab", 4500.0, "Lahore Mandi"),
+        ("چاول", "Punjab", 5500.0, "Lahore Mandi"),
+        ("کپاس", "Sindh", 8000.0, "Karachi Mandi"),
+        ("گندم", "Sindh", 4600.0, "Hyderabad Mandi"),
+        ("چاول", "KPK", 5400.0, "Peshawar Mandi"),
+    ]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(name, crop_key(name), region, price, mandi) for name, region, price, mandi in prices])
+    
+    # Sample wiki articles with Wikipedia links
+    wiki_articles = [
+        ("کھیتی باڑی کے فضلے کا انتظام", "Agricultural Waste Management",
+         "کھیتی باڑی کے فضلے کو کیسے استعمال کیا جائے۔ فصلوں کی باقیات، جانوروں کا گوبر، اور دیگر نامیاتی مواد کو کمپوسٹ اور بائیوچار میں تبدیل کیا جا سکتا ہے۔",
+         "How to utilize agricultural waste. Crop residues, animal manure, and other organic materials can be converted into compost and biochar.",
+         "waste_management", "کمپوسٹ, بائیوچار, کھاد", "https://en.wikipedia.org/wiki/Agricultural_waste"),
+        ("پانی کی بچت", "Water Conservation",
+         "پانی کے موثر استعمال کے طریقے۔ بارش کے پانی کا ذخیرہ، ڈرپ اریگیشن، اور موسمی اریگیشن سے پانی کی بچت ہو سکتی ہے۔",
+         "Methods for efficient water usage. Rainwater harvesting, drip irrigation, and seasonal irrigation can save water.",
+         "resource_management", "پانی, بچت, اریگیشن", "https://en.wikipedia.org/wiki/Water_conservation"),
+        ("مٹی کی صحت", "Soil Health",
+         "مٹی کی صحت کو برقرار رکھنے کے طریقے۔ نامیاتی کھاد، کروپ روٹیشن، اور مناسب زمین کی تیاری مٹی کی صحت کو بہتر بناتی ہے۔",
+         "Methods to maintain soil health. Organic fertilizers, crop rotation, and proper land preparation improve soil health.",
+         "sustainable_practices", "مٹی, صحت, نامیاتی", "https://en.wikipedia.org/wiki/Soil_health"),
+        ("کھیتی باڑی میں ماحولیاتی تبدیلی", "Climate Change in Agriculture",
+         "ماحولیاتی تبدیلی کا کھیتی باڑی پر اثر اور اس سے نمٹنے کے طریقے۔",
+         "Impact of climate change on agriculture and methods to deal with it.",
+         "sustainable_practices", "موسم, تبدیلی, ماحول", "https://en.wikipedia.org/wiki/Climate_change_and_agriculture"),
+        ("آرگینک کھیتی باڑی", "Organic Farming",
+         "آرگینک کھیتی باڑی کے اصول اور طریقے۔ کیمیائی کھادوں اور کیڑے مار ادویات کے بغیر قدرتی طریقوں سے کھیتی باڑی۔",
+         "Principles and methods of organic farming. Farming using natural methods without chemical fertilizers and pesticides.",
+         "sustainable_practices", "نامیاتی, قدرتی, ماحول دوست", "https://en.wikipedia.org/wiki/Organic_farming"),
+        ("بائیو ڈائیورسٹی", "Biodiversity",
+         "کھیتی باڑی میں حیاتیاتی تنوع کی اہمیت۔ مختلف فصلوں اور جانوروں کی اقسام کا برقرار رکھنا۔",
+         "Importance of biodiversity in agriculture. Maintaining different varieties of crops and animals.",
+         "sustainable_practices", "تنوع, حیاتیات, فصل", "https://en.wikipedia.org/wiki/Agricultural_biodiversity"),
+        ("ڈرپ اریگیشن", "Drip Irrigation",
+         "ڈرپ اریگیشن نظام کی تفصیلات۔ پانی کی بچت اور موثر اریگیشن کا بہترین طریقہ۔",
+         "Details of drip irrigation system. The best method for water saving and efficient irrigation.",
+         "resource_management", "اریگیشن, پانی, بچت", "https://en.wikipedia.org/wiki/Drip_irrigation"),
+        ("کمپوسٹ", "Compost",
+         "کمپوسٹ بنانے کا طریقہ اور اس کے فوائد۔ نامیاتی کچرے کو مفید کھاد میں تبدیل کرنا۔",
+         "Method of making compost and its benefits. Converting organic waste into useful fertilizer.",
+         "waste_management", "کمپوسٹ, کھاد, نامیاتی", "https://en.wikipedia.org/wiki/Compost"),
+        ("کروپ روٹیشن", "Crop Rotation",
+         "کروپ روٹیشن کی اہمیت اور طریقہ کار۔ مختلف فصلوں کی باری باری کاشت سے مٹی کی صحت بہتر ہوتی ہے۔",
+         "Importance and methodology of crop rotation. Alternating different crops improves soil health.",
+         "sustainable_practices", "فصل, باری, صحت", "https://en.wikipedia.org/wiki/Crop_rotation"),
+    ]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO wiki_articles (title_ur, title_en, content_ur, content_en, category, tags, wiki_url)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', wiki_articles)
+    
+    # Sample weather alerts
+    weather_alerts = [
+        ("Punjab", "heatwave", "high", "اگلے 3 دنوں میں گرمی کی لہر متوقع ہے", "Heatwave expected in next 3 days", None),
+        ("Sindh", "heavy_rain", "medium", "بارش کی پیش گوئی", "Rain forecast", None)
+    ]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO weather_alerts (region, alert_type, severity, message_ur, message_en, valid_until)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', weather_alerts)
+    
+    # Pest alerts are populated from database migration/update scripts
+    # Comprehensive pest data is added separately to avoid duplicates
+
+
+def _0008_market_prices_natural_key(cursor):
+    """
+    One price row per (crop, region, source, day) so ingestion can upsert.
+
+    price_date is a virtual column derived from recorded_at, so every writer
+    gets it for free. Same-day duplicates from before the key existed keep
+    the newest row.
+    """
+    cursor.execute("PRAGMA table_xinfo(market_prices)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'price_date' not in columns:
+        cursor.execute('''
+            ALTER TABLE market_prices
+            ADD COLUMN price_date TEXT GENERATED ALWAYS AS (date(recorded_at)) VIRTUAL
+        ''')
+    cursor.execute('''
+        DELETE FROM market_prices
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM market_prices GROUP BY crop_key, region, mandi_name, price_date
+        )
+    ''')
+    if cursor.rowcount:
+        print(f"✓ Removed {cursor.rowcount} duplicate same-day market prices")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_market_prices_natural_key
+        ON market_prices (crop_key, region, mandi_name, price_date)
+    ''')
+
+
+def _0009_weather_alerts_dedup_window(cursor):
+    """
+    Normalize weather alert timestamps and key alerts by an hourly window.
+
+    Python used to write local-time ISO strings ('2024-05-01T10:00:00.123456')
+    next to SQLite's UTC CURRENT_TIMESTAMP format, which breaks text range
+    comparisons. Every value not already in that format is rewritten the way
+    db.utc_timestamp() formats new ones (naive values are local time). A
+    virtual dedup_window column then backs a unique key, so the writer can
+    insert a batch with ON CONFLICT DO NOTHING instead of probing per alert.
+    """
+    for column in ("created_at", "valid_until"):
+        cursor.execute(f'''
+            SELECT id, {column} FROM weather_alerts
+            WHERE {column} IS NOT NULL AND {column} IS NOT datetime({column})
+        ''')
+        rows = [(db.utc_timestamp(value), row_id) for row_id, value in cursor.fetchall()]
+        cursor.executemany(f'UPDATE weather_alerts SET {column} = ? WHERE id = ?', rows)
+
+    cursor.execute("PRAGMA table_xinfo(weather_alerts)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'dedup_window' not in columns:
+        cursor.execute('''
+            ALTER TABLE weather_alerts
+            ADD COLUMN dedup_window TEXT GENERATED ALWAYS AS (strftime('%Y-%m-%d %H', created_at)) VIRTUAL
+        ''')
+    # Keep the first alert of each window, as the old one-hour probe did
+    cursor.execute('''
+        DELETE FROM weather_alerts
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM weather_alerts GROUP BY region, alert_type, dedup_window
+        )
+    ''')
+    if cursor.rowcount:
+        print(f"✓ Removed {cursor.rowcount} duplicate weather alerts")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_alerts_dedup
+        ON weather_alerts (region, alert_type, dedup_window)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_weather_alerts_region_type_time
+        ON weather_alerts (region, alert_type, created_at)
+    ''')
+    # Served by the /api/weather-alerts list (newest first, optionally by region)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weather_alerts_region_time ON weather_alerts (region, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weather_alerts_time ON weather_alerts (created_at)')
+
+
+def _0010_market_price_rollups(cursor):
+    """Daily/hourly OHLC rollups of market_prices, maintained by triggers."""
+    rollups.create_rollup_tables(cursor)
+
+
+def _0011_job_leases(cursor):
+    """
+    Lease table for the background refresh scheduler (scheduler.py).
+
+    One row per job: the worker holding an unexpired lease runs it, and
+    next_run_at keeps every other worker from starting it again early.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            job TEXT PRIMARY KEY,
+            owner TEXT,
+            lease_until TIMESTAMP NOT NULL,
+            next_run_at TIMESTAMP NOT NULL,
+            last_started_at TIMESTAMP,
+            last_finished_at TIMESTAMP,
+            last_status TEXT,
+            last_duration_ms REAL
+        )
+    ''')
+
+
+def _0012_weather_alert_rules(cursor):
+    """
+    Table-driven weather alert thresholds (alert_rules.py), seeded with the
+    rules that used to be hard-coded in weather_integration, and the crops
+    each stored alert is relevant to.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS weather_alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            metric TEXT NOT NULL,
+            operator TEXT NOT NULL CHECK (operator IN ('>', '>=', '<', '<=', '==', 'contains')),
+            threshold REAL,
+            match_text TEXT,
+            alert_type TEXT NOT NULL,
+            severity TEXT NOT NULL DEFAULT 'medium',
+            crops TEXT,
+            message_en TEXT NOT NULL,
+            message_ur TEXT NOT NULL,
+            valid_hours INTEGER NOT NULL DEFAULT 24,
+            priority INTEGER NOT NULL DEFAULT 100,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            CHECK ((operator = 'contains') = (match_text IS NOT NULL)),
+            CHECK (operator = 'contains' OR threshold IS NOT NULL)
+        )
+    ''')
+    rules = [
+        ('heat_today', 'temperature_c', '>', 40, None, 'heatwave', 'high', 'wheat,cotton,corn,rice',
+         'Extreme heat warning in {city}: Temperature is {value}°C. Take precautions for crops.',
+         '{city} میں شدید گرمی کی وارننگ: درجہ حرارت {value}°C ہے۔ فصلوں کے لیے احتیاطی تدابیر اختیار کریں۔',
+         24, 10),
+        ('cold_today', 'temperature_c', '<', 5, None, 'cold_wave', 'high', 'wheat,sugar,corn',
+         'Cold wave warning in {city}: Temperature is {value}°C. Protect sensitive crops.',
+         '{city} میں سردی کی لہر کی وارننگ: درجہ حرارت {value}°C ہے۔ حساس فصلوں کی حفاظت کریں۔',
+         24, 20),
+        ('rain_storm_today', 'condition', 'contains', None, 'rain,storm,thunder', 'heavy_rain', 'medium',
+         'wheat,cotton,rice',
+         'Rain/Storm alert in {city}: {condition} conditions expected.',
+         '{city} میں بارش/طوفان کی الرٹ: {condition} حالات متوقع ہیں۔',
+         24, 30),
+        ('wind_today', 'wind_kph', '>', 30, None, 'strong_wind', 'medium', 'wheat,corn,sugar',
+         'Strong wind warning in {city}: Wind speed is {value} km/h.',
+         '{city} میں تیز ہوا کی وارننگ: ہوا کی رفتار {value} کلومیٹر/گھنٹہ ہے۔',
+         24, 40),
+        ('humidity_today', 'humidity', '>', 80, None, 'high_humidity', 'medium', 'rice,cotton,wheat',
+         'High humidity in {city}: {value}%. May increase disease risk in crops.',
+         '{city} میں زیادہ نمی: {value}%۔ فصلوں میں بیماری کا خطرہ بڑھ سکتا ہے۔',
+         24, 50),
+        ('air_quality_today', 'us_epa_index', '>=', 4, None, 'air_quality', 'medium', None,
+         'Poor air quality in {city}. May affect crop health.',
+         '{city} میں ہوا کی ناقص معیار۔ فصلوں کی صحت متاثر ہو سکتی ہے۔',
+         24, 60),
+        ('heat_tomorrow', 'tomorrow_max_temp_c', '>', 42, None, 'heatwave', 'high', 'wheat,cotton,corn,rice',
+         'Tomorrow: Extreme heat expected in {city} ({value}°C).',
+         'کل: {city} میں شدید گرمی متوقع ({value}°C)۔',
+         48, 70),
+        ('wind_tomorrow', 'tomorrow_maxwind_kph', '>', 40, None, 'strong_wind', 'medium', 'wheat,corn,sugar',
+         'Tomorrow: Strong winds expected in {city} ({value} km/h).',
+         'کل: {city} میں تیز ہواؤں کی توقع ({value} کلومیٹر/گھنٹہ)۔',
+         48, 80),
+    ]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO weather_alert_rules
+        (name, metric, operator, threshold, match_text, alert_type, severity, crops,
+         message_en, message_ur, valid_hours, priority)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rules)
+
+    cursor.execute("PRAGMA table_xinfo(weather_alerts)")
+    if "crops" not in {row[1] for row in cursor.fetchall()}:
+        # Comma-separated crop keys; NULL means relevant to every crop
+        cursor.execute("ALTER TABLE weather_alerts ADD COLUMN crops TEXT")
+
+
+def _0013_answer_cache(cursor):
+    """Gemini answers kept across restarts (answer_cache.py, KISAAN_ANSWER_CACHE_PERSIST=1)."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key TEXT PRIMARY KEY,
+            language TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache(created_at)')
+
+
+# Ordered (version, name, step). Append new migrations at the end; never
+# renumber or edit one that has shipped.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "initial_schema", _0001_initial_schema),
+    (2, "wiki_url", _0002_wiki_url),
+    (3, "market_prices_crop_key", _0003_market_prices_crop_key),
+    (4, "search_index", _0004_search_index),
+    (5, "title_en_created_index", _0005_title_en_created_index),
+    (6, "keyset_indexes", _0006_keyset_indexes),
+    (7, "seed_sample_data", _0007_seed_sample_data),
+    (8, "market_prices_natural_key", _0008_market_prices_natural_key),
+    (9, "weather_alerts_dedup_window", _0009_weather_alerts_dedup_window),
+    (10, "market_price_rollups", _0010_market_price_rollups),
+    (11, "job_leases", _0011_job_leases),
+    (12, "weather_alert_rules", _0012_weather_alert_rules),
+    (13, "answer_cache", _0013_answer_cache),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """
+    Schema version of the database.
+
+    Kept in the file header (PRAGMA user_version) next to the schema_version
+    log, so checking it reads the header instead of running a query.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _begin_exclusive(conn: sqlite3.Connection):
+    """
+    Take SQLite's write lock (BEGIN IMMEDIATE), waiting while another
+    process is migrating. The database lock doubles as the cross-worker
+    migrator lock, so only one process ever applies migrations.
+    """
+    deadline = time.monotonic() + MIGRATION_LOCK_TIMEOUT
+    while True:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or time.monotonic() > deadline:
+                raise
+
+
+def migrate() -> int:
+    """
+    Bring the database up to LATEST_VERSION.
+
+    Fast path: if the header version is current this is a single pragma
+    read on a pooled reader connection. Otherwise one process takes the
+    write lock, re-checks the version and applies the pending migrations
+    in a single transaction, logging each one in schema_version.
+
+    Returns:
+        Number of migrations applied by this call
+    """
+    with db.reader() as conn:
+        if current_version(conn) >= LATEST_VERSION:
+            return 0
+
+    with db.writer() as conn:
+        _begin_exclusive(conn)
+        # Another worker may have finished migrating while we waited for the lock
+        version = current_version(conn)
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        if not pending:
+            return 0
+
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                duration_ms REAL
+            )
+        ''')
+        for number, name, step in pending:
+            started = time.perf_counter()
+            try:
+                step(cursor)
+            except Exception as e:
+                print(f"✗ Migration {number:04d}_{name} failed: {e}")
+                raise
+            cursor.execute(
+                'INSERT OR REPLACE INTO schema_version (version, name, duration_ms) VALUES (?, ?, ?)',
+                (number, name, round((time.perf_counter() - started) * 1000, 3))
+            )
+            print(f"✓ Applied migration {number:04d}_{name}")
+        # PRAGMA values cannot be bound as parameters; this is an int from MIGRATIONS
+        cursor.execute(f"PRAGMA user_version = {pending[-1][0]}")
+        return len(pending)
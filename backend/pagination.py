@@ -0,0 +1,91 @@
+"""
+Keyset Pagination
+Cursor-based paging on (created_at, id) for the list endpoints
+"""
+
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, row_id: int) -> str:
+    """Opaque cursor pointing just past (created_at, id)."""
+    raw = json.dumps([str(created_at), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Decode a cursor produced by encode_cursor().
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_size(limit: Optional[int], default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE."""
+    if not limit:
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_query(table: str, columns: Sequence[str], filters: Sequence[str], params: Sequence,
+                 cursor: Optional[str], limit: Optional[int]) -> Tuple[str, List]:
+    """
+    Build a newest-first page query ordered by (created_at, id).
+
+    The row-value comparison lets SQLite seek straight to the cursor position
+    on a (..., created_at, id) index, so every page costs O(page size) no
+    matter how deep it is. One extra row is fetched to tell whether another
+    page follows (see split_page()).
+
+    Args:
+        table: Table name
+        columns: Columns to select (must include id and created_at)
+        filters: SQL conditions ANDed together (e.g. ["region = ?"])
+        params: Parameters for filters
+        cursor: Cursor from the previous page, or None for the first page
+        limit: Page size, or None for every remaining row
+
+    Returns:
+        (sql, params) tuple
+    """
+    conditions = list(filters)
+    params = list(params)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend([created_at, row_id])
+
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+    return query, params
+
+
+def split_page(rows: List, limit: Optional[int]) -> Tuple[List, Optional[str]]:
+    """
+    Trim the look-ahead row from a keyset_query() result.
+
+    Returns:
+        (rows for this page, cursor for the next page or None)
+    """
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last["created_at"], last["id"])
@@ -0,0 +1,281 @@
+"""
+Market Price Rollups
+Daily/hourly OHLC aggregates of market_prices, kept current by triggers
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import db
+from crops import crop_key
+
+# Raw market_prices rows older than this are deleted once they are in the
+# rollups (0 keeps raw history forever). Hourly rollups are kept for
+# HOURLY_RETENTION_DAYS; daily rollups are kept forever.
+RAW_RETENTION_DAYS = int(os.getenv("KISAAN_PRICE_RETENTION_DAYS", "365"))
+HOURLY_RETENTION_DAYS = int(os.getenv("KISAAN_HOURLY_ROLLUP_DAYS", "90"))
+
+# interval -> (table, bucket expression over a recorded_at value, bucket width).
+# The expression takes SQLite date modifiers after {ts}, so bucket(ts, width)
+# is the next bucket's start.
+INTERVALS = {
+    "day": ("market_price_daily", "date({ts})", "+1 day"),
+    "hour": ("market_price_hourly", "strftime('%Y-%m-%d %H:00', {ts})", "+1 hour"),
+}
+
+# Merge one observation (or a pre-aggregated bucket) into a rollup row.
+# Every right-hand side sees the row's values from before this update.
+_MERGE = '''
+    ON CONFLICT (crop_key, region, bucket) DO UPDATE SET
+        crop_name = CASE WHEN excluded.last_at >= last_at THEN excluded.crop_name ELSE crop_name END,
+        open = CASE WHEN excluded.first_at < first_at THEN excluded.open ELSE open END,
+        close = CASE WHEN excluded.last_at >= last_at THEN excluded.close ELSE close END,
+        high = max(high, excluded.high),
+        low = min(low, excluded.low),
+        price_sum = price_sum + excluded.price_sum,
+        price_count = price_count + excluded.price_count,
+        first_at = min(first_at, excluded.first_at),
+        last_at = max(last_at, excluded.last_at)
+'''
+
+_COLUMNS = "crop_key, region, bucket, crop_name, open, high, low, close, price_sum, price_count, first_at, last_at"
+
+
+def create_rollup_tables(cursor):
+    """
+    Create the rollup tables and the triggers that feed them, then build
+    them from the existing raw rows.
+
+    Each raw market_prices row is one observation: open/close are the
+    first/last observation of the bucket, high/low/mean/count cover all of
+    them.
+
+    Args:
+        cursor: sqlite3 cursor inside a write transaction
+    """
+    for interval, (table, bucket, _) in INTERVALS.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                crop_key TEXT NOT NULL,
+                region TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                crop_name TEXT,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                price_sum REAL NOT NULL,
+                price_count INTEGER NOT NULL,
+                first_at TIMESTAMP NOT NULL,
+                last_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (crop_key, region, bucket)
+            ) WITHOUT ROWID
+        ''')
+        # Crop-wide (all regions) history reads go by crop and time
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_crop_bucket ON {table} (crop_key, bucket)')
+
+        observation = f'''
+            INSERT INTO {table} ({_COLUMNS})
+            VALUES (new.crop_key, new.region, {bucket.format(ts="new.recorded_at")}, new.crop_name,
+                    new.price_per_kg, new.price_per_kg, new.price_per_kg, new.price_per_kg,
+                    new.price_per_kg, 1, new.recorded_at, new.recorded_at)
+            {_MERGE}
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS market_prices_{interval}_ai AFTER INSERT ON market_prices
+            WHEN new.crop_key IS NOT NULL AND new.region IS NOT NULL BEGIN
+                {observation};
+            END
+        ''')
+        create_update_trigger(cursor, interval)
+        cursor.execute(f'''
+            INSERT INTO {table} ({_COLUMNS})
+            {_aggregate(bucket, "true")}
+            {_MERGE}
+        ''')
+
+
+def create_update_trigger(cursor, interval: str):
+    """
+    Create the trigger that keeps an interval's rollup right when a raw row
+    is corrected.
+
+    A correction replaces an observation rather than adding one: the old
+    price comes out of its bucket's sum and count and the new one is merged
+    in like an insert. Whatever the old price may have set in the bucket it
+    left (open/close, first/last time, and high/low when it was the
+    extreme) is read back from the raw rows with index seeks, as are
+    open/close when the row is tied with another at the bucket's edges.
+
+    Args:
+        cursor: sqlite3 cursor inside a write transaction
+        interval: key of INTERVALS
+    """
+    table, bucket, width = INTERVALS[interval]
+    old_bucket = f'crop_key = old.crop_key AND region = old.region AND bucket = {bucket.format(ts="old.recorded_at")}'
+    # The new row's bucket only needs its own refresh when the row changed bucket
+    moved = f'''
+              AND (new.crop_key, new.region, {bucket.format(ts="new.recorded_at")})
+                  IS NOT (old.crop_key, old.region, {bucket.format(ts="old.recorded_at")})'''
+    refresh = ""
+    for row in ("old", "new"):
+        raw = f'''
+            FROM market_prices
+            WHERE crop_key = {row}.crop_key AND region = {row}.region
+              AND recorded_at >= {bucket.format(ts=f"{row}.recorded_at")}
+              AND recorded_at < {bucket.format(ts=f"{row}.recorded_at, '{width}'")}
+        '''
+        # Ties on recorded_at go by id; seeking the time first keeps both on the index
+        at_time = f"FROM market_prices WHERE crop_key = {row}.crop_key AND region = {row}.region AND recorded_at ="
+        refresh += f'''
+            UPDATE {table} SET
+                (open, first_at) = (
+                    SELECT price_per_kg, recorded_at {at_time} (SELECT min(recorded_at) {raw}) ORDER BY id LIMIT 1
+                ),
+                (crop_name, close, last_at) = (
+                    SELECT crop_name, price_per_kg, recorded_at {at_time} (SELECT max(recorded_at) {raw})
+                    ORDER BY id DESC LIMIT 1
+                ),
+                high = CASE WHEN high > old.price_per_kg THEN high ELSE (SELECT max(price_per_kg) {raw}) END,
+                low = CASE WHEN low < old.price_per_kg THEN low ELSE (SELECT min(price_per_kg) {raw}) END
+            WHERE crop_key = {row}.crop_key AND region = {row}.region
+              AND bucket = {bucket.format(ts=f"{row}.recorded_at")} AND price_count > 0
+              AND (old.recorded_at IN (first_at, last_at) OR new.recorded_at IN (first_at, last_at)
+                   OR old.price_per_kg IN (high, low)){moved if row == "new" else ""};
+        '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS market_prices_{interval}_au
+        AFTER UPDATE OF crop_name, crop_key, region, price_per_kg, recorded_at ON market_prices
+        WHEN new.crop_key IS NOT NULL AND new.region IS NOT NULL BEGIN
+            UPDATE {table} SET price_sum = price_sum - old.price_per_kg, price_count = price_count - 1
+            WHERE {old_bucket};
+            INSERT INTO {table} ({_COLUMNS})
+            VALUES (new.crop_key, new.region, {bucket.format(ts="new.recorded_at")}, new.crop_name,
+                    new.price_per_kg, new.price_per_kg, new.price_per_kg, new.price_per_kg,
+                    new.price_per_kg, 1, new.recorded_at, new.recorded_at)
+            {_MERGE};
+            {refresh}
+            DELETE FROM {table} WHERE {old_bucket} AND price_count = 0;
+        END
+    ''')
+
+
+def _aggregate(bucket: str, where: str) -> str:
+    """SELECT of one rollup row per (crop_key, region, bucket) over the market_prices rows matching where."""
+    return f'''
+            SELECT crop_key, region, bucket, max(last_name), max(open), max(price_per_kg), min(price_per_kg),
+                   max(close), sum(price_per_kg), count(*), min(recorded_at), max(recorded_at)
+            FROM (
+                SELECT crop_key, region, price_per_kg, recorded_at,
+                       {bucket.format(ts="recorded_at")} AS bucket,
+                       first_value(price_per_kg) OVER w AS open,
+                       last_value(price_per_kg) OVER w AS close,
+                       last_value(crop_name) OVER w AS last_name
+                FROM market_prices
+                WHERE crop_key IS NOT NULL AND region IS NOT NULL AND {where}
+                WINDOW w AS (
+                    PARTITION BY crop_key, region, {bucket.format(ts="recorded_at")}
+                    ORDER BY recorded_at, id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+                )
+            )
+            WHERE true  -- disambiguates ON CONFLICT after INSERT ... SELECT
+            GROUP BY crop_key, region, bucket
+    '''
+
+
+def retention_cutoff() -> Optional[str]:
+    """Oldest recorded_at still kept as raw rows, or None if raw history is kept forever."""
+    if RAW_RETENTION_DAYS <= 0:
+        return None
+    with db.reader() as conn:
+        return conn.execute("SELECT datetime('now', ?)", (f"-{RAW_RETENTION_DAYS} days",)).fetchone()[0]
+
+
+def compact() -> Dict[str, int]:
+    """
+    Apply the retention policy: delete raw market_prices rows (already
+    summarized in the rollups) and hourly rollups past their windows.
+
+    Returns:
+        Dictionary with raw_deleted and hourly_deleted counts
+    """
+    counts = {"raw_deleted": 0, "hourly_deleted": 0}
+    with db.writer() as conn:
+        if RAW_RETENTION_DAYS > 0:
+            counts["raw_deleted"] = conn.execute(
+                "DELETE FROM market_prices WHERE recorded_at < datetime('now', ?)",
+                (f"-{RAW_RETENTION_DAYS} days",)
+            ).rowcount
+        if HOURLY_RETENTION_DAYS > 0:
+            counts["hourly_deleted"] = conn.execute(
+                "DELETE FROM market_price_hourly WHERE bucket < strftime('%Y-%m-%d %H:00', 'now', ?)",
+                (f"-{HOURLY_RETENTION_DAYS} days",)
+            ).rowcount
+    if counts["raw_deleted"] or counts["hourly_deleted"]:
+        print(f"✓ Compacted market prices: {counts['raw_deleted']} raw rows, "
+              f"{counts['hourly_deleted']} hourly rollups")
+    return counts
+
+
+def history_query(crop_name: str, region: Optional[str] = None, interval: str = "day", limit: int = 30):
+    """
+    Newest-first OHLC history for a crop, one row per bucket.
+
+    Without a region, buckets are combined across regions: the mean is
+    weighted by observation count and open/close come from the region that
+    observed first/last.
+
+    Returns:
+        (sql, params) tuple
+    """
+    table = INTERVALS[interval][0]
+    if region:
+        return f'''
+            SELECT bucket, crop_name, open, high, low, close,
+                   price_sum / price_count AS mean, price_count AS count
+            FROM {table}
+            WHERE crop_key = ? AND region = ?
+            ORDER BY bucket DESC LIMIT ?
+        ''', [crop_key(crop_name), region, limit]
+    # Pick the newest buckets off the (crop_key, bucket) index first, then
+    # combine only their per-region rows
+    return f'''
+        WITH buckets AS (
+            SELECT DISTINCT bucket FROM {table}
+            WHERE crop_key = ?
+            ORDER BY bucket DESC LIMIT ?
+        )
+        SELECT bucket, max(last_name) AS crop_name, max(first_open) AS open,
+               max(high) AS high, min(low) AS low, max(last_close) AS close,
+               sum(price_sum) / sum(price_count) AS mean, sum(price_count) AS count
+        FROM (
+            SELECT bucket, high, low, price_sum, price_count,
+                   first_value(open) OVER (PARTITION BY bucket ORDER BY first_at) AS first_open,
+                   first_value(close) OVER (PARTITION BY bucket ORDER BY last_at DESC) AS last_close,
+                   first_value(crop_name) OVER (PARTITION BY bucket ORDER BY last_at DESC) AS last_name
+            FROM {table}
+            WHERE crop_key = ? AND bucket IN buckets
+        )
+        GROUP BY bucket
+        ORDER BY bucket DESC
+    ''', [crop_key(crop_name), limit, crop_key(crop_name)]
+
+
+def history(conn, crop_name: str, region: Optional[str] = None, interval: str = "day",
+            limit: int = 30) -> List[Dict]:
+    """Run history_query() and return plain dictionaries (newest first)."""
+    query, params = history_query(crop_name, region, interval, limit)
+    return [
+        {
+            "bucket": row["bucket"],
+            "crop_name": row["crop_name"],
+            "open": row["open"],
+            "high": row["high"],
+            "low": row["low"],
+            "close": row["close"],
+            "mean": round(row["mean"], 2),
+            "count": row["count"],
+        }
+        for row in conn.execute(query, params)
+    ]
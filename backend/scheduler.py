@@ -0,0 +1,217 @@
+"""
+Background Refresh Scheduler
+Runs upstream refresh jobs on intervals, one worker process at a time
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import db
+
+SCHEDULER_ENABLED = os.getenv("KISAAN_SCHEDULER", "1") != "0"
+# How often each worker checks whether a job is due
+POLL_INTERVAL = float(os.getenv("KISAAN_SCHEDULER_POLL_S", "30"))
+# A worker that dies mid-run frees its job after this long
+LEASE_SECONDS = int(os.getenv("KISAAN_JOB_LEASE_S", "600"))
+
+# job_leases (migration 0011) is the cross-worker lock: a worker may start a
+# job only if nobody holds the lease and the job is due (or forced)
+_ACQUIRE_SQL = '''
+    INSERT INTO job_leases (job, owner, lease_until, next_run_at, last_started_at)
+    VALUES (?, ?, datetime('now', ?), CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ON CONFLICT (job) DO UPDATE SET
+        owner = excluded.owner,
+        lease_until = excluded.lease_until,
+        last_started_at = excluded.last_started_at
+    WHERE job_leases.lease_until <= CURRENT_TIMESTAMP
+      AND (? OR job_leases.next_run_at <= CURRENT_TIMESTAMP)
+'''
+
+_RELEASE_SQL = '''
+    UPDATE job_leases SET
+        lease_until = CURRENT_TIMESTAMP,
+        next_run_at = datetime('now', ?),
+        last_finished_at = CURRENT_TIMESTAMP,
+        last_status = ?,
+        last_duration_ms = ?
+    WHERE job = ? AND owner = ?
+'''
+
+# Leases of runs that shutdown cancelled before they were released;
+# next_run_at is untouched, so the job is due again right away
+_ABANDON_SQL = '''
+    UPDATE job_leases SET lease_until = CURRENT_TIMESTAMP
+    WHERE owner = ? AND lease_until > CURRENT_TIMESTAMP
+'''
+
+
+class _Job:
+    def __init__(self, name: str, func: Callable[[], object], interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.wake: Optional[asyncio.Event] = None
+        self.force = False
+        # True while this worker holds the lease and the job is executing
+        self.running = False
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,
+            "last_duration_ms": None,
+            "last_result": None,
+            "last_error": None,
+        }
+
+
+class RefreshScheduler:
+    """
+    In-process scheduler for upstream refresh jobs.
+
+    Every worker runs the same loop, but a job only starts where its
+    job_leases row can be claimed, so with several uvicorn workers each
+    refresh still runs once per interval. Jobs run on a dedicated thread
+    pool, never on the event loop, and request handlers only read what the
+    jobs have stored.
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs: Dict[str, _Job] = {}
+        self._tasks = []
+        self._running = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def add_job(self, name: str, func: Callable[[], object], interval: float):
+        """
+        Register a job (before start()).
+
+        Args:
+            name: Unique job name (the job_leases key)
+            func: Blocking callable; its return value is kept in stats
+            interval: Seconds between the end of one run and the next
+        """
+        self._jobs[name] = _Job(name, func, interval)
+
+    def start(self):
+        """Start one polling task per job on the running event loop."""
+        if not SCHEDULER_ENABLED or self._tasks:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self._jobs)),
+                                            thread_name_prefix="kisaan-refresh")
+        for job in self._jobs.values():
+            job.wake = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"kisaan-refresh-{job.name}"))
+        schedule = ", ".join(f"{job.name} every {job.interval:.0f}s" for job in self._jobs.values())
+        print(f"✓ Refresh scheduler started: {schedule}")
+
+    def trigger(self, name: str):
+        """
+        Ask for a run of `name` as soon as possible, without waiting for it.
+
+        Ignored while this worker is running the job, so a request during a
+        run does not queue a second one behind it. Otherwise the run still
+        needs the lease, so it is skipped if another worker is running the
+        job.
+        """
+        job = self._jobs.get(name)
+        if job is None or job.wake is None or job.running:
+            return
+        job.force = True
+        job.wake.set()
+
+    async def _loop(self, job: _Job):
+        while True:
+            force, job.force = job.force, False
+            job.wake.clear()
+            try:
+                acquired = await db.run_write(self._acquire, job.name, force)
+            except Exception as e:
+                print(f"⚠ Scheduler could not check lease for {job.name}: {e}")
+                acquired = False
+
+            if acquired:
+                started = time.perf_counter()
+                status = "ok"
+                job.running = True
+                running = self._executor.submit(job.func)
+                self._running.add(running)
+                running.add_done_callback(self._running.discard)
+                try:
+                    job.stats["last_result"] = await asyncio.wrap_future(running)
+                    job.stats["last_error"] = None
+                except Exception as e:
+                    status = "error"
+                    job.stats["failures"] += 1
+                    job.stats["last_error"] = str(e)
+                    print(f"✗ Refresh job {job.name} failed: {e}")
+                finally:
+                    # This run also answers any trigger that came in while
+                    # the lease was being claimed
+                    job.running = False
+                    job.force = False
+                    job.wake.clear()
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                job.stats["runs"] += 1
+                job.stats["last_duration_ms"] = duration_ms
+                try:
+                    await db.run_write(self._release, job.name, job.interval, status, duration_ms)
+                except Exception as e:
+                    print(f"⚠ Scheduler could not release lease for {job.name}: {e}")
+            else:
+                job.stats["skipped"] += 1
+
+            try:
+                await asyncio.wait_for(job.wake.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _acquire(self, conn, name: str, force: bool) -> bool:
+        cursor = conn.execute(_ACQUIRE_SQL, (name, self.owner, f"+{LEASE_SECONDS} seconds", force))
+        return cursor.rowcount == 1
+
+    def _release(self, conn, name: str, interval: float, status: str, duration_ms: float):
+        conn.execute(_RELEASE_SQL, (f"+{int(interval)} seconds", status, duration_ms, name, self.owner))
+
+    def _abandon(self, conn):
+        conn.execute(_ABANDON_SQL, (self.owner,))
+
+    async def stop(self):
+        """
+        Cancel the polling tasks and wait for running jobs to finish.
+
+        Jobs are not interrupted: they use the db pool and the shared HTTP
+        session, which shutdown closes next, and their upstream calls are
+        already bounded by the sweep deadlines and request timeouts.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._running:
+            print(f"Waiting for {len(self._running)} running refresh job(s) to finish")
+            await asyncio.wait([asyncio.wrap_future(f) for f in list(self._running)])
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            # Runs whose polling task was cancelled never released their
+            # lease; free it now instead of after LEASE_SECONDS
+            await db.run_write(self._abandon)
+        for job in self._jobs.values():
+            job.wake = None
+            job.running = False
+
+    def stats(self) -> Dict:
+        """Per-job counters for /api/stats."""
+        return {
+            "enabled": SCHEDULER_ENABLED,
+            "owner": self.owner,
+            "jobs": {
+                job.name: dict(job.stats, interval_s=job.interval) for job in self._jobs.values()
+            },
+        }
@@ -0,0 +1,202 @@
+"""
+Bilingual Full-Text Search
+SQLite FTS5 index over wiki articles, courses and pest alerts (Urdu + English)
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+# Each source row maps to one FTS row: rowid = source_id * 4 + type code, so
+# triggers can update/delete the FTS row by rowid instead of scanning.
+DOC_TYPES = {
+    "wiki": {"code": 1, "table": "wiki_articles"},
+    "course": {"code": 2, "table": "courses"},
+    "pest": {"code": 3, "table": "pest_alerts"},
+}
+
+# Column expressions copied from each source table into the index
+_SOURCE_COLUMNS = {
+    "wiki": {
+        "title_ur": "{row}.title_ur",
+        "title_en": "{row}.title_en",
+        "body_ur": "coalesce({row}.content_ur, '') || ' ' || coalesce({row}.tags, '')",
+        "body_en": "coalesce({row}.content_en, '') || ' ' || coalesce({row}.category, '')",
+    },
+    "course": {
+        "title_ur": "{row}.title_ur",
+        "title_en": "{row}.title_en",
+        "body_ur": "coalesce({row}.description_ur, '') || ' ' || coalesce({row}.content_ur, '')",
+        "body_en": "coalesce({row}.description_en, '') || ' ' || coalesce({row}.content_en, '')",
+    },
+    "pest": {
+        "title_ur": "{row}.pest_name_ur",
+        "title_en": "{row}.pest_name_en",
+        "body_ur": "coalesce({row}.crop_affected, '') || ' ' || coalesce({row}.prevention_ur, '')",
+        "body_en": "coalesce({row}.crop_affected, '') || ' ' || coalesce({row}.prevention_en, '')",
+    },
+}
+
+# bm25() weights in column order: doc_type, title_ur, title_en, body_ur, body_en.
+# Passed through FTS5's `rank` column so ORDER BY rank uses the fast path.
+_RANK_FUNCTION = "bm25(0.0, 10.0, 10.0, 1.0, 1.0)"
+_TITLE_COLUMN = {"ur": 1, "en": 2}
+_SNIPPET_COLUMN = {"ur": 3, "en": 4}
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def _insert_sql(doc_type: str, row: str) -> str:
+    columns = _SOURCE_COLUMNS[doc_type]
+    code = DOC_TYPES[doc_type]["code"]
+    return (
+        "INSERT INTO search_index (rowid, doc_type, title_ur, title_en, body_ur, body_en) "
+        f"SELECT {row}.id * 4 + {code}, '{doc_type}', "
+        + ", ".join(columns[c].format(row=row) for c in ("title_ur", "title_en", "body_ur", "body_en"))
+    )
+
+
+def create_search_index(cursor):
+    """
+    Create the FTS5 table and sync triggers, backfilling existing rows once.
+
+    Args:
+        cursor: sqlite3 cursor inside a write transaction
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+    exists = cursor.fetchone() is not None
+
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            doc_type UNINDEXED,
+            title_ur,
+            title_en,
+            body_ur,
+            body_en,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    ''')
+
+    for doc_type, info in DOC_TYPES.items():
+        table, code = info["table"], info["code"]
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN
+                {_insert_sql(doc_type, "new")};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+                {_insert_sql(doc_type, "new")};
+            END
+        ''')
+
+        if not exists:
+            cursor.execute(f"{_insert_sql(doc_type, 'src')} FROM {table} AS src")
+
+    if not exists:
+        print("✓ Created search_index (FTS5) and indexed existing content")
+
+
+def build_match_query(text: str, columns: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Turn free user text into a safe FTS5 MATCH expression.
+
+    Every token is quoted (so FTS5 operators in user input are inert) and
+    the last token is a prefix match for search-as-you-type.
+
+    Args:
+        text: Raw search text in Urdu or English
+        columns: Optional list of columns to restrict the match to
+
+    Returns:
+        MATCH expression, or None if text has no searchable tokens
+    """
+    # Drop combining marks (Urdu zer/zabar/pesh etc.) the way the tokenizer does
+    text = "".join(ch for ch in (text or "") if unicodedata.category(ch) != "Mn")
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    expression = " ".join(terms)
+    if columns:
+        expression = "{" + " ".join(columns) + "} : (" + expression + ")"
+    return expression
+
+
+def _snippet(body: Optional[str], title: Optional[str]) -> Optional[str]:
+    # A title-only match has nothing to mark in the body excerpt
+    if (body and "<mark>" in body) or not (title and "<mark>" in title):
+        return body
+    return title
+
+
+def search(conn, text: str, language: str = "ur", doc_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
+    """
+    BM25-ranked search across wiki articles, courses and pest alerts.
+
+    One ranking over all columns, with titles weighted 10x the body (see
+    _RANK_FUNCTION). The snippet is a highlighted body excerpt, or the
+    highlighted title when only the title matched.
+
+    Args:
+        conn: sqlite3 connection
+        text: Search text in Urdu or English
+        language: Language for titles/snippets ('ur' or 'en')
+        doc_type: Optional filter: 'wiki', 'course' or 'pest'
+        limit: Maximum number of results
+
+    Returns:
+        List of result dictionaries ordered by relevance
+    """
+    match = build_match_query(text)
+    if not match:
+        return []
+    language = language if language in ("ur", "en") else "ur"
+
+    query = f'''
+        SELECT doc_type, rowid / 4 AS id, title_{language} AS title,
+               snippet(search_index, {_SNIPPET_COLUMN[language]}, '<mark>', '</mark>', '…', 16) AS snippet,
+               highlight(search_index, {_TITLE_COLUMN[language]}, '<mark>', '</mark>') AS title_snippet,
+               rank AS score
+        FROM search_index
+        WHERE search_index MATCH ? AND rank MATCH ?
+    '''
+    params = [match, _RANK_FUNCTION]
+    if doc_type:
+        query += ' AND doc_type = ?'
+        params.append(doc_type)
+    query += ' ORDER BY rank LIMIT ?'
+    params.append(limit)
+
+    return [
+        {
+            "type": row["doc_type"],
+            "id": row["id"],
+            "title": row["title"],
+            "snippet": _snippet(row["snippet"], row["title_snippet"]),
+            "score": round(-row["score"], 4),  # bm25() is lower-is-better; expose higher-is-better
+        }
+        for row in conn.execute(query, params)
+    ]
+
+
+def pest_ids_query(pest_name: str):
+    """
+    Subquery (sql, params) selecting pest_alerts ids whose Urdu/English name
+    matches pest_name, for use as `id IN (...)`.
+
+    A name with no searchable tokens (e.g. only punctuation) matches no
+    pest, as the old LIKE filter did, so the subquery selects nothing.
+    """
+    match = build_match_query(pest_name, columns=["title_ur", "title_en"])
+    if not match:
+        return "SELECT NULL WHERE 0", []
+    return "SELECT rowid / 4 FROM search_index WHERE search_index MATCH ? AND doc_type = 'pest'", [match]
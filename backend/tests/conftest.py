@@ -0,0 +1,12 @@
+"""
+Test setup: backend modules on sys.path and a throwaway SQLite database
+(set before db is first imported, so no test touches kisaan_academy.db).
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["KISAAN_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="kisaan-test-"), "test.db")
+os.environ.setdefault("KISAAN_SCHEDULER", "0")
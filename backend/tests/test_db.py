@@ -0,0 +1,27 @@
+"""
+Connection pool: a writer block that does not finish normally always
+rolls back, so the single writer connection never stays in a transaction.
+"""
+
+import pytest
+
+from db import ConnectionPool
+
+
+@pytest.mark.parametrize("interruption", [RuntimeError, KeyboardInterrupt, GeneratorExit])
+def test_interrupted_writer_rolls_back(tmp_path, interruption):
+    pool = ConnectionPool(str(tmp_path / "pool.db"))
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE notes (body TEXT)")
+
+    with pytest.raises(interruption):
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO notes VALUES ('lost')")
+            raise interruption()
+    assert not pool._writer.in_transaction
+
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO notes VALUES ('kept')")
+    with pool.reader() as conn:
+        assert [row[0] for row in conn.execute("SELECT body FROM notes")] == ["kept"]
+    pool.close()
@@ -0,0 +1,99 @@
+"""
+Async Gemini calls: identical questions in flight share one generation, a
+timed-out call gives its slot back, and nothing is left in _pending_answers.
+"""
+
+import asyncio
+
+import pytest
+
+import answer_cache
+import gemini_integration
+
+SECTIONS = ("", "", "")
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModel:
+    """Stands in for the Gemini model: answers after `delay` seconds and counts calls."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return _Response(f"answer {self.calls}")
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "answers", answer_cache.AnswerCache(ttl=60, persist=False))
+    yield
+    assert gemini_integration._pending_answers == {}
+
+
+def test_identical_questions_share_one_generation(monkeypatch):
+    model = _FakeModel()
+    monkeypatch.setattr(gemini_integration, "model", model)
+    coalesced = gemini_integration._gemini_stats["coalesced"]
+
+    async def scenario():
+        return await asyncio.gather(*(
+            gemini_integration._generate_once("same-key", "What to sow?", "en", SECTIONS) for _ in range(5)
+        ))
+
+    assert asyncio.run(scenario()) == ["answer 1"] * 5
+    assert model.calls == 1
+    assert gemini_integration._gemini_stats["coalesced"] - coalesced == 4
+    assert answer_cache.answers.get("same-key") == "answer 1"
+
+
+def test_timeout_frees_the_slot(monkeypatch):
+    monkeypatch.setattr(gemini_integration, "GEMINI_CONCURRENCY", 1)
+    monkeypatch.setattr(gemini_integration, "GEMINI_TIMEOUT", 0.05)
+    monkeypatch.setattr(gemini_integration, "model", _FakeModel(delay=10))
+    in_flight = gemini_integration._gemini_stats["in_flight"]
+
+    async def scenario():
+        # The leader and a coalesced waiter both see the timeout
+        results = await asyncio.gather(
+            gemini_integration._generate_once("slow-key", "Slow question", "en", SECTIONS),
+            gemini_integration._generate_once("slow-key", "Slow question", "en", SECTIONS),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+        assert gemini_integration._pending_answers == {}
+        assert gemini_integration._gemini_stats["in_flight"] == in_flight
+
+        # With one slot, this call would wait forever if the timed-out one kept it
+        gemini_integration.model = _FakeModel(delay=0)
+        return await asyncio.wait_for(
+            gemini_integration._generate_once("next-key", "Next question", "en", SECTIONS), 1
+        )
+
+    assert asyncio.run(scenario()) == "answer 1"
+
+
+def test_cancelled_leader_leaves_nothing_pending(monkeypatch):
+    monkeypatch.setattr(gemini_integration, "model", _FakeModel(delay=10))
+
+    async def scenario():
+        leader = asyncio.create_task(
+            gemini_integration._generate_once("cancel-key", "Question", "en", SECTIONS)
+        )
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(
+            gemini_integration._generate_once("cancel-key", "Question", "en", SECTIONS)
+        )
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(RuntimeError):
+            await waiter
+
+    asyncio.run(scenario())
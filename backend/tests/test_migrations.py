@@ -0,0 +1,37 @@
+"""
+Data migrations: legacy weather alert timestamps end up in the UTC format
+db.utc_timestamp() writes.
+"""
+
+import sqlite3
+
+import db
+import migrations
+
+
+def test_weather_alert_timestamps_become_utc(tmp_path):
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    cursor = conn.cursor()
+    for version, _, step in migrations.MIGRATIONS:
+        if version >= 9:
+            break
+        step(cursor)
+    legacy = [
+        ("naive", "2024-05-01T10:30:00.5", "2024-05-02T10:00:00.123456"),  # Python's local isoformat()
+        ("offset", "2024-05-01T10:30:00+05:00", "2024-05-02T10:00:00+00:00"),
+        ("default", "2024-05-01 05:30:00", None),  # CURRENT_TIMESTAMP, already UTC
+    ]
+    cursor.executemany('''
+        INSERT INTO weather_alerts (region, alert_type, severity, message_ur, message_en, created_at, valid_until)
+        VALUES ('Test', ?, 'low', '', '', ?, ?)
+    ''', legacy)
+
+    migrations._0009_weather_alerts_dedup_window(cursor)
+
+    rows = cursor.execute("SELECT alert_type, created_at, valid_until FROM weather_alerts WHERE region = 'Test'")
+    assert sorted(rows) == sorted([
+        ("naive", db.utc_timestamp("2024-05-01T10:30:00.5"), db.utc_timestamp("2024-05-02T10:00:00.123456")),
+        ("offset", "2024-05-01 05:30:00", "2024-05-02 10:00:00"),
+        ("default", "2024-05-01 05:30:00", None),
+    ])
+    conn.close()
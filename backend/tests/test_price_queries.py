@@ -0,0 +1,53 @@
+"""
+Market price query plans: every latest-prices and history lookup must be
+served by its index, never a full scan of market_prices or the rollups.
+"""
+
+import pytest
+
+import db
+import migrations
+import rollups
+from main import market_prices_query
+
+
+@pytest.fixture(scope="module")
+def conn():
+    migrations.migrate()
+    with db.reader() as connection:
+        yield connection
+
+
+def _plan(conn, sql, params):
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+@pytest.mark.parametrize("crop_name, region, index", [
+    (None, None, "idx_market_prices_time"),
+    (None, "Punjab", "idx_market_prices_region_time"),
+    ("گندم", None, "idx_market_prices_crop_time"),
+    ("wheat", "Punjab", "idx_market_prices_crop_region_time"),
+])
+def test_market_prices_query_uses_index(conn, crop_name, region, index):
+    plan = _plan(conn, *market_prices_query(crop_name, region))
+    assert any(f"USING INDEX {index}" in step for step in plan), plan
+    # The index order is the result order: no sort step
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+@pytest.mark.parametrize("interval", list(rollups.INTERVALS))
+def test_history_query_by_region_uses_primary_key(conn, interval):
+    table = rollups.INTERVALS[interval][0]
+    plan = _plan(conn, *rollups.history_query("wheat", "Punjab", interval, 30))
+    assert plan == [f"SEARCH {table} USING PRIMARY KEY (crop_key=? AND region=?)"], plan
+
+
+@pytest.mark.parametrize("interval", list(rollups.INTERVALS))
+def test_history_query_all_regions_uses_crop_bucket_index(conn, interval):
+    table = rollups.INTERVALS[interval][0]
+    plan = _plan(conn, *rollups.history_query("wheat", None, interval, 30))
+    index = f"idx_{table}_crop_bucket"
+    # Newest buckets come off the index, then only their per-region rows are read
+    assert f"SEARCH {table} USING COVERING INDEX {index} (crop_key=?)" in plan, plan
+    assert f"SEARCH {table} USING INDEX {index} (crop_key=? AND bucket=?)" in plan, plan
+    assert not any(step.startswith(f"SCAN {table}") for step in plan), plan
@@ -0,0 +1,59 @@
+"""
+Market price rollups: a corrected raw price replaces its observation in the
+daily and hourly buckets instead of being counted again.
+"""
+
+import pytest
+
+import db
+import migrations
+
+_INSERT = '''
+    INSERT INTO market_prices (crop_name, crop_key, region, price_per_kg, mandi_name, recorded_at)
+    VALUES ('Wheat', 'test-crop', 'Punjab', ?, ?, ?)
+'''
+
+
+@pytest.fixture
+def prices():
+    migrations.migrate()
+    with db.writer() as conn:
+        conn.executemany(_INSERT, [
+            (100, "A", "2026-10-10 08:00:00"),
+            (110, "B", "2026-10-10 09:30:00"),
+            (120, "C", "2026-10-10 10:00:00"),
+        ])
+    yield
+    with db.writer() as conn:
+        conn.execute("DELETE FROM market_prices WHERE crop_key = 'test-crop'")
+        for table in ("market_price_daily", "market_price_hourly"):
+            conn.execute(f"DELETE FROM {table} WHERE crop_key = 'test-crop'")
+
+
+def _buckets(table):
+    with db.reader() as conn:
+        return [tuple(row) for row in conn.execute(f'''
+            SELECT bucket, open, high, low, close, price_sum, price_count FROM {table}
+            WHERE crop_key = 'test-crop' ORDER BY bucket
+        ''')]
+
+
+def test_price_correction_keeps_count(prices):
+    with db.writer() as conn:
+        conn.execute("UPDATE market_prices SET price_per_kg = 130 WHERE crop_key = 'test-crop' AND mandi_name = 'C'")
+        conn.execute("UPDATE market_prices SET price_per_kg = 90 WHERE crop_key = 'test-crop' AND mandi_name = 'A'")
+    assert _buckets("market_price_daily") == [("2026-10-10", 90, 130, 90, 130, 330, 3)]
+
+
+def test_moved_observation_leaves_its_old_bucket(prices):
+    with db.writer() as conn:
+        conn.execute(
+            "UPDATE market_prices SET recorded_at = '2026-10-11 07:00:00' WHERE crop_key = 'test-crop' AND mandi_name = 'B'"
+        )
+    assert _buckets("market_price_daily") == [
+        ("2026-10-10", 100, 120, 100, 120, 220, 2),
+        ("2026-10-11", 110, 110, 110, 110, 110, 1),
+    ]
+    assert [bucket for bucket, *_ in _buckets("market_price_hourly")] == [
+        "2026-10-10 08:00", "2026-10-10 10:00", "2026-10-11 07:00",
+    ]
@@ -0,0 +1,130 @@
+"""
+Refresh scheduler: job_leases let one worker at a time run a job, and a
+worker only frees or reschedules the leases it holds.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import db
+import migrations
+import scheduler
+from scheduler import RefreshScheduler
+
+
+@pytest.fixture(autouse=True)
+def leases():
+    migrations.migrate()
+    yield
+    with db.writer() as conn:
+        conn.execute("DELETE FROM job_leases WHERE job LIKE 'test-%'")
+
+
+def _acquire(worker, job, force=False):
+    with db.writer() as conn:
+        return worker._acquire(conn, job, force)
+
+
+def _release(worker, job, interval=3600):
+    with db.writer() as conn:
+        worker._release(conn, job, interval, "ok", 1.0)
+
+
+def _lease(job):
+    with db.reader() as conn:
+        return conn.execute('''
+            SELECT owner, lease_until > CURRENT_TIMESTAMP, next_run_at > CURRENT_TIMESTAMP, last_status
+            FROM job_leases WHERE job = ?
+        ''', (job,)).fetchone()
+
+
+def test_held_lease_blocks_other_owners():
+    first, second = RefreshScheduler(), RefreshScheduler()
+    assert _acquire(first, "test-held")
+    assert not _acquire(second, "test-held")
+    assert tuple(_lease("test-held"))[:2] == (first.owner, 1)
+
+
+def test_force_skips_next_run_at_but_not_a_live_lease():
+    first, second = RefreshScheduler(), RefreshScheduler()
+    assert _acquire(first, "test-force")
+    assert not _acquire(second, "test-force", force=True)
+
+    _release(first, "test-force")
+    assert not _acquire(second, "test-force")
+    assert _acquire(second, "test-force", force=True)
+    assert _lease("test-force")[0] == second.owner
+
+
+def test_release_frees_the_lease_and_schedules_the_next_run():
+    worker = RefreshScheduler()
+    assert _acquire(worker, "test-release")
+    _release(worker, "test-release")
+    assert tuple(_lease("test-release")) == (worker.owner, 0, 1, "ok")
+
+
+def test_release_by_another_owner_is_ignored():
+    first, second = RefreshScheduler(), RefreshScheduler()
+    assert _acquire(first, "test-other-release")
+    _release(second, "test-other-release")
+    assert tuple(_lease("test-other-release"))[:2] == (first.owner, 1)
+
+
+def test_abandon_frees_only_this_owners_leases():
+    first, second = RefreshScheduler(), RefreshScheduler()
+    assert _acquire(first, "test-mine")
+    assert _acquire(second, "test-theirs")
+    with db.writer() as conn:
+        first._abandon(conn)
+    # next_run_at is left alone, so the abandoned job is due again
+    assert tuple(_lease("test-mine"))[:2] == (first.owner, 0)
+    assert _acquire(second, "test-mine")
+    assert tuple(_lease("test-theirs"))[:2] == (second.owner, 1)
+
+
+def test_trigger_during_a_run_does_not_queue_another(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_ENABLED", True)
+    started, finish = threading.Event(), threading.Event()
+    runs = []
+
+    def job():
+        runs.append(1)
+        started.set()
+        finish.wait(5)
+
+    async def scenario():
+        worker = RefreshScheduler()
+        worker.add_job("test-trigger", job, 3600)
+        worker.start()
+        await asyncio.to_thread(started.wait, 5)
+        worker.trigger("test-trigger")
+        finish.set()
+        await asyncio.sleep(0.3)
+        await worker.stop()
+
+    asyncio.run(scenario())
+    assert len(runs) == 1
+
+
+def test_stop_waits_for_the_running_job(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_ENABLED", True)
+    started, finished = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        threading.Event().wait(0.3)
+        finished.set()
+
+    async def scenario():
+        worker = RefreshScheduler()
+        worker.add_job("test-stop", job, 3600)
+        worker.start()
+        await asyncio.to_thread(started.wait, 5)
+        await worker.stop()
+        return worker
+
+    worker = asyncio.run(scenario())
+    assert finished.is_set()
+    assert tuple(_lease("test-stop"))[:2] == (worker.owner, 0)
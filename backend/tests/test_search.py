@@ -0,0 +1,57 @@
+"""
+Full-text search: one BM25 ranking over titles and bodies, and a
+highlighted snippet from the column that matched.
+"""
+
+import pytest
+
+import db
+import migrations
+import search
+
+_LONG_TITLE = "Quorbite " + " ".join(f"filler{i}" for i in range(60))
+_ARTICLES = [
+    # (title_en, content_en)
+    ("Quorbite compost guide", "Mix green and brown waste in layers"),
+    ("Soil care", "Quorbite quorbite quorbite keeps quorbite soil loose"),
+    (_LONG_TITLE, "-"),
+]
+
+
+@pytest.fixture(autouse=True)
+def articles():
+    migrations.migrate()
+    with db.writer() as conn:
+        conn.executemany('''
+            INSERT INTO wiki_articles (title_ur, title_en, content_ur, content_en, category)
+            VALUES ('-', ?, '-', ?, 'test-search')
+        ''', _ARTICLES)
+    yield
+    with db.writer() as conn:
+        conn.execute("DELETE FROM wiki_articles WHERE category = 'test-search'")
+
+
+def _search(text):
+    with db.reader() as conn:
+        return search.search(conn, text, "en", "wiki")
+
+
+def test_title_only_match_highlights_the_title():
+    results = _search("compost guide")
+    assert results[0]["title"] == "Quorbite compost guide"
+    assert results[0]["snippet"] == "Quorbite <mark>compost</mark> <mark>guide</mark>"
+
+
+def test_body_match_highlights_the_body():
+    results = {result["title"]: result for result in _search("loose")}
+    assert "<mark>loose</mark>" in results["Soil care"]["snippet"]
+
+
+def test_body_match_can_outrank_a_weak_title_match():
+    # One mention in a very long title scores below a short body that
+    # repeats the term, even with titles weighted 10x
+    results = _search("quorbite")
+    titles = [result["title"] for result in results]
+    assert titles.index("Soil care") < titles.index(_LONG_TITLE)
+    scores = [result["score"] for result in results]
+    assert scores == sorted(scores, reverse=True)
@@ -0,0 +1,133 @@
+"""
+TTLCache: single-flight loads, stale-while-revalidate, negative caching and
+batch lookups that only load what is missing.
+"""
+
+import threading
+import time
+
+import pytest
+
+from ttl_cache import TTLCache
+
+
+def _wait_for(condition, timeout=5.0):
+    ends_at = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < ends_at, "timed out"
+        time.sleep(0.01)
+
+
+def test_concurrent_gets_share_one_load():
+    cache = TTLCache("test-single-flight", ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("key", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: cache.stats()["coalesced"] == 7)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["value"] * 8
+    assert cache.stats()["inflight"] == 0
+
+
+def test_stale_hit_returns_old_value_while_refreshing():
+    cache = TTLCache("test-stale", ttl=0.05, stale_ttl=60)
+    assert cache.get("key", lambda: "old") == "old"
+    time.sleep(0.1)
+
+    release = threading.Event()
+
+    def slow_loader():
+        release.wait(5)
+        return "new"
+
+    assert cache.get("key", slow_loader) == "old"
+    assert cache.get("key", slow_loader) == "old"  # one refresh, already running
+    assert cache.stats()["refreshes"] == 1
+    release.set()
+    _wait_for(lambda: cache.peek("key") == "new")
+    assert cache.get("key", lambda: "unused") == "new"
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    cache = TTLCache("test-stale-failure", ttl=0.05, stale_ttl=60, negative_ttl=60)
+    cache.get("key", lambda: "old")
+    time.sleep(0.1)
+    assert cache.get("key", lambda: None) == "old"
+    _wait_for(lambda: cache.stats()["inflight"] == 0)
+    assert cache.peek("key") == "old"
+
+
+def test_none_is_cached_for_the_negative_ttl():
+    cache = TTLCache("test-negative", ttl=60, negative_ttl=0.1)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None
+
+    assert cache.get("key", loader) is None
+    assert cache.get("key", loader) is None
+    assert len(calls) == 1
+    assert cache.stats()["negative_hits"] == 1
+
+    time.sleep(0.15)
+    assert cache.get("key", loader) is None
+    assert len(calls) == 2
+
+
+def test_failing_loader_is_cached_for_the_negative_ttl():
+    cache = TTLCache("test-negative-error", ttl=60, negative_ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        cache.get("key", loader)
+    assert cache.get("key", loader) is None
+    assert len(calls) == 1
+
+
+def test_none_is_not_cached_without_a_negative_ttl():
+    cache = TTLCache("test-no-negative", ttl=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None
+
+    cache.get("key", loader)
+    cache.get("key", loader)
+    assert len(calls) == 2
+
+
+def test_get_many_loads_only_missing_keys():
+    cache = TTLCache("test-many", ttl=60, negative_ttl=60)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: None)
+    loaded = []
+
+    def loader(keys):
+        loaded.append(list(keys))
+        return {"c": 3}
+
+    assert cache.get_many(["a", "b", "c", "d", "c"], loader) == {"a": 1, "b": None, "c": 3, "d": None}
+    assert loaded == [["c", "d"]]
+
+    # "d" came back missing, so it is now a negative entry too
+    assert cache.get_many(["c", "d"], loader) == {"c": 3, "d": None}
+    assert len(loaded) == 1
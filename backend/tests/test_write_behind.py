@@ -0,0 +1,110 @@
+"""
+Write-behind buffer: batches go out on size or age, a failed batch is
+retried row by row, and close() drains the queue and leaves the buffer
+usable.
+"""
+
+import threading
+import time
+
+import pytest
+
+import db
+from write_behind import WriteBehindBuffer
+
+_INSERT = "INSERT INTO test_write_behind (body) VALUES (?)"
+
+
+@pytest.fixture(autouse=True)
+def table():
+    with db.writer() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS test_write_behind (id INTEGER PRIMARY KEY, body TEXT NOT NULL)")
+    yield
+    with db.writer() as conn:
+        conn.execute("DROP TABLE test_write_behind")
+
+
+def _bodies():
+    with db.reader() as conn:
+        return [row[0] for row in conn.execute("SELECT body FROM test_write_behind ORDER BY id")]
+
+
+def _wait_for(condition, timeout=5.0):
+    ends_at = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < ends_at, "timed out"
+        time.sleep(0.01)
+
+
+def test_full_batch_is_written_without_waiting_for_the_interval():
+    buffer = WriteBehindBuffer("test-size", _INSERT, max_batch=5, flush_interval=60)
+    for i in range(5):
+        buffer.add((f"row {i}",))
+    _wait_for(lambda: len(_bodies()) == 5)
+    assert buffer.stats()["flushes"] == 1
+    buffer.close()
+
+
+def test_partial_batch_is_written_after_the_interval():
+    buffer = WriteBehindBuffer("test-interval", _INSERT, max_batch=100, flush_interval=0.1)
+    buffer.add(("first",))
+    buffer.add(("second",))
+    assert _bodies() == []
+    _wait_for(lambda: _bodies() == ["first", "second"])
+    stats = buffer.stats()
+    assert (stats["flushes"], stats["last_flush_rows"], stats["depth"]) == (1, 2, 0)
+    buffer.close()
+
+
+def test_failed_batch_is_retried_row_by_row():
+    buffer = WriteBehindBuffer("test-retry", _INSERT, max_batch=100, flush_interval=60)
+    buffer.add(("good",))
+    buffer.add((None,))  # violates NOT NULL and fails the batch
+    buffer.add(("also good",))
+    buffer.close()
+    assert _bodies() == ["good", "also good"]
+    stats = buffer.stats()
+    assert (stats["flushed_rows"], stats["failed_rows"]) == (2, 1)
+
+
+def test_close_drains_and_the_buffer_can_be_reused():
+    buffer = WriteBehindBuffer("test-close", _INSERT, max_batch=100, flush_interval=60)
+    buffer.add(("before close",))
+    buffer.close()
+    assert _bodies() == ["before close"]
+
+    buffer.add(("after close",))
+    assert buffer._thread is not None and buffer._thread.is_alive()
+    buffer.close()
+    assert _bodies() == ["before close", "after close"]
+    assert buffer.stats()["depth"] == 0
+
+
+def test_close_leaves_a_stuck_flusher_alone():
+    buffer = WriteBehindBuffer("test-stuck", _INSERT, max_batch=1, flush_interval=60)
+    write, entered, release = buffer._write, threading.Event(), threading.Event()
+
+    def slow_write(rows):
+        entered.set()
+        release.wait(5)
+        write(rows)
+
+    buffer._write = slow_write
+    buffer.add(("first",))
+    assert entered.wait(5)
+    flusher = buffer._thread
+
+    buffer.close(timeout=0.05)
+    buffer.add(("second",))
+    # Still closed, and no second flusher next to the stuck one
+    assert buffer._thread is flusher and buffer._closed
+
+    release.set()
+    flusher.join(5)
+    assert not flusher.is_alive()
+    assert _bodies() == ["first", "second"]
+
+    buffer.close()
+    buffer.add(("third",))
+    buffer.close()
+    assert _bodies() == ["first", "second", "third"]
@@ -0,0 +1,408 @@
+"""
+Record/Replay Transport for External APIs
+Captures RapidAPI, WeatherAPI and Gemini responses to fixtures and serves them offline
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# live: real network (default); record: real network, responses saved as
+# fixtures; replay: fixtures only, no network or API keys needed
+TRANSPORT_MODE = os.getenv("KISAAN_TRANSPORT", "live").lower()
+if TRANSPORT_MODE not in ("live", "record", "replay"):
+    print(f"⚠ Unknown KISAAN_TRANSPORT={TRANSPORT_MODE!r}; using live")
+    TRANSPORT_MODE = "live"
+RECORD = TRANSPORT_MODE == "record"
+REPLAY = TRANSPORT_MODE == "replay"
+
+FIXTURES_DIR = os.getenv("KISAAN_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+# Replay latency per response; unset replays the latency seen while recording
+_latency = os.getenv("KISAAN_REPLAY_LATENCY_MS")
+REPLAY_LATENCY_MS: Optional[float] = float(_latency) if _latency else None
+_gemini_latency = os.getenv("KISAAN_REPLAY_GEMINI_LATENCY_MS")
+REPLAY_GEMINI_LATENCY_MS: Optional[float] = float(_gemini_latency) if _gemini_latency else REPLAY_LATENCY_MS
+# Latency is drawn uniformly from +/- this fraction of the base value
+REPLAY_JITTER = float(os.getenv("KISAAN_REPLAY_JITTER", "0"))
+# Share of replayed calls that fail; "503" answers 503, "timeout" hangs until the timeout
+REPLAY_ERROR_RATE = float(os.getenv("KISAAN_REPLAY_ERROR_RATE", "0"))
+REPLAY_ERROR = os.getenv("KISAAN_REPLAY_ERROR", "503")
+# Streamed Gemini replies are replayed in pieces of about this many characters
+STREAM_PIECE_CHARS = int(os.getenv("KISAAN_REPLAY_STREAM_CHARS", "80"))
+
+if RECORD or REPLAY:
+    print(f"✓ Transport mode: {TRANSPORT_MODE} (fixtures in {FIXTURES_DIR})")
+
+# Credentials never reach a fixture (or its key)
+_SECRET_PARAMS = {"key", "api_key", "apikey", "token", "access_token"}
+
+_stats_lock = threading.Lock()
+_stats = {
+    "recorded": 0,
+    "replayed": 0,
+    "replay_fallbacks": 0,
+    "replay_missing": 0,
+    "injected_errors": 0,
+}
+
+_index_lock = threading.Lock()
+_fixtures: Optional[Dict[str, Dict]] = None  # "service/digest" -> fixture
+_by_endpoint: Dict[str, List[str]] = {}  # "service path" -> fixture ids
+
+
+def _bump(key: str):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _sanitized_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in _SECRET_PARAMS)
+    return f"{parts.path}?{urlencode(query)}" if query else parts.path
+
+
+def _service(url: str) -> str:
+    return (urlsplit(url).hostname or "unknown").replace(":", "_")
+
+
+def _load_index():
+    # Fixtures are small, so replay keeps all of them in memory
+    global _fixtures
+    with _index_lock:
+        if _fixtures is not None:
+            return
+        fixtures = {}
+        if os.path.isdir(FIXTURES_DIR):
+            for service in sorted(os.listdir(FIXTURES_DIR)):
+                folder = os.path.join(FIXTURES_DIR, service)
+                if not os.path.isdir(folder):
+                    continue
+                for filename in sorted(os.listdir(folder)):
+                    if not filename.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(folder, filename), encoding="utf-8") as f:
+                            fixture = json.load(f)
+                    except (OSError, ValueError) as e:
+                        print(f"⚠ Skipping unreadable fixture {service}/{filename}: {e}")
+                        continue
+                    fixture_id = f"{service}/{filename[:-5]}"
+                    fixtures[fixture_id] = fixture
+                    _by_endpoint.setdefault(f"{service} {fixture['endpoint']}", []).append(fixture_id)
+        _fixtures = fixtures
+        print(f"✓ Replay transport: {len(fixtures)} fixtures from {FIXTURES_DIR}")
+
+
+def _find(service: str, digest: str, endpoint: str) -> Optional[Dict]:
+    """
+    Exact fixture for a request or, failing that, a recorded response from
+    the same endpoint (picked by digest, so a request always gets the same
+    one). The fallback lets a load test ask for cities nobody recorded.
+    """
+    _load_index()
+    fixture = _fixtures.get(f"{service}/{digest}")
+    if fixture is not None:
+        return fixture
+    candidates = _by_endpoint.get(f"{service} {endpoint}")
+    if not candidates:
+        return None
+    _bump("replay_fallbacks")
+    return _fixtures[candidates[int(digest, 16) % len(candidates)]]
+
+
+def _save(service: str, digest: str, fixture: Dict):
+    folder = os.path.join(FIXTURES_DIR, service)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{digest}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    _bump("recorded")
+
+
+def _replay_delay(recorded_ms: float, base_ms: Optional[float]) -> float:
+    delay = recorded_ms if base_ms is None else base_ms
+    if REPLAY_JITTER:
+        delay *= 1 + random.uniform(-REPLAY_JITTER, REPLAY_JITTER)
+    return max(delay, 0.0) / 1000
+
+
+def _inject_error() -> bool:
+    if REPLAY_ERROR_RATE and random.random() < REPLAY_ERROR_RATE:
+        _bump("injected_errors")
+        return True
+    return False
+
+
+class RecordReplayAdapter(HTTPAdapter):
+    """
+    requests transport adapter for record and replay modes.
+
+    Record sends the request for real and saves successful responses (not
+    429/5xx) under FIXTURES_DIR/<host>/<digest>.json, keyed by method, path,
+    query (credentials removed) and body. Replay answers from those files
+    without opening a socket, after the configured latency; injected errors
+    and timeouts surface exactly like real ones, so retries, deadlines and
+    circuit breakers behave as they would online.
+    """
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        service = _service(request.url)
+        endpoint = urlsplit(request.url).path
+        body = request.body.decode("utf-8", "replace") if isinstance(request.body, bytes) else (request.body or "")
+        digest = _digest(request.method, _sanitized_url(request.url), body)
+
+        if RECORD:
+            started = time.perf_counter()
+            response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                    proxies=proxies)
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            if response.status_code < 500 and response.status_code != 429:
+                _save(service, digest, {
+                    "endpoint": endpoint,
+                    "request": f"{request.method} {_sanitized_url(request.url)}",
+                    "status": response.status_code,
+                    "content_type": response.headers.get("Content-Type", "application/json"),
+                    "body": response.text,
+                    "elapsed_ms": elapsed_ms,
+                })
+            return response
+
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if _inject_error():
+            if REPLAY_ERROR == "timeout":
+                time.sleep(read_timeout or 0)
+                raise requests.exceptions.ReadTimeout(f"Injected timeout for {request.url}", request=request)
+            return self._response(request, 503, "application/json", '{"error": "injected"}', 0.0)
+
+        fixture = _find(service, digest, endpoint)
+        if fixture is None:
+            _bump("replay_missing")
+            raise requests.exceptions.ConnectionError(f"No replay fixture for {request.method} {request.url}",
+                                                      request=request)
+        delay = _replay_delay(fixture.get("elapsed_ms", 0.0), REPLAY_LATENCY_MS)
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(f"Replay latency exceeded timeout for {request.url}",
+                                                  request=request)
+        time.sleep(delay)
+        _bump("replayed")
+        return self._response(request, fixture["status"], fixture["content_type"], fixture["body"], delay)
+
+    def _response(self, request, status: int, content_type: str, body: str, delay: float) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        try:
+            response.reason = HTTPStatus(status).phrase
+        except ValueError:
+            response.reason = ""
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type})
+        response._content = body.encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = timedelta(seconds=delay)
+        return response
+
+
+def http_adapter(**kwargs) -> HTTPAdapter:
+    """The adapter http_client mounts: a plain HTTPAdapter unless recording or replaying."""
+    if RECORD or REPLAY:
+        return RecordReplayAdapter(**kwargs)
+    return HTTPAdapter(**kwargs)
+
+
+class ReplayedResponse:
+    """Stand-in for a Gemini GenerateContentResponse or stream chunk (only .text is used)."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class RecordingModel:
+    """Wraps a Gemini model; generate_content() results are saved as fixtures."""
+
+    def __init__(self, model):
+        self._model = model
+
+    def generate_content(self, prompt, **kwargs):
+        started = time.perf_counter()
+        response = self._model.generate_content(prompt, **kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream(prompt, response, started)
+        self._save_reply(prompt, response, started)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        started = time.perf_counter()
+        response = await self._model.generate_content_async(prompt, **kwargs)
+        if kwargs.get("stream"):
+            return self._record_stream_async(prompt, response, started)
+        self._save_reply(prompt, response, started)
+        return response
+
+    def _save_reply(self, prompt, response, started: float):
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        try:
+            text = response.text
+        except Exception:
+            return  # blocked or empty; nothing worth replaying
+        _save("gemini", _digest(str(prompt)), {
+            "endpoint": "generate_content",
+            "request": str(prompt),
+            "text": text,
+            "elapsed_ms": elapsed_ms,
+        })
+
+    def _save_stream(self, prompt, pieces: List[str], started: float, first_chunk_ms: Optional[float]):
+        if pieces:
+            _save("gemini", _digest(str(prompt)), {
+                "endpoint": "generate_content",
+                "request": str(prompt),
+                "text": "".join(pieces),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                "first_chunk_ms": first_chunk_ms,
+            })
+
+    def _record_stream(self, prompt, response, started: float):
+        # Chunks pass straight through; the fixture is saved once the stream ends
+        pieces = []
+        first_chunk_ms = None
+        for chunk in response:
+            if first_chunk_ms is None:
+                first_chunk_ms = round((time.perf_counter() - started) * 1000, 1)
+            try:
+                pieces.append(chunk.text)
+            except Exception:
+                pass
+            yield chunk
+        self._save_stream(prompt, pieces, started, first_chunk_ms)
+
+    async def _record_stream_async(self, prompt, response, started: float):
+        pieces = []
+        first_chunk_ms = None
+        async for chunk in response:
+            if first_chunk_ms is None:
+                first_chunk_ms = round((time.perf_counter() - started) * 1000, 1)
+            try:
+                pieces.append(chunk.text)
+            except Exception:
+                pass
+            yield chunk
+        self._save_stream(prompt, pieces, started, first_chunk_ms)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def _stream_pieces(text: str, size: int = STREAM_PIECE_CHARS) -> List[str]:
+    # Whole words, about `size` characters per piece
+    pieces, start = [], 0
+    while start < len(text):
+        end = text.find(" ", start + size)
+        end = len(text) if end < 0 else end + 1
+        pieces.append(text[start:end])
+        start = end
+    return pieces or [""]
+
+
+def _stream_schedule(fixture: Dict, delay: float) -> List[Tuple[float, str]]:
+    # (pause, piece) pairs: the first piece arrives after the recorded share
+    # of the total time (streamed recordings keep first_chunk_ms), the rest
+    # evenly after it
+    pieces = _stream_pieces(fixture["text"])
+    recorded_ms = fixture.get("elapsed_ms") or 0.0
+    if fixture.get("first_chunk_ms") is not None and recorded_ms > 0:
+        first = delay * fixture["first_chunk_ms"] / recorded_ms
+    else:
+        first = delay / len(pieces)
+    interval = (delay - first) / max(len(pieces) - 1, 1)
+    return [(first, pieces[0])] + [(interval, piece) for piece in pieces[1:]]
+
+
+class ReplayModel:
+    """Answers generate_content() (and its async variant) from recorded Gemini fixtures, offline."""
+
+    model_name = "replay"
+
+    def _lookup(self, prompt):
+        if _inject_error():
+            raise RuntimeError("Injected Gemini error")
+        fixture = _find("gemini", _digest(str(prompt)), "generate_content")
+        if fixture is None:
+            _bump("replay_missing")
+            raise RuntimeError("No replay fixture for Gemini prompt")
+        _bump("replayed")
+        return fixture, _replay_delay(fixture.get("elapsed_ms", 0.0), REPLAY_GEMINI_LATENCY_MS)
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        fixture, delay = self._lookup(prompt)
+        if stream:
+            return self._stream(fixture, delay)
+        time.sleep(delay)
+        return ReplayedResponse(fixture["text"])
+
+    async def generate_content_async(self, prompt, stream: bool = False, **kwargs):
+        fixture, delay = self._lookup(prompt)
+        if stream:
+            return self._stream_async(fixture, delay)
+        await asyncio.sleep(delay)
+        return ReplayedResponse(fixture["text"])
+
+    def _stream(self, fixture: Dict, delay: float):
+        for pause, piece in _stream_schedule(fixture, delay):
+            time.sleep(pause)
+            yield ReplayedResponse(piece)
+
+    async def _stream_async(self, fixture: Dict, delay: float):
+        for pause, piece in _stream_schedule(fixture, delay):
+            await asyncio.sleep(pause)
+            yield ReplayedResponse(piece)
+
+
+def wrap_model(model):
+    """
+    Apply the transport mode to gemini_integration's model.
+
+    Args:
+        model: Configured GenerativeModel, or None without an API key
+
+    Returns:
+        The model itself (live), a RecordingModel, or a ReplayModel (which
+        needs no API key)
+    """
+    if REPLAY:
+        return ReplayModel()
+    if RECORD and model is not None:
+        return RecordingModel(model)
+    return model
+
+
+def stats() -> Dict:
+    """Transport mode and record/replay counters for /api/stats."""
+    with _stats_lock:
+        snapshot = dict(_stats)
+    snapshot["mode"] = TRANSPORT_MODE
+    if REPLAY:
+        snapshot["fixtures"] = len(_fixtures) if _fixtures is not None else None
+        snapshot["latency_ms"] = REPLAY_LATENCY_MS
+        snapshot["error_rate"] = REPLAY_ERROR_RATE
+    return snapshot
@@ -0,0 +1,295 @@
+"""
+In-Process TTL Cache
+LRU cache with stale-while-revalidate and single-flight loading
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+# Every cache registers itself here so /api/stats can report them all
+_registry: Dict[str, "TTLCache"] = {}
+_registry_lock = threading.Lock()
+
+
+class TTLCache:
+    """
+    Process-wide cache for values that are expensive to load (upstream API
+    calls).
+
+    - Fresh for `ttl` seconds: served from memory.
+    - Stale for a further `stale_ttl` seconds: served from memory while one
+      background thread reloads it (stale-while-revalidate).
+    - Older, or missing: loaded on the caller's thread. Concurrent misses
+      for the same key wait for that one load instead of starting their own
+      (single-flight).
+    - At most `max_entries` keys; the least recently used is evicted.
+
+    A loader returning None means "no value" (e.g. the upstream failed). It
+    is remembered for `negative_ttl` seconds so callers get None at once
+    instead of retrying the upstream; with negative_ttl=0 it is not cached.
+    A loader that raises is remembered the same way (the caller that ran it
+    still gets the exception). A None from a background refresh never
+    replaces a stale value.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024,
+                 negative_ttl: float = 0.0):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, loaded_at)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "refreshes": 0,
+            "evictions": 0,
+        }
+        with _registry_lock:
+            _registry[name] = self
+
+    def get(self, key: Hashable, loader: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        """
+        Return the cached value for key, loading it with loader() if needed.
+
+        Args:
+            key: Cache key (callers normalize it first)
+            loader: Zero-argument callable producing the value (or None)
+            wait_timeout: Longest to wait for another caller's in-flight load
+                of the same key; on timeout None is returned
+
+        Returns:
+            The cached or freshly loaded value, or None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is None:
+                # Remembered failure
+                if now - entry[1] < self.negative_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["negative_hits"] += 1
+                    return None
+                entry = None
+            if entry is not None:
+                age = now - entry[1]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["stale_hits"] += 1
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        self._stats["refreshes"] += 1
+                        threading.Thread(target=self._refresh, args=(key, loader), daemon=True,
+                                         name=f"kisaan-{self.name}-refresh").start()
+                    return entry[0]
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                leader = True
+                self._stats["misses"] += 1
+            else:
+                leader = False
+                self._stats["coalesced"] += 1
+
+        if leader:
+            return self._load(key, loader)
+        try:
+            return future.result(timeout=wait_timeout)
+        except FutureTimeout:
+            return None
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        # Runs on the leader's thread, or a refresh thread for stale entries
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                self._store(key, None, time.monotonic())
+                future = self._inflight.pop(key)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._stats["loads"] += 1
+            self._store(key, value, time.monotonic())
+            future = self._inflight.pop(key)
+        future.set_result(value)
+        return value
+
+    def _store(self, key: Hashable, value: Any, now: float):
+        # Caller holds self._lock
+        previous = self._entries.get(key)
+        keep_stale = (value is None and previous is not None and previous[0] is not None
+                      and now - previous[1] < self.ttl + self.stale_ttl)
+        if (value is not None or self.negative_ttl > 0) and not keep_stale:
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_many(self, keys: Sequence[Hashable], loader: Callable[[List[Hashable]], Dict[Hashable, Any]],
+                 wait_timeout: Optional[float] = None) -> Dict[Hashable, Any]:
+        """
+        Batch version of get(): every key that needs loading goes to a single
+        loader(keys) call.
+
+        Fresh, stale and negative entries are served as in get(); stale keys
+        are reloaded together on one background thread. Keys another caller
+        is already loading are waited for (up to wait_timeout in total)
+        instead of being loaded twice.
+
+        Args:
+            keys: Cache keys (duplicates are looked up once)
+            loader: Callable taking a list of keys and returning a dict of
+                key -> value; keys it leaves out are stored as None
+            wait_timeout: Longest to wait for in-flight loads by other callers
+
+        Returns:
+            Dictionary of key -> value (None where nothing could be loaded)
+        """
+        now = time.monotonic()
+        results: Dict[Hashable, Any] = {}
+        to_load: List[Hashable] = []
+        to_refresh: List[Hashable] = []
+        waiting: Dict[Hashable, Future] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] is None:
+                    if now - entry[1] < self.negative_ttl:
+                        self._entries.move_to_end(key)
+                        self._stats["negative_hits"] += 1
+                        results[key] = None
+                        continue
+                    entry = None
+                if entry is not None:
+                    age = now - entry[1]
+                    if age < self.ttl:
+                        self._entries.move_to_end(key)
+                        self._stats["hits"] += 1
+                        results[key] = entry[0]
+                        continue
+                    if age < self.ttl + self.stale_ttl:
+                        self._entries.move_to_end(key)
+                        self._stats["stale_hits"] += 1
+                        results[key] = entry[0]
+                        if key not in self._inflight:
+                            self._inflight[key] = Future()
+                            self._stats["refreshes"] += 1
+                            to_refresh.append(key)
+                        continue
+                if key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self._stats["coalesced"] += 1
+                else:
+                    self._inflight[key] = Future()
+                    self._stats["misses"] += 1
+                    to_load.append(key)
+
+        if to_refresh:
+            threading.Thread(target=self._refresh_many, args=(to_refresh, loader), daemon=True,
+                             name=f"kisaan-{self.name}-refresh").start()
+        if to_load:
+            results.update(self._load_many(to_load, loader))
+        ends_at = None if wait_timeout is None else time.monotonic() + wait_timeout
+        for key, future in waiting.items():
+            remaining = None if ends_at is None else max(ends_at - time.monotonic(), 0)
+            try:
+                results[key] = future.result(timeout=remaining)
+            except Exception:
+                results[key] = None  # timed out, or the other caller's load failed
+        return {key: results.get(key) for key in keys}
+
+    def _load_many(self, keys: List[Hashable], loader: Callable[[List[Hashable]], Dict]) -> Dict[Hashable, Any]:
+        try:
+            values = loader(keys)
+        except Exception as e:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                now = time.monotonic()
+                futures = []
+                for key in keys:
+                    self._store(key, None, now)
+                    futures.append(self._inflight.pop(key))
+            for future in futures:
+                future.set_exception(e)
+            raise
+        with self._lock:
+            self._stats["loads"] += 1
+            now = time.monotonic()
+            futures = []
+            for key in keys:
+                self._store(key, values.get(key), now)
+                futures.append(self._inflight.pop(key))
+        for key, future in zip(keys, futures):
+            future.set_result(values.get(key))
+        return {key: values.get(key) for key in keys}
+
+    def _refresh_many(self, keys: List[Hashable], loader: Callable[[List[Hashable]], Dict]):
+        try:
+            self._load_many(keys, loader)
+        except Exception as e:
+            print(f"⚠ {self.name} cache refresh failed for {len(keys)} keys: {e}")
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            # The stale value keeps being served until it expires
+            print(f"⚠ {self.name} cache refresh failed for {key!r}: {e}")
+
+    def peek(self, key: Hashable) -> Any:
+        """Return the cached value (fresh or stale) without loading or counting."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] is None or time.monotonic() - entry[1] >= self.ttl + self.stale_ttl:
+            return None
+        return entry[0]
+
+    def invalidate(self, key: Hashable):
+        """Drop one key."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every key (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and size for /api/stats."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = len(self._entries)
+            snapshot["inflight"] = len(self._inflight)
+        lookups = (snapshot["hits"] + snapshot["stale_hits"] + snapshot["negative_hits"]
+                   + snapshot["misses"] + snapshot["coalesced"])
+        snapshot["hit_rate"] = round((snapshot["hits"] + snapshot["stale_hits"]) / lookups, 4) if lookups else 0.0
+        snapshot["max_entries"] = self.max_entries
+        snapshot["ttl_s"] = self.ttl
+        snapshot["stale_ttl_s"] = self.stale_ttl
+        snapshot["negative_ttl_s"] = self.negative_ttl
+        return snapshot
+
+
+def all_stats() -> Dict[str, Dict]:
+    """Stats for every cache created in this process, keyed by name."""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
@@ -4,9 +4,16 @@ Using WeatherAPI.com
 """
 
 import os
+import time
 import requests
-from typing import List, Optional, Dict
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Dict, Tuple
+import alert_rules
+import gazetteer
+import http_client
+from circuit_breaker import CircuitBreaker
+from ttl_cache import TTLCache
 
 # Load environment variables from .env file if available
 try:
@@ -17,149 +24,479 @@ except ImportError:
 
 # Weather API Configuration
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY", "99dd9e0dbf9344bebb2223518252110")
-WEATHER_API_BASE = "http://api.weatherapi.com/v1"
+WEATHER_API_BASE = os.getenv("WEATHER_API_BASE", "http://api.weatherapi.com/v1")
+WEATHER_TIMEOUT = float(os.getenv("KISAAN_WEATHER_TIMEOUT", "10"))
 
-def get_current_weather(city: str) -> Optional[Dict]:
+# Multi-city sweeps: cities fetched at once, and the wall-clock budget for
+# the whole sweep (cities not done by then are left out of the result)
+WEATHER_SWEEP_CONCURRENCY = int(os.getenv("KISAAN_WEATHER_CONCURRENCY", "128"))
+WEATHER_SWEEP_DEADLINE = float(os.getenv("KISAAN_WEATHER_SWEEP_DEADLINE", "15"))
+
+# Batch lookups fill cache misses with WeatherAPI bulk queries (POST q=bulk),
+# at most WEATHER_BULK_SIZE locations per request; KISAAN_WEATHER_BULK=0
+# sends one request per city instead
+WEATHER_BULK = os.getenv("KISAAN_WEATHER_BULK", "1") != "0"
+WEATHER_BULK_SIZE = int(os.getenv("KISAAN_WEATHER_BULK_SIZE", "50"))
+# Most cities one batch request may ask for
+WEATHER_BATCH_MAX = int(os.getenv("KISAAN_WEATHER_BATCH_MAX", "300"))
+
+# Observation cache shared by the chat and alert paths: fresh for
+# KISAAN_WEATHER_TTL seconds, then served stale for up to
+# KISAAN_WEATHER_STALE_TTL more while one background refresh runs
+WEATHER_CACHE_TTL = float(os.getenv("KISAAN_WEATHER_TTL", "600"))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("KISAAN_WEATHER_STALE_TTL", "1800"))
+WEATHER_CACHE_SIZE = int(os.getenv("KISAAN_WEATHER_CACHE_SIZE", "512"))
+# A failed lookup is remembered this long, so an outage is not retried per message
+WEATHER_NEGATIVE_TTL = float(os.getenv("KISAAN_NEGATIVE_TTL", "30"))
+
+# Major Pakistani cities checked when no region is given
+ALERT_CITIES = ["Lahore", "Karachi", "Islamabad", "Peshawar", "Multan", "Faisalabad"]
+
+
+@dataclass(frozen=True, slots=True)
+class DayForecast:
+    """Daily summary from one forecastday entry."""
+    max_temp_c: float
+    min_temp_c: float
+    max_temp_f: float
+    min_temp_f: float
+    condition: str
+    maxwind_kph: float
+    totalprecip_mm: float
+
+    @classmethod
+    def parse(cls, day: Dict) -> "DayForecast":
+        return cls(
+            max_temp_c=day.get("maxtemp_c", 0),
+            min_temp_c=day.get("mintemp_c", 0),
+            max_temp_f=day.get("maxtemp_f", 0),
+            min_temp_f=day.get("mintemp_f", 0),
+            condition=day.get("condition", {}).get("text", ""),
+            maxwind_kph=day.get("maxwind_kph", 0),
+            totalprecip_mm=day.get("totalprecip_mm", 0),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ApiAlert:
+    """Government/met-office alert as returned by WeatherAPI (alerts=yes)."""
+    event: str
+    severity: str
+    headline: str
+    desc: str
+    expires: str
+
+
+@dataclass(frozen=True, slots=True)
+class WeatherObservation:
     """
-    Get current weather data for a specific city.
+    Current conditions plus today/tomorrow for one city, parsed once from a
+    single /forecast.json response. The chat context and the alert rules
+    both read this record.
+    """
+    city: str
+    region: str
+    country: str
+    temperature_c: float
+    temperature_f: float
+    feels_like_c: float
+    feels_like_f: float
+    condition: str
+    humidity: float
+    wind_kph: float
+    wind_mph: float
+    wind_dir: str
+    pressure_mb: float
+    precip_mm: float
+    uv_index: float
+    visibility_km: float
+    last_updated: str
+    us_epa_index: Optional[int] = None
+    pm2_5: Optional[float] = None
+    pm10: Optional[float] = None
+    today: Optional[DayForecast] = None
+    tomorrow: Optional[DayForecast] = None
+    alerts: Tuple[ApiAlert, ...] = ()
+
+    @classmethod
+    def parse(cls, data: Dict, city: str, name: Optional[str] = None) -> "WeatherObservation":
+        """
+        Build a record from a /forecast.json payload (aqi=yes, alerts=yes).
+
+        Args:
+            data: Decoded JSON response
+            city: Requested city, used when the response has no location name
+            name: Display name overriding the response's (coordinate queries
+                come back named after the nearest village)
+        """
+        location = data.get("location", {})
+        current = data.get("current", {})
+        aq = current.get("air_quality") or {}
+        forecast = data.get("forecast", {}).get("forecastday", [])
+        return cls(
+            city=name or location.get("name", city),
+            region=location.get("region", ""),
+            country=location.get("country", ""),
+            temperature_c=current.get("temp_c", 0),
+            temperature_f=current.get("temp_f", 0),
+            feels_like_c=current.get("feelslike_c", 0),
+            feels_like_f=current.get("feelslike_f", 0),
+            condition=current.get("condition", {}).get("text", ""),
+            humidity=current.get("humidity", 0),
+            wind_kph=current.get("wind_kph", 0),
+            wind_mph=current.get("wind_mph", 0),
+            wind_dir=current.get("wind_dir", ""),
+            pressure_mb=current.get("pressure_mb", 0),
+            precip_mm=current.get("precip_mm", 0),
+            uv_index=current.get("uv", 0),
+            visibility_km=current.get("vis_km", 0),
+            last_updated=current.get("last_updated", ""),
+            us_epa_index=aq.get("us-epa-index", 0) if aq else None,
+            pm2_5=aq.get("pm2_5", 0) if aq else None,
+            pm10=aq.get("pm10", 0) if aq else None,
+            today=DayForecast.parse(forecast[0].get("day", {})) if len(forecast) > 0 else None,
+            tomorrow=DayForecast.parse(forecast[1].get("day", {})) if len(forecast) > 1 else None,
+            alerts=tuple(
+                ApiAlert(
+                    event=alert.get("event", ""),
+                    severity=alert.get("severity", ""),
+                    headline=alert.get("headline", ""),
+                    desc=alert.get("desc", ""),
+                    expires=alert.get("expires", ""),
+                )
+                for alert in (data.get("alerts") or {}).get("alert", [])
+            ),
+        )
+
+    def to_dict(self) -> Dict:
+        """The dictionary shape get_current_weather() has always returned."""
+        weather_data = {
+            "city": self.city,
+            "region": self.region,
+            "country": self.country,
+            "temperature_c": self.temperature_c,
+            "temperature_f": self.temperature_f,
+            "feels_like_c": self.feels_like_c,
+            "feels_like_f": self.feels_like_f,
+            "condition": self.condition,
+            "humidity": self.humidity,
+            "wind_kph": self.wind_kph,
+            "wind_mph": self.wind_mph,
+            "wind_dir": self.wind_dir,
+            "pressure_mb": self.pressure_mb,
+            "precip_mm": self.precip_mm,
+            "uv_index": self.uv_index,
+            "visibility_km": self.visibility_km,
+            "last_updated": self.last_updated,
+        }
+        if self.us_epa_index is not None:
+            weather_data["air_quality"] = {
+                "us_epa_index": self.us_epa_index,
+                "pm2_5": self.pm2_5,
+                "pm10": self.pm10,
+            }
+        if self.today:
+            weather_data["today"] = asdict(self.today)
+        if self.tomorrow:
+            weather_data["tomorrow"] = asdict(self.tomorrow)
+        return weather_data
+
+
+observation_cache = TTLCache("weather", WEATHER_CACHE_TTL, WEATHER_CACHE_STALE_TTL, WEATHER_CACHE_SIZE,
+                             negative_ttl=WEATHER_NEGATIVE_TTL)
+# Trips when WeatherAPI keeps failing or is slow; calls then fail in microseconds
+weatherapi_breaker = CircuitBreaker("weatherapi")
+# Cleared when WeatherAPI says the plan has no bulk queries
+_bulk_supported = WEATHER_BULK
+# WeatherAPI error code for "API key does not have access to the resource"
+_NO_ACCESS_ERROR = 2009
+
+
+def normalize_city(city: str) -> str:
+    """
+    Map an Urdu/English place name to the weather station that serves it.
+    
+    Provinces, districts and tehsils in the gazetteer snap to their nearest
+    station, so every place around a station shares its cached observation.
+    Unknown names pass through title-cased and are looked up by name.
+    """
+    station = gazetteer.get().station_for(city)
+    return station.name if station else " ".join(city.split()).title()
+
+def _location_query(city: str) -> str:
+    # Stations are queried by coordinates; by name WeatherAPI can pick a
+    # namesake abroad (Hyderabad, India)
+    station = gazetteer.get().station_named(city)
+    return station.query if station else city
+
+def _fetch_observation_upstream(city: str, timeout: float) -> Optional[WeatherObservation]:
+    # One /forecast.json request; city is already normalized
+    try:
+        params = {
+            "key": WEATHER_API_KEY,
+            "q": _location_query(city),
+            "days": 2,
+            "aqi": "yes",
+            "alerts": "yes",
+        }
+        response = http_client.get(f"{WEATHER_API_BASE}/forecast.json", params=params, timeout=timeout,
+                                   breaker=weatherapi_breaker)
+        response.raise_for_status()
+        return WeatherObservation.parse(response.json(), city, name=city)
+        
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching weather for {city}: {e}")
+        return None
+    except Exception as e:
+        print(f"Error processing weather data for {city}: {e}")
+        return None
+
+def fetch_observation(city: str, timeout: float = WEATHER_TIMEOUT) -> Optional[WeatherObservation]:
+    """
+    Fetch current conditions, today, tomorrow and official alerts for a
+    city in one /forecast.json request on the shared keep-alive session.
+    
+    Results are cached per canonical city (observation_cache), so repeated
+    and concurrent lookups for the same city share one upstream call per TTL.
+    Failures are cached briefly too, and while WeatherAPI's circuit breaker
+    is open no request is made at all.
     
     Args:
-        city: City name (e.g., "Multan", "Lahore", "Karachi")
+        city: City name in Urdu or English (e.g., "Multan", "لاہور")
+        timeout: Deadline in seconds, retries included (also the longest
+            wait for another caller's in-flight fetch of the same city)
         
     Returns:
-        Dictionary with weather data or None if error
+        WeatherObservation or None if error
     """
     if not WEATHER_API_KEY:
         return None
     
-    # Map city names (support Urdu names and common variations)
-    city_mapping = {
-        "multan": "Multan",
-        "ملتان": "Multan",
-        "lahore": "Lahore",
-        "لاہور": "Lahore",
-        "karachi": "Karachi",
-        "کراچی": "Karachi",
-        "islamabad": "Islamabad",
-        "اسلام آباد": "Islamabad",
-        "peshawar": "Peshawar",
-        "پشاور": "Peshawar",
-        "quetta": "Quetta",
-        "کوئٹہ": "Quetta",
-        "faisalabad": "Faisalabad",
-        "فیصل آباد": "Faisalabad",
-        "rawalpindi": "Rawalpindi",
-        "راولپنڈی": "Rawalpindi",
-        "gujranwala": "Gujranwala",
-        "گوجرانوالہ": "Gujranwala",
-        "sialkot": "Sialkot",
-        "سیالکوٹ": "Sialkot",
-    }
+    mapped_city = normalize_city(city)
+    return observation_cache.get(
+        mapped_city,
+        lambda: _fetch_observation_upstream(mapped_city, timeout),
+        wait_timeout=timeout,
+    )
+
+def fetch_observations(cities: List[str], deadline: float = WEATHER_SWEEP_DEADLINE) -> Dict[str, WeatherObservation]:
+    """
+    Fetch many cities concurrently under one wall-clock deadline.
     
-    # Normalize city name
-    city_lower = city.lower().strip()
-    mapped_city = city_mapping.get(city_lower, city.title())
+    Up to WEATHER_SWEEP_CONCURRENCY requests run at once. Each request only
+    gets the time left in the sweep, so the call returns within about
+    `deadline` seconds however many cities are slow; cities that fail or
+    do not finish in time are missing from the result.
     
-    try:
-        url = f"{WEATHER_API_BASE}/current.json"
-        params = {
-            "key": WEATHER_API_KEY,
-            "q": mapped_city,
-            "aqi": "yes"
-        }
+    Args:
+        cities: City names as accepted by fetch_observation
+        deadline: Budget in seconds for the whole sweep
         
-        response = requests.get(url, params=params, timeout=10)
+    Returns:
+        Dictionary of requested city -> WeatherObservation, in request order
+    """
+    if not cities:
+        return {}
+    
+    ends_at = time.monotonic() + deadline
+    
+    def fetch(city):
+        remaining = ends_at - time.monotonic()
+        if remaining <= 0:
+            return None
+        return fetch_observation(city, timeout=min(WEATHER_TIMEOUT, remaining))
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, min(WEATHER_SWEEP_CONCURRENCY, len(cities))),
+                                  thread_name_prefix="kisaan-weather-sweep")
+    try:
+        futures = {executor.submit(fetch, city): city for city in cities}
+        done, not_done = wait(futures, timeout=max(ends_at - time.monotonic(), 0))
+    finally:
+        # Never wait for stragglers; their own timeouts end them shortly
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    results = {}
+    for future, city in futures.items():
+        if future in done and future.result() is not None:
+            results[city] = future.result()
+    if not_done or len(results) < len(cities):
+        print(f"⚠ Weather sweep: {len(results)}/{len(cities)} cities within {deadline:.1f}s "
+              f"({len(not_done)} still running at the deadline)")
+    return results
+
+def _fetch_bulk_upstream(cities: List[str], timeout: float) -> Dict[str, Optional[WeatherObservation]]:
+    # One POST ...?q=bulk for up to WEATHER_BULK_SIZE cities; cities are normalized
+    global _bulk_supported
+    params = {"key": WEATHER_API_KEY, "q": "bulk", "days": 2, "aqi": "yes", "alerts": "yes"}
+    body = {"locations": [{"q": _location_query(city), "custom_id": str(i)} for i, city in enumerate(cities)]}
+    try:
+        response = http_client.post(f"{WEATHER_API_BASE}/forecast.json", json=body, params=params,
+                                    timeout=timeout, breaker=weatherapi_breaker)
+        if response.status_code in (400, 403) and _error_code(response) == _NO_ACCESS_ERROR:
+            # The plan has no bulk queries; stop trying them in this process.
+            # Other rejections (bad key, exhausted quota) fail like any call.
+            _bulk_supported = False
+            print(f"⚠ WeatherAPI bulk queries unavailable ({response.status_code}); "
+                  "falling back to one request per city")
+            return _fetch_each_upstream(cities, timeout)
         response.raise_for_status()
-        data = response.json()
         
-        location = data.get("location", {})
-        current = data.get("current", {})
-        condition = current.get("condition", {})
+        results = {}
+        for item in response.json().get("bulk", []):
+            query = item.get("query", {})
+            index = int(query.get("custom_id", -1))
+            if 0 <= index < len(cities) and "error" not in query:
+                results[cities[index]] = WeatherObservation.parse(query, cities[index], name=cities[index])
+        return results
         
-        weather_data = {
-            "city": location.get("name", mapped_city),
-            "region": location.get("region", ""),
-            "country": location.get("country", ""),
-            "temperature_c": current.get("temp_c", 0),
-            "temperature_f": current.get("temp_f", 0),
-            "feels_like_c": current.get("feelslike_c", 0),
-            "feels_like_f": current.get("feelslike_f", 0),
-            "condition": condition.get("text", ""),
-            "humidity": current.get("humidity", 0),
-            "wind_kph": current.get("wind_kph", 0),
-            "wind_mph": current.get("wind_mph", 0),
-            "wind_dir": current.get("wind_dir", ""),
-            "pressure_mb": current.get("pressure_mb", 0),
-            "precip_mm": current.get("precip_mm", 0),
-            "uv_index": current.get("uv", 0),
-            "visibility_km": current.get("vis_km", 0),
-            "last_updated": current.get("last_updated", ""),
-        }
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching bulk weather for {len(cities)} cities: {e}")
+        return {}
+    except Exception as e:
+        print(f"Error processing bulk weather data: {e}")
+        return {}
+
+def _error_code(response: requests.Response) -> Optional[int]:
+    # WeatherAPI errors carry {"error": {"code": ..., "message": ...}}
+    try:
+        return response.json().get("error", {}).get("code")
+    except (ValueError, AttributeError):
+        return None
+
+def _fetch_each_upstream(cities: List[str], timeout: float) -> Dict[str, Optional[WeatherObservation]]:
+    # Fallback without bulk queries: one concurrent /forecast.json per city
+    with ThreadPoolExecutor(max_workers=max(1, min(WEATHER_SWEEP_CONCURRENCY, len(cities))),
+                            thread_name_prefix="kisaan-weather-batch") as executor:
+        return dict(zip(cities, executor.map(lambda city: _fetch_observation_upstream(city, timeout), cities)))
+
+def _load_batch(cities: List[str], timeout: float) -> Dict[str, Optional[WeatherObservation]]:
+    # Cache loader for fetch_observation_batch: misses in bulk chunks, chunks concurrently
+    if not _bulk_supported:
+        return _fetch_each_upstream(cities, timeout)
+    chunks = [cities[i:i + WEATHER_BULK_SIZE] for i in range(0, len(cities), WEATHER_BULK_SIZE)]
+    if len(chunks) == 1:
+        return _fetch_bulk_upstream(chunks[0], timeout)
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="kisaan-weather-bulk") as executor:
+        for chunk_results in executor.map(lambda chunk: _fetch_bulk_upstream(chunk, timeout), chunks):
+            results.update(chunk_results)
+    return results
+
+def fetch_observation_batch(cities: List[str], timeout: float = WEATHER_TIMEOUT) -> Dict[str, Optional[WeatherObservation]]:
+    """
+    Look up many cities at once through the shared observation cache.
+    
+    Cached cities are answered from memory; all the misses are fetched
+    together with WeatherAPI bulk queries (WEATHER_BULK_SIZE cities per
+    request, requests in parallel), falling back to one request per city
+    if the plan has no bulk queries.
+    
+    Args:
+        cities: City names in Urdu or English
+        timeout: Deadline in seconds for the upstream fetch (and for waiting
+            on other callers' in-flight fetches of the same cities)
         
-        # Add air quality if available
-        if "air_quality" in current:
-            aq = current["air_quality"]
-            weather_data["air_quality"] = {
-                "us_epa_index": aq.get("us-epa-index", 0),
-                "pm2_5": aq.get("pm2_5", 0),
-                "pm10": aq.get("pm10", 0),
-            }
+    Returns:
+        Dictionary of requested city -> WeatherObservation or None, in request order
+    """
+    if not WEATHER_API_KEY or not cities:
+        return {city: None for city in cities}
+    
+    mapped = {city: normalize_city(city) for city in cities}
+    observations = observation_cache.get_many(
+        list(mapped.values()),
+        lambda keys: _load_batch(keys, timeout),
+        wait_timeout=timeout,
+    )
+    return {city: observations.get(mapped_city) for city, mapped_city in mapped.items()}
+
+# Columns of the batch endpoint, in response order
+BATCH_FIELDS = {
+    "city": lambda o: o.city,
+    "region": lambda o: o.region,
+    "temperature_c": lambda o: o.temperature_c,
+    "feels_like_c": lambda o: o.feels_like_c,
+    "condition": lambda o: o.condition,
+    "humidity": lambda o: o.humidity,
+    "wind_kph": lambda o: o.wind_kph,
+    "wind_dir": lambda o: o.wind_dir,
+    "precip_mm": lambda o: o.precip_mm,
+    "uv_index": lambda o: o.uv_index,
+    "us_epa_index": lambda o: o.us_epa_index,
+    "today_max_c": lambda o: o.today.max_temp_c if o.today else None,
+    "today_min_c": lambda o: o.today.min_temp_c if o.today else None,
+    "tomorrow_max_c": lambda o: o.tomorrow.max_temp_c if o.tomorrow else None,
+    "tomorrow_min_c": lambda o: o.tomorrow.min_temp_c if o.tomorrow else None,
+    "tomorrow_condition": lambda o: o.tomorrow.condition if o.tomorrow else None,
+    "alerts": lambda o: len(o.alerts),
+    "last_updated": lambda o: o.last_updated,
+}
+
+def observations_to_columns(observations: Dict[str, Optional[WeatherObservation]]) -> Dict:
+    """
+    Columnar layout for many cities: one array per field, one slot per
+    requested city (null where the city could not be fetched). Field names
+    appear once instead of once per city.
+    
+    Args:
+        observations: Result of fetch_observation_batch
         
-        # Get forecast for today and tomorrow
-        try:
-            forecast_url = f"{WEATHER_API_BASE}/forecast.json"
-            forecast_params = {
-                "key": WEATHER_API_KEY,
-                "q": mapped_city,
-                "days": 2,
-            }
-            
-            forecast_response = requests.get(forecast_url, params=forecast_params, timeout=10)
-            forecast_response.raise_for_status()
-            forecast_data = forecast_response.json()
-            
-            forecast = forecast_data.get("forecast", {}).get("forecastday", [])
-            if forecast and len(forecast) > 0:
-                today = forecast[0].get("day", {})
-                weather_data["today"] = {
-                    "max_temp_c": today.get("maxtemp_c", 0),
-                    "min_temp_c": today.get("mintemp_c", 0),
-                    "max_temp_f": today.get("maxtemp_f", 0),
-                    "min_temp_f": today.get("mintemp_f", 0),
-                    "condition": today.get("condition", {}).get("text", ""),
-                    "maxwind_kph": today.get("maxwind_kph", 0),
-                    "totalprecip_mm": today.get("totalprecip_mm", 0),
-                }
-            
-            if forecast and len(forecast) > 1:
-                tomorrow = forecast[1].get("day", {})
-                weather_data["tomorrow"] = {
-                    "max_temp_c": tomorrow.get("maxtemp_c", 0),
-                    "min_temp_c": tomorrow.get("mintemp_c", 0),
-                    "max_temp_f": tomorrow.get("maxtemp_f", 0),
-                    "min_temp_f": tomorrow.get("mintemp_f", 0),
-                    "condition": tomorrow.get("condition", {}).get("text", ""),
-                    "maxwind_kph": tomorrow.get("maxwind_kph", 0),
-                    "totalprecip_mm": tomorrow.get("totalprecip_mm", 0),
-                }
-        except:
-            pass  # Forecast not critical
+    Returns:
+        {"count", "query", "found", "columns": {field: [...]}}
+    """
+    values = list(observations.values())
+    return {
+        "count": len(values),
+        "query": list(observations.keys()),
+        "found": sum(1 for o in values if o is not None),
+        "columns": {
+            field: [get(o) if o is not None else None for o in values]
+            for field, get in BATCH_FIELDS.items()
+        },
+    }
+
+def get_current_weather(city: str) -> Optional[Dict]:
+    """
+    Get current weather data for a specific city.
+    
+    Args:
+        city: City name (e.g., "Multan", "Lahore", "Karachi")
         
-        return weather_data
+    Returns:
+        Dictionary with weather data or None if error
+    """
+    observation = fetch_observation(city)
+    return observation.to_dict() if observation else None
+
+def alerts_for_observation(observation: WeatherObservation, region: str) -> List[Dict]:
+    """
+    Turn one observation into alert dictionaries for update_weather_alerts_in_db.
+    
+    Thresholds and messages come from the weather_alert_rules table (see
+    alert_rules.py); sweeps evaluate all their cities in one batch instead.
+    
+    Args:
+        observation: Parsed weather for one city
+        region: Region label stored on the alerts
         
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching weather for {city}: {e}")
-        return None
-    except Exception as e:
-        print(f"Error processing weather data for {city}: {e}")
-        return None
+    Returns:
+        List of weather alert dictionaries
+    """
+    return alert_rules.evaluate([(region, observation)])
 
-def fetch_weather_alerts_from_api(region: Optional[str] = None) -> List[Dict]:
+def fetch_weather_alerts_from_api(region: Optional[str] = None, cities: Optional[List[str]] = None,
+                                  deadline: float = WEATHER_SWEEP_DEADLINE) -> List[Dict]:
     """
     Fetch weather alerts from WeatherAPI.com.
     
+    All cities are fetched concurrently (see fetch_observations), one
+    /forecast.json request each. If the deadline passes, alerts for the
+    cities that did finish are returned.
+    
     Args:
         region: City/region name (e.g., "Lahore", "Karachi", "Islamabad")
+        cities: Cities to sweep when no region is given (default: ALERT_CITIES)
+        deadline: Budget in seconds for the whole sweep
         
     Returns:
         List of weather alert dictionaries
@@ -168,231 +505,64 @@ def fetch_weather_alerts_from_api(region: Optional[str] = None) -> List[Dict]:
         print("⚠ Warning: WEATHER_API_KEY not set. Cannot fetch weather data.")
         return []
     
-    alerts = []
-    
-    # Map regions to city names for WeatherAPI
-    region_to_city = {
-        "Punjab": "Lahore",
-        "Sindh": "Karachi",
-        "KPK": "Peshawar",
-        "Balochistan": "Quetta",
-        "Lahore": "Lahore",
-        "Karachi": "Karachi",
-        "Islamabad": "Islamabad",
-        "Peshawar": "Peshawar",
-        "Quetta": "Quetta",
-        "Multan": "Multan",
-        "Faisalabad": "Faisalabad",
-    }
-    
     # Default cities if no region specified
-    cities_to_check = []
     if region:
-        city = region_to_city.get(region, region)
-        cities_to_check = [city]
+        cities_to_check = [region]
     else:
-        # Check major Pakistani cities
-        cities_to_check = ["Lahore", "Karachi", "Islamabad", "Peshawar", "Multan", "Faisalabad"]
-    
-    for city in cities_to_check:
-        try:
-            # Get current weather
-            url = f"{WEATHER_API_BASE}/current.json"
-            params = {
-                "key": WEATHER_API_KEY,
-                "q": city,
-                "aqi": "yes"
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            current = data.get("current", {})
-            location = data.get("location", {})
-            
-            temp_c = current.get("temp_c", 0)
-            condition = current.get("condition", {}).get("text", "").lower()
-            wind_kph = current.get("wind_kph", 0)
-            humidity = current.get("humidity", 0)
-            aqi = current.get("air_quality", {}).get("us-epa-index", 0) if "air_quality" in current else 0
-            
-            # Check for extreme conditions and create alerts
-            if temp_c > 40:
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'heatwave',
-                    'severity': 'high',
-                    'message_en': f'Extreme heat warning in {city}: Temperature is {temp_c}°C. Take precautions for crops.',
-                    'message_ur': f'{city} میں شدید گرمی کی وارننگ: درجہ حرارت {temp_c}°C ہے۔ فصلوں کے لیے احتیاطی تدابیر اختیار کریں۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            elif temp_c < 5:
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'cold_wave',
-                    'severity': 'high',
-                    'message_en': f'Cold wave warning in {city}: Temperature is {temp_c}°C. Protect sensitive crops.',
-                    'message_ur': f'{city} میں سردی کی لہر کی وارننگ: درجہ حرارت {temp_c}°C ہے۔ حساس فصلوں کی حفاظت کریں۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            
-            if 'rain' in condition or 'storm' in condition or 'thunder' in condition:
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'heavy_rain',
-                    'severity': 'medium',
-                    'message_en': f'Rain/Storm alert in {city}: {condition.title()} conditions expected.',
-                    'message_ur': f'{city} میں بارش/طوفان کی الرٹ: {condition.title()} حالات متوقع ہیں۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            
-            if wind_kph > 30:
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'strong_wind',
-                    'severity': 'medium',
-                    'message_en': f'Strong wind warning in {city}: Wind speed is {wind_kph} km/h.',
-                    'message_ur': f'{city} میں تیز ہوا کی وارننگ: ہوا کی رفتار {wind_kph} کلومیٹر/گھنٹہ ہے۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            
-            if humidity > 80:
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'high_humidity',
-                    'severity': 'medium',
-                    'message_en': f'High humidity in {city}: {humidity}%. May increase disease risk in crops.',
-                    'message_ur': f'{city} میں زیادہ نمی: {humidity}%۔ فصلوں میں بیماری کا خطرہ بڑھ سکتا ہے۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            
-            if aqi >= 4:  # Unhealthy air quality
-                alerts.append({
-                    'region': region or city,
-                    'alert_type': 'air_quality',
-                    'severity': 'medium',
-                    'message_en': f'Poor air quality in {city}. May affect crop health.',
-                    'message_ur': f'{city} میں ہوا کی ناقص معیار۔ فصلوں کی صحت متاثر ہو سکتی ہے۔',
-                    'valid_until': (datetime.now() + timedelta(days=1)).isoformat()
-                })
-            
-            # Get forecast for tomorrow
-            try:
-                forecast_url = f"{WEATHER_API_BASE}/forecast.json"
-                forecast_params = {
-                    "key": WEATHER_API_KEY,
-                    "q": city,
-                    "days": 3,
-                    "alerts": "yes"
-                }
-                
-                forecast_response = requests.get(forecast_url, params=forecast_params, timeout=10)
-                forecast_response.raise_for_status()
-                forecast_data = forecast_response.json()
-                
-                # Check for alerts from API
-                if "alerts" in forecast_data and "alert" in forecast_data["alerts"]:
-                    for alert in forecast_data["alerts"]["alert"]:
-                        alerts.append({
-                            'region': region or city,
-                            'alert_type': alert.get("event", "weather_alert"),
-                            'severity': 'high' if alert.get("severity") == "Extreme" else 'medium',
-                            'message_en': alert.get("headline", alert.get("desc", "Weather alert")),
-                            'message_ur': alert.get("desc", "موسم کی الرٹ"),
-                            'valid_until': alert.get("expires", (datetime.now() + timedelta(days=1)).isoformat())
-                        })
-                
-                # Check forecast for extreme conditions
-                forecast = forecast_data.get("forecast", {}).get("forecastday", [])
-                if forecast:
-                    tomorrow = forecast[0].get("day", {})
-                    max_temp = tomorrow.get("maxtemp_c", 0)
-                    min_temp = tomorrow.get("mintemp_c", 0)
-                    maxwind = tomorrow.get("maxwind_kph", 0)
-                    
-                    if max_temp > 42:
-                        alerts.append({
-                            'region': region or city,
-                            'alert_type': 'heatwave',
-                            'severity': 'high',
-                            'message_en': f'Tomorrow: Extreme heat expected in {city} ({max_temp}°C).',
-                            'message_ur': f'کل: {city} میں شدید گرمی متوقع ({max_temp}°C)۔',
-                            'valid_until': (datetime.now() + timedelta(days=2)).isoformat()
-                        })
-                    
-                    if maxwind > 40:
-                        alerts.append({
-                            'region': region or city,
-                            'alert_type': 'strong_wind',
-                            'severity': 'medium',
-                            'message_en': f'Tomorrow: Strong winds expected in {city} ({maxwind} km/h).',
-                            'message_ur': f'کل: {city} میں تیز ہواؤں کی توقع ({maxwind} کلومیٹر/گھنٹہ)۔',
-                            'valid_until': (datetime.now() + timedelta(days=2)).isoformat()
-                        })
-                        
-            except Exception as e:
-                print(f"Error fetching forecast for {city}: {e}")
-                # Continue without forecast
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching weather for {city}: {e}")
-            continue
-        except Exception as e:
-            print(f"Error processing weather data for {city}: {e}")
-            continue
+        cities_to_check = cities or ALERT_CITIES
     
-    return alerts
+    # Every city's observation goes through the alert rules in one batch
+    observations = fetch_observations(cities_to_check, deadline)
+    return alert_rules.evaluate([(region or city, observation) for city, observation in observations.items()])
 
 
-def update_weather_alerts_in_db(alerts: List[Dict]):
+# At most one alert per (region, alert_type, hour); matches idx_weather_alerts_dedup
+_INSERT_ALERT_SQL = '''
+    INSERT INTO weather_alerts
+    (region, alert_type, severity, message_ur, message_en, valid_until, created_at, crops)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (region, alert_type, dedup_window) DO NOTHING
+'''
+
+def update_weather_alerts_in_db(alerts: List[Dict]) -> Dict[str, int]:
     """
     Update weather alerts in database.
     
+    Writes the whole batch in one transaction. The unique dedup-window key
+    drops an alert if the same region/type was already stored this hour,
+    so there is no per-alert lookup.
+    
     Args:
         alerts: List of weather alert dictionaries
+        
+    Returns:
+        Dictionary with inserted and skipped counts
     """
     if not alerts:
-        return
+        return {"inserted": 0, "skipped": 0}
     
-    import sqlite3
+    import db
     
-    DATABASE = "kisaan_academy.db"
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    for alert in alerts:
-        # Check if similar alert already exists (avoid duplicates)
-        cursor.execute('''
-            SELECT id FROM weather_alerts 
-            WHERE region = ? AND alert_type = ? AND created_at > datetime('now', '-1 hour')
-            ORDER BY created_at DESC LIMIT 1
-        ''', (
+    now = db.utc_timestamp()
+    rows = [
+        (
             alert.get('region'),
-            alert.get('alert_type')
-        ))
-        
-        existing = cursor.fetchone()
-        
-        if not existing:
-            # Insert new alert
-            cursor.execute('''
-                INSERT INTO weather_alerts 
-                (region, alert_type, severity, message_ur, message_en, valid_until, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                alert.get('region'),
-                alert.get('alert_type'),
-                alert.get('severity', 'medium'),
-                alert.get('message_ur', ''),
-                alert.get('message_en', ''),
-                alert.get('valid_until'),
-                datetime.now().isoformat()
-            ))
+            alert.get('alert_type'),
+            alert.get('severity', 'medium'),
+            alert.get('message_ur', ''),
+            alert.get('message_en', ''),
+            db.utc_timestamp(alert['valid_until']) if alert.get('valid_until') else None,
+            now,
+            ",".join(alert['crops']) if alert.get('crops') else None
+        )
+        for alert in alerts
+    ]
+    
+    with db.writer() as conn:
+        inserted = conn.executemany(_INSERT_ALERT_SQL, rows).rowcount
     
-    conn.commit()
-    conn.close()
-    print(f"✓ Updated {len(alerts)} weather alerts in database")
+    print(f"✓ Updated weather alerts in database: {inserted} new, {len(rows) - inserted} already current")
+    return {"inserted": inserted, "skipped": len(rows) - inserted}
 
 
 # Test function
@@ -0,0 +1,150 @@
+"""
+Write-Behind Buffer
+Batches fire-and-forget inserts off the request path
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Sequence
+
+import db
+
+
+class WriteBehindBuffer:
+    """
+    Queue rows in memory and insert them in batches from a background thread.
+
+    A batch is written with one executemany in a single writer transaction
+    when max_batch rows are pending or the oldest row has waited
+    flush_interval seconds, whichever comes first. close() drains whatever
+    is left, so a clean shutdown loses nothing; a crash can lose at most one
+    flush interval of rows.
+    """
+
+    def __init__(self, name: str, sql: str, max_batch: int = 100, flush_interval: float = 0.5):
+        self.name = name
+        self.sql = sql
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            "enqueued": 0,
+            "flushed_rows": 0,
+            "flushes": 0,
+            "failed_rows": 0,
+            "max_depth": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0,
+        }
+
+    def add(self, row: Sequence):
+        """Queue one row for insertion; never blocks on the database."""
+        with self._cond:
+            # While closing, rows are left for close()'s final drain
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=f"kisaan-{self.name}-writer", daemon=True)
+                self._thread.start()
+            self._pending.append((time.monotonic(), tuple(row)))
+            self._stats["enqueued"] += 1
+            self._stats["max_depth"] = max(self._stats["max_depth"], len(self._pending))
+            # The first row starts the flusher's interval timer; a full batch goes at once
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def _take_batch(self):
+        # Caller holds self._cond
+        count = min(len(self._pending), self.max_batch)
+        return [self._pending.popleft()[1] for _ in range(count)]
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        failed = 0
+        try:
+            with db.writer() as conn:
+                conn.executemany(self.sql, rows)
+        except Exception as e:
+            # Fall back to row-by-row so one bad row cannot sink the batch
+            print(f"⚠ {self.name} batch insert failed ({e}); retrying rows individually")
+            for row in rows:
+                try:
+                    with db.writer() as conn:
+                        conn.execute(self.sql, row)
+                except Exception as row_error:
+                    failed += 1
+                    print(f"✗ Dropped {self.name} row: {row_error}")
+        with self._cond:
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(rows) - failed
+            self._stats["failed_rows"] += failed
+            self._stats["last_flush_rows"] = len(rows)
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.max_batch:
+                        break
+                    if self._pending:
+                        wait = self._pending[0][0] + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._closed and not self._pending:
+                    return
+                rows = self._take_batch()
+            if rows:
+                self._write(rows)
+
+    def flush(self):
+        """Write everything pending now, on the calling thread."""
+        while True:
+            with self._cond:
+                rows = self._take_batch()
+            if not rows:
+                return
+            self._write(rows)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Drain the queue and stop the flusher thread.
+
+        Afterwards the buffer can be used again (the next add() starts a new
+        flusher), which keeps it safe across repeated app lifespans in one
+        process. If the flusher is still writing after `timeout`, the buffer
+        stays closed: that thread keeps draining the queue and exits when it
+        is empty, and no second flusher is started next to it.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                print(f"⚠ {self.name} flusher still writing after {timeout:g}s; "
+                      f"{self.stats()['depth']} rows left to it")
+                return
+        # Rows added after the flusher exited are written here
+        self.flush()
+        with self._cond:
+            self._thread = None
+            self._closed = False
+
+    def stats(self) -> Dict:
+        """Queue depth and flush counters for /api/stats."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["depth"] = len(self._pending)
+            snapshot["oldest_pending_ms"] = (
+                round((time.monotonic() - self._pending[0][0]) * 1000, 3) if self._pending else 0.0
+            )
+        snapshot["max_batch"] = self.max_batch
+        snapshot["flush_interval_ms"] = self.flush_interval * 1000
+        return snapshot
@@ -3,17 +3,48 @@ import { FiBook, FiSearch } from 'react-icons/fi';
 import { apiService } from '../services/api';
 import './SustainableWiki.css';
 
+// Most results /api/search returns in one call (its cap); the default is 20
+const WIKI_SEARCH_LIMIT = 100;
+
 const SustainableWiki = ({ language }) => {
   const [articles, setArticles] = useState([]);
   const [selectedArticle, setSelectedArticle] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterCategory, setFilterCategory] = useState('all');
   const [loading, setLoading] = useState(true);
+  const [searchIds, setSearchIds] = useState(null);
 
   useEffect(() => {
     fetchArticles();
   }, [language, filterCategory]);
 
+  // Ranked server-side search (debounced); falls back to local filtering on error.
+  // A reply for an older search term is ignored once the term has changed.
+  useEffect(() => {
+    if (!searchTerm.trim()) {
+      setSearchIds(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await apiService.search(searchTerm, language, 'wiki', WIKI_SEARCH_LIMIT);
+        if (!cancelled) {
+          setSearchIds(response.data.map((result) => result.id));
+        }
+      } catch (error) {
+        console.error('Error searching articles:', error);
+        if (!cancelled) {
+          setSearchIds(null);
+        }
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchTerm, language]);
+
   const fetchArticles = async () => {
     try {
       const category = filterCategory === 'all' ? null : filterCategory;
@@ -31,7 +62,11 @@ const SustainableWiki = ({ language }) => {
     index === self.findIndex((a) => a.id === article.id)
   );
 
-  const filteredArticles = searchTerm
+  const filteredArticles = searchIds
+    ? searchIds
+        .map((id) => uniqueArticles.find((article) => article.id === id))
+        .filter(Boolean)
+    : searchTerm
     ? uniqueArticles.filter(article =>
         article.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
         article.content.toLowerCase().includes(searchTerm.toLowerCase())
@@ -57,6 +57,16 @@ export const apiService = {
   getWikiArticle: (id, language = 'ur') => 
     api.get(`/api/wiki/${id}?language=${language}`),
 
+  // Search
+  search: (query, language = 'ur', type = null, limit = null) => {
+    const params = new URLSearchParams();
+    params.append('q', query);
+    params.append('language', language);
+    if (type) params.append('type', type);
+    if (limit) params.append('limit', limit);
+    return api.get(`/api/search?${params.toString()}`);
+  },
+
   // Chat
   sendChatMessage: (message, userId = null, language = 'ur') => 
     api.post('/api/chat', {